@@ -5,6 +5,8 @@ from dashboard.dahsboard_settings import DashboardSettings
 from projector.plot_settings import PlotSettings
 from projector.projector_settings import ProjectorSettings
 from projector.projection_methods.projection_methods_enum import ProjectionMethodEnum
+from process_management.process_settings import ProcessResourceSettings, SupervisorSettings
+from process_management.processing_utils import RUNTIME_MODE_MULTIPROCESS, RUNTIME_MODES
 from utils.streaming.stream_settings import *
 
 
@@ -31,7 +33,13 @@ class ConfigurationResolver:
         stream_config_section = self._config.get('stream-settings')
 
         stream_settings = StreamSettings()
-        stream_settings.feature_stream_name = stream_config_section.get("feature-stream-name")
+        feature_stream_names = stream_config_section.get("feature-stream-name")
+        if isinstance(feature_stream_names, list):
+            stream_settings.feature_stream_name = feature_stream_names[0]
+            stream_settings.additional_feature_stream_names = feature_stream_names[1:]
+        else:
+            stream_settings.feature_stream_name = feature_stream_names
+        stream_settings.feature_alignment_tolerance_ms = stream_config_section.get("feature-alignment-tolerance-ms", stream_settings.feature_alignment_tolerance_ms)
         stream_settings.auxiliary_stream_name = stream_config_section.get("auxiliary-stream-name")
         stream_settings.stream_buffer_size_s = stream_config_section.get("stream-buffer-size-s")
         stream_settings.feature_section = stream_config_section.get("feature-section")
@@ -42,22 +50,41 @@ class ConfigurationResolver:
         stream_settings.match_by_entry_id = stream_config_section.get("match-by-sample-id")
         stream_settings.label_feature_matching_scheme = stream_config_section.get("label-feature-matching-scheme")
         stream_settings.auxiliary_stream_drift_ms = stream_config_section.get("auxiliary-stream-drift-ms")
-
-        feature_stream_layout = StreamLayout()
-        feature_stream_layout_config_section = stream_config_section.get("feature-stream-layout")
-        feature_stream_layout.id_index = feature_stream_layout_config_section.get("id-index")
-        feature_stream_layout.sections = self._get_stream_sections_from_config(feature_stream_layout_config_section)
-
-        auxiliary_stream_layout = StreamLayout()
-        auxiliary_stream_layout_config_section = stream_config_section.get("auxiliary-stream-layout")
-        auxiliary_stream_layout.id_index = auxiliary_stream_layout_config_section.get("id-index")
-        auxiliary_stream_layout.sections = self._get_stream_sections_from_config(auxiliary_stream_layout_config_section)
+        stream_settings.estimate_clock_offset = stream_config_section.get("estimate-clock-offset", stream_settings.estimate_clock_offset)
+        stream_settings.clock_offset_half_life_s = stream_config_section.get("clock-offset-half-life-s", stream_settings.clock_offset_half_life_s)
+        stream_settings.time_correction_interval_s = stream_config_section.get("time-correction-interval-s", stream_settings.time_correction_interval_s)
+        stream_settings.source = stream_config_section.get("source", stream_settings.source)
+        stream_settings.preprocessing_steps = stream_config_section.get("preprocessing", [])
+        stream_settings.replay_path = stream_config_section.get("replay-path", stream_settings.replay_path)
+        stream_settings.replay_auxiliary_path = stream_config_section.get("replay-auxiliary-path", stream_settings.replay_auxiliary_path)
+        stream_settings.replay_speed = stream_config_section.get("replay-speed", stream_settings.replay_speed)
+        stream_settings.replay_chunk_size = stream_config_section.get("replay-chunk-size", stream_settings.replay_chunk_size)
+        stream_settings.recording_path = stream_config_section.get("recording-path", stream_settings.recording_path)
+        stream_settings.recording_queue_size = stream_config_section.get("recording-queue-size", stream_settings.recording_queue_size)
+        stream_settings.recording_chunk_size = stream_config_section.get("recording-chunk-size", stream_settings.recording_chunk_size)
+        stream_settings.recording_flush_interval_s = stream_config_section.get("recording-flush-interval-s", stream_settings.recording_flush_interval_s)
+
+        feature_stream_layout = self._get_stream_layout_from_config(stream_config_section.get("feature-stream-layout"))
+        auxiliary_stream_layout = self._get_stream_layout_from_config(stream_config_section.get("auxiliary-stream-layout"))
+
+        additional_feature_stream_layouts_config_section = stream_config_section.get("feature-stream-layouts", {})
+        stream_settings.additional_feature_stream_layouts = {
+            stream_name: self._get_stream_layout_from_config(layout_config_section)
+            for stream_name, layout_config_section in additional_feature_stream_layouts_config_section.items()
+        }
 
         stream_settings.feature_stream_layout = feature_stream_layout
         stream_settings.auxiliary_stream_layout = auxiliary_stream_layout
         return stream_settings
     
 
+    def _get_stream_layout_from_config(self, stream_layout_config_section) -> StreamLayout:
+        stream_layout = StreamLayout()
+        stream_layout.id_index = stream_layout_config_section.get("id-index")
+        stream_layout.sections = self._get_stream_sections_from_config(stream_layout_config_section)
+        return stream_layout
+
+
     def _get_stream_sections_from_config(self, stream_layout_config_section) -> dict[str,StreamSection]:
         stream_sections = {}
         stream_layout_config_subsections = self._get_subsections(stream_layout_config_section.get("section"))
@@ -85,7 +112,17 @@ class ConfigurationResolver:
         projector_settings.min_training_samples_to_start_projecting = projector_config_section.get('min-training-samples-to-start-projecting')
         projector_settings.stream_buffer_size_s = projector_config_section.get('stream-buffer-size-s')
         projector_settings.sampling_frequency = projector_config_section.get('max-sampling-frequency')
+        projector_settings.adaptive_sampling = projector_config_section.get('adaptive-sampling', projector_settings.adaptive_sampling)
+        projector_settings.min_sampling_frequency = projector_config_section.get('min-sampling-frequency', projector_settings.min_sampling_frequency)
+        projector_settings.target_batch_size = projector_config_section.get('target-batch-size', projector_settings.target_batch_size)
+        projector_settings.target_read_latency_s = projector_config_section.get('target-read-latency-s', projector_settings.target_read_latency_s)
         projector_settings.model_update_frequency = projector_config_section.get('max-model-update-frequency')
+        projector_settings.training_preemption_policy = projector_config_section.get('training-preemption-policy', projector_settings.training_preemption_policy)
+        projector_settings.adaptive_model_update = projector_config_section.get('adaptive-model-update', projector_settings.adaptive_model_update)
+        projector_settings.min_model_update_frequency = projector_config_section.get('min-model-update-frequency', projector_settings.min_model_update_frequency)
+        projector_settings.training_cpu_duty_cycle = projector_config_section.get('training-cpu-duty-cycle', projector_settings.training_cpu_duty_cycle)
+        projector_settings.checkpoint_path = projector_config_section.get('checkpoint-path', projector_settings.checkpoint_path)
+        projector_settings.restore_checkpoint_on_launch = projector_config_section.get('restore-checkpoint-on-launch', projector_settings.restore_checkpoint_on_launch)
 
         labels = self._config.get('labels')
         projector_settings.labels_map = {str_label: int_label for int_label, str_label in enumerate(labels)}
@@ -129,6 +166,11 @@ class ConfigurationResolver:
 
         plot_settings.show_axis = plot_config_section.get('show-axis')
         plot_settings.transition_duration = plot_config_section.get('transition-duration')
+        plot_settings.render_mode = plot_config_section.get('render-mode', plot_settings.render_mode)
+        plot_settings.density_rendering = plot_config_section.get('density-rendering', plot_settings.density_rendering)
+        plot_settings.density_bins = plot_config_section.get('density-bins', plot_settings.density_bins)
+        plot_settings.level_of_detail = plot_config_section.get('level-of-detail', plot_settings.level_of_detail)
+        plot_settings.viewport_point_budget = plot_config_section.get('viewport-point-budget', plot_settings.viewport_point_budget)
 
         default_x_range_config_section = plot_config_section.get('default-x-range')
         if default_x_range_config_section is None:
@@ -158,6 +200,40 @@ class ConfigurationResolver:
         return dashboar_settings
     
 
+    def get_runtime_mode_from_config(self) -> str:
+        runtime_mode = self._config.get('runtime-mode', RUNTIME_MODE_MULTIPROCESS)
+        if runtime_mode not in RUNTIME_MODES:
+            raise Exception(f"Configuration exception: unknown runtime mode '{runtime_mode}'. Supported modes: {RUNTIME_MODES}")
+        return runtime_mode
+
+
+    def get_process_resource_settings_from_config(self) -> dict[str, ProcessResourceSettings]:
+        process_config_section = self._config.get('process-settings')
+        if process_config_section is None:
+            return {}
+
+        process_resource_settings = {}
+        for process_name, config_subsection in self._get_subsections(process_config_section).items():
+            resource_settings = ProcessResourceSettings()
+            resource_settings.cpu_affinity = config_subsection.get('cpu-affinity')
+            resource_settings.num_threads = config_subsection.get('num-threads')
+            process_resource_settings[process_name] = resource_settings
+        return process_resource_settings
+
+
+    def get_supervisor_settings_from_config(self) -> SupervisorSettings:
+        supervisor_settings = SupervisorSettings()
+        supervisor_config_section = self._config.get('supervisor-settings')
+        if supervisor_config_section is None:
+            return supervisor_settings
+
+        supervisor_settings.enabled = supervisor_config_section.get('enabled', supervisor_settings.enabled)
+        supervisor_settings.poll_interval_s = supervisor_config_section.get('poll-interval-s', supervisor_settings.poll_interval_s)
+        supervisor_settings.max_restarts = supervisor_config_section.get('max-restarts', supervisor_settings.max_restarts)
+        supervisor_settings.restart_window_s = supervisor_config_section.get('restart-window-s', supervisor_settings.restart_window_s)
+        return supervisor_settings
+
+
     def _get_subsections(self, section, subsection_identifier = None):
         if subsection_identifier is None:
             return {k: v for k, v in section.items()}
@@ -3,7 +3,7 @@ import multiprocessing
 import logging
 import time
 from dash import Dash, html, dcc, no_update
-from dash_extensions.enrich import Output, DashProxy, Input, MultiplexerTransform, callback_context as ctx
+from dash_extensions.enrich import Output, DashProxy, Input, State, MultiplexerTransform, callback_context as ctx
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 
@@ -18,7 +18,7 @@ from utils.logging import logger
 
 
 _self = None
-_plot_figure : go.Figure = no_update
+_plot_figure : dict = no_update
 _projector : Projector = None
 _plot_manager : ProjectorPlotManager = None
 _model_iteration_plotted : str = 0
@@ -86,6 +86,56 @@ class Dashboard():
     )
 
 
+    # Applies the plot updates of the server callbacks in the browser. Callbacks may overlap, e.g. an interval refresh and a selection, and compute their updates from the same plot version.
+    # Patch operations are therefore only applied to the version they were computed from, the plot state store only changes with the figure, and a skipped update is caught up on by the next refresh.
+    app.clientside_callback(
+        """
+        function(update, figure, state) {
+            var no_update = window.dash_clientside.no_update;
+            if (!update) {
+                return [no_update, no_update];
+            }
+            var version = state ? state.version : null;
+            var refreshed_figure;
+            if (update.figure) {
+                // a figure of an older version than the client's is outdated
+                if (version !== null && version !== undefined && update.state.version < version) {
+                    return [no_update, no_update];
+                }
+                refreshed_figure = update.figure;
+            } else {
+                if (update['from-version'] !== version || !figure || !figure.data) {
+                    return [no_update, no_update];
+                }
+                if (update.operations.length === 0) {
+                    return [no_update, update.state];
+                }
+                refreshed_figure = Object.assign({}, figure, {data: figure.data.slice()});
+                update.operations.forEach(function(operation) {
+                    var trace_index = operation[0], keys = operation[1].split('.'), values = operation[3];
+                    var parent = Object.assign({}, refreshed_figure.data[trace_index]);
+                    refreshed_figure.data[trace_index] = parent;
+                    // nested plotly paths, e.g. marker.opacity, are copied one key at a time
+                    for (var i = 0; i < keys.length - 1; i++) {
+                        parent[keys[i]] = Object.assign({}, parent[keys[i]]);
+                        parent = parent[keys[i]];
+                    }
+                    var key = keys[keys.length - 1];
+                    parent[key] = operation[2] === 'extend' ? (parent[key] || []).concat(values) : values;
+                });
+            }
+            refreshed_figure.layout = Object.assign({}, refreshed_figure.layout, {transition: {duration: update['transition-duration']}});
+            return [refreshed_figure, update.state];
+        }
+        """,
+        [Output('model-plot', 'figure'),
+        Output('plot-state-store', 'data')],
+        Input('plot-update-store', 'data'),
+        State('model-plot', 'figure'),
+        State('plot-state-store', 'data'),
+    )
+
+
     @app.callback(
         Output('model-plot', 'figure'),
         Input('plot-size-hidden-div', 'children'),
@@ -104,11 +154,40 @@ class Dashboard():
 
 # ---------------------- app mode, pausing, and refreshing ----------------------
     @app.callback(
-        Output('model-plot', 'figure'),
+        Output('plot-update-store', 'data'),
         Input('refresh-graph-interval', 'n_intervals'),
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
+    )
+    def refresh_graph_interval(n_intervals, plot_state, viewport):
+        return _self._refresh_plot(plot_state, viewport)
+
+
+    # keeps the axis ranges of the client when zooming or panning, so the plot manager can send only the points in its view
+    @app.callback(
+        [Output('plot-viewport-store', 'data'),
+        Output('plot-update-store', 'data')],
+        Input('model-plot', 'relayoutData'),
+        State('plot-state-store', 'data'),
     )
-    def refresh_graph_interval(n_intervals):
-        return _self._refresh_plot()
+    def update_plot_viewport(relayout_data, plot_state):
+        if _plot_manager is None or relayout_data is None:
+            return no_update, no_update
+
+        if relayout_data.get('xaxis.autorange') or relayout_data.get('yaxis.autorange'):
+            viewport = None
+        elif 'xaxis.range[0]' in relayout_data and 'yaxis.range[0]' in relayout_data:
+            x_range = [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+            y_range = [relayout_data['yaxis.range[0]'], relayout_data['yaxis.range[1]']]
+            viewport = [x_range, y_range]
+        else:
+            return no_update, no_update
+
+        # a viewport figure only holds the points of the previous viewport, so it is not up to date even if its version is
+        plot_state = dict(plot_state or {})
+        if plot_state.get('viewport-figure-key') is not None:
+            plot_state['version'] = None
+        return viewport, _self._refresh_plot(plot_state, viewport)
     
 
     @app.callback(
@@ -220,10 +299,12 @@ class Dashboard():
     @app.callback(
         [Output('plot-new-model-button', 'disabled'),
         Output('plot-new-model-button', 'className'),
-        Output('model-plot', 'figure')],
+        Output('plot-update-store', 'data')],
         Input('plot-new-model-button', 'n_clicks'),
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
     )
-    def plot_new_model_iteration(n_clicks):
+    def plot_new_model_iteration(n_clicks, plot_state, viewport):
         global _model_iteration_plotted
         latest_iteration_count = _projector.get_update_count()
         logger.info(f"latest itteration: {latest_iteration_count}. Current itteration: {_model_iteration_plotted}")
@@ -232,7 +313,7 @@ class Dashboard():
         _model_iteration_plotted = latest_iteration_count
 
         logger.info("refreshign plot")
-        plot_update = _self._refresh_plot(model_ittr_update=True)
+        plot_update = _self._refresh_plot(plot_state, viewport, model_ittr_update=True)
         return True, "button-disabled", plot_update
 
 
@@ -246,10 +327,12 @@ class Dashboard():
         Output('selection-highlight-button', 'className'),
         Output('selection-dehighlight-button', 'disabled'),
         Output('selection-dehighlight-button', 'className'),
-        Output('model-plot', 'figure')],
+        Output('plot-update-store', 'data')],
         [Input('model-plot', 'clickData')],
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
     )
-    def select_data_point(click_data):
+    def select_data_point(click_data, plot_state, viewport):
         num_selected_points = _plot_manager.get_count_selected_points()
         if click_data is None:
             if num_selected_points > 1:
@@ -258,12 +341,15 @@ class Dashboard():
                 return num_selected_points, True, True, "button-disabled", True, "button-disabled", True, "button-disabled", no_update
 
         point = click_data['points'][0]
+        # the density heatmaps have no point ids
+        if point.get('id') is None:
+            return no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update
         point_id = point['id']
 
         if _plot_manager.is_selected_point(point_id):
             _plot_manager.deselect_point(point_id)
             
-            plot_update = _self._refresh_plot()
+            plot_update = _self._refresh_plot(plot_state, viewport)
             if num_selected_points <= 1:
                 return num_selected_points-1, True, True, "button-disabled", True, "button-disabled", True, "button-disabled", plot_update
             return num_selected_points-1, False, False, "button", False, "button", False, "button", plot_update
@@ -272,7 +358,7 @@ class Dashboard():
         y = point['y']
         _plot_manager.select_point(point_id, x, y)
 
-        plot_update = _self._refresh_plot()
+        plot_update = _self._refresh_plot(plot_state, viewport)
         return num_selected_points+1, False, False, "button", False, "button", False, "button", plot_update
     
 
@@ -285,20 +371,37 @@ class Dashboard():
         Output('selection-highlight-button', 'className'),
         Output('selection-dehighlight-button', 'disabled'),
         Output('selection-dehighlight-button', 'className'),
-        Output('model-plot', 'figure')],
+        Output('plot-update-store', 'data')],
         [Input('model-plot', 'selectedData')],
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
     )
-    def select_data_points(selected_data):
-        for point in selected_data['points']:
-            if 'id' not in point or point['id'] is None:
-                continue
-
-            point_id = point['id']
-            x = point['x']
-            y = point['y']
-            _plot_manager.select_point(point_id, x, y)
+    def select_data_points(selected_data, plot_state, viewport):
+        if selected_data is None:
+            return no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update
+
+        # box and lasso selections are resolved by the plot manager from the selected region
+        polygon = None
+        if 'lassoPoints' in selected_data:
+            polygon = list(zip(selected_data['lassoPoints']['x'], selected_data['lassoPoints']['y']))
+        elif 'range' in selected_data:
+            x_range = selected_data['range']['x']
+            y_range = selected_data['range']['y']
+            polygon = [(x_range[0], y_range[0]), (x_range[1], y_range[0]), (x_range[1], y_range[1]), (x_range[0], y_range[1])]
+
+        if polygon is not None:
+            _plot_manager.select_region(polygon)
+        else:
+            for point in selected_data['points']:
+                if 'id' not in point or point['id'] is None:
+                    continue
+
+                point_id = point['id']
+                x = point['x']
+                y = point['y']
+                _plot_manager.select_point(point_id, x, y)
         
-        plot_update = _self._refresh_plot()
+        plot_update = _self._refresh_plot(plot_state, viewport)
         num_selected_points = _plot_manager.get_count_selected_points()
         if num_selected_points > 1:
             return num_selected_points, False, False, "button", False, "button", False, "button", plot_update
@@ -314,12 +417,14 @@ class Dashboard():
         Output('selection-highlight-button', 'className'),
         Output('selection-dehighlight-button', 'disabled'),
         Output('selection-dehighlight-button', 'className'),
-        Output('model-plot', 'figure')],
+        Output('plot-update-store', 'data')],
         Input('point-selection-clear-button', 'n_clicks'),
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
     )
-    def clear_selected_datapoints(n_clicks):
+    def clear_selected_datapoints(n_clicks, plot_state, viewport):
         _plot_manager.deselect_all()
-        plot_update = _self._refresh_plot()
+        plot_update = _self._refresh_plot(plot_state, viewport)
         return 0, True, True, "button-disabled", True, "button-disabled", True, "button-disabled", plot_update
 
     
@@ -333,11 +438,13 @@ class Dashboard():
 
     @app.callback(
         [Output('point-labeling-submit-button', 'n_clicks'),
-        Output('model-plot', 'figure')],
+        Output('plot-update-store', 'data')],
         [Input('label-selection-dropdown', 'value'),
         Input('point-labeling-submit-button', 'n_clicks')],
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
     )
-    def assign_label(new_label, n_clicks):
+    def assign_label(new_label, n_clicks, plot_state, viewport):
         triggered_id = ctx.triggered[0]['prop_id']
         if triggered_id != 'point-labeling-submit-button.n_clicks':
             return n_clicks, no_update
@@ -345,42 +452,51 @@ class Dashboard():
         _plot_manager.update_selected_points_label(new_label)
         for point_id in _plot_manager.get_selected_point_ids():
             _projector.update_label(point_id, new_label)
-        plot_update = _self._refresh_plot()
+        plot_update = _self._refresh_plot(plot_state, viewport)
         return n_clicks, plot_update
     
 
     @app.callback(
         [Output('selection-highlight-button', 'n_clicks'),
-        Output('model-plot', 'figure')],
+        Output('plot-update-store', 'data')],
         Input('selection-highlight-button', 'n_clicks'),
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
     )
-    def highlight_selected(n_clicks):
+    def highlight_selected(n_clicks, plot_state, viewport):
         _plot_manager.highlight_selected()
-        plot_update = _self._refresh_plot()
+        plot_update = _self._refresh_plot(plot_state, viewport)
         return n_clicks, plot_update
 
     @app.callback(
         [Output('selection-dehighlight-button', 'n_clicks'),
-        Output('model-plot', 'figure')],
+        Output('plot-update-store', 'data')],
         Input('selection-dehighlight-button', 'n_clicks'),
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
     )
-    def dehighlight_selected(n_clicks):
+    def dehighlight_selected(n_clicks, plot_state, viewport):
         _plot_manager.dehighlight_selected()
-        plot_update = _self._refresh_plot()
+        plot_update = _self._refresh_plot(plot_state, viewport)
         return n_clicks, plot_update
     
     @app.callback(
         [Output('clear-all-highlight-button', 'n_clicks'),
-        Output('model-plot', 'figure')],
+        Output('plot-update-store', 'data')],
         Input('clear-all-highlight-button', 'n_clicks'),
+        State('plot-state-store', 'data'),
+        State('plot-viewport-store', 'data'),
     )
-    def dehighlight_all(n_clicks):
+    def dehighlight_all(n_clicks, plot_state, viewport):
         _plot_manager.dehighlight_all()
-        plot_update = _self._refresh_plot()
+        plot_update = _self._refresh_plot(plot_state, viewport)
         return n_clicks, plot_update
 
 
-    def _refresh_plot(self, model_ittr_update : bool = False):
+    # Returns the update of the plot, which the clientside callback applies to the figure of the client.
+    # The update holds the plot state it brings the client to, and either the patch operations since the client's plot version or the whole figure when these are not available.
+    # The plot state of a client holds the version of its figure and the key of its viewport figure (None while it holds the plot figure), the viewport is kept in its own store.
+    def _refresh_plot(self, plot_state : dict | None, viewport : list[list[float]] | None, model_ittr_update : bool = False):
         if _plot_manager is None:
             return no_update
         
@@ -396,14 +512,25 @@ class Dashboard():
                 return no_update
             self._rendering_plot_update = False
 
-        refreshed_plot = _plot_manager.get_plot()
-        refreshed_plot.update_layout(transition={'duration': transition_duration})
-        
-        global _plot_figure
-        _plot_figure = refreshed_plot
+        plot_state = plot_state or {}
+        since_version = plot_state.get('version')
+        version, patch_operations, refreshed_plot, viewport_figure_key = _plot_manager.get_plot_patch(since_version, viewport, plot_state.get('viewport-figure-key'))
+        # the client is up to date, nothing is sent
+        if refreshed_plot is None and len(patch_operations) == 0 and version == since_version:
+            return no_update
+
+        plot_update = {
+            'from-version': since_version,
+            'state': {'version': version, 'viewport-figure-key': viewport_figure_key},
+            'transition-duration': transition_duration,
+            'operations': patch_operations,
+            'figure': refreshed_plot,
+        }
+        if refreshed_plot is not None:
+            global _plot_figure
+            _plot_figure = refreshed_plot
+        return plot_update
 
-        return refreshed_plot
-    
 
     def _pause_projecting(self):
         global _flags
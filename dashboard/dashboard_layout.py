@@ -24,6 +24,9 @@ class DashboardLayout():
                 children=[
                     dcc.Interval(id="refresh-graph-interval", disabled=False, interval=self._graph_refresh_interval),
                     dcc.Graph(className='graph', id='model-plot', figure={}, config={'staticPlot': False}),
+                    dcc.Store(id='plot-state-store', data=None),
+                    dcc.Store(id='plot-viewport-store', data=None),
+                    dcc.Store(id='plot-update-store', data=None),
                     html.Div(id="plot-size-hidden-div", style={'display': 'none'})
                 ]
             ),
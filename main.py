@@ -15,13 +15,15 @@ from projector.projector_settings import ProjectorSettings
 from projector.plot_settings import PlotSettings
 
 from process_management.process_manager  import ProcessManager
+from process_management.async_runtime import AsyncRuntime
+from process_management.processing_utils import RUNTIME_MODE_ASYNCIO
 
 
 config_file_name: str = "config.toml"
 config_folder: str = os.path.join(os.getcwd(), "configs")
 config_path: str = os.path.join(config_folder, config_file_name)
 
-process_manager : ProcessManager
+process_manager : ProcessManager | AsyncRuntime
 configuration_resolver = ConfigurationResolver(config_path)
 
 
@@ -39,9 +41,15 @@ def launch() -> int:
     projector_kwargs = get_projector_kwargs(projector_settings)
     projector_plot_manager_kwargs = get_projector_plot_manager_kwargs(projector_settings.plot_settings)
     dashboard_kwargs = get_dashboard_kwargs(dashboard_settings)
+    process_resource_settings = configuration_resolver.get_process_resource_settings_from_config()
+    runtime_mode = configuration_resolver.get_runtime_mode_from_config()
+    supervisor_settings = configuration_resolver.get_supervisor_settings_from_config()
 
     global process_manager
-    process_manager = ProcessManager(stream_watcher_kwargs, projector_kwargs, projector_plot_manager_kwargs, dashboard_kwargs)
+    if runtime_mode == RUNTIME_MODE_ASYNCIO:
+        process_manager = AsyncRuntime(stream_watcher_kwargs, projector_kwargs, projector_plot_manager_kwargs, dashboard_kwargs, process_resource_settings)
+    else:
+        process_manager = ProcessManager(stream_watcher_kwargs, projector_kwargs, projector_plot_manager_kwargs, dashboard_kwargs, process_resource_settings, supervisor_settings)
 
     process_manager.start_process("dashboard")
 
@@ -1,72 +1,113 @@
-    
 import numpy as np
 import plotly.graph_objects as go
 from typing import Iterable
 
 from plotting.plotly_scatter_service import PlotlyScatterService
-from utils.logging import logger
+
+# Keeps track of the opacity of the plotted points. The opacity of a point follows from its age rank, the number of points plotted after it:
+# the newest points are in the first opacity level, and a point moves to the next level once more points were plotted after it than fit in the levels before.
+# Only points within the summed thresholds of the levels can still change level, so only the ids of those points are kept, in a ring buffer.
+# Adding a block of points therefore only evaluates the ring buffer and the new points, regardless of the total number of plotted points, and all resulting opacity changes are applied to the figure in one update.
+# When the last level is aggregated (density rendering), points reaching it are not updated in the figure but returned, so the caller can move them to the density histograms.
 
 
 class OpacityBookkeepingService:
     _scatter_plot_service : PlotlyScatterService
-    _opacity_thresholds : dict[float, int] = {}
+    _opacity_levels : np.ndarray
+    _level_boundaries : np.ndarray # age rank at which each level, except the last, ends
     _init_opacity : float = 1.0
-    _points_by_opacity : dict[float, Iterable[str]]= {}
+    _aggregate_last_level : bool = False
+
+    _recent_point_ids : np.ndarray # ring buffer of the ids of the most recently plotted points
+    _n_points : int = 0
 
 
-    def __init__(self, scatter_plot_service : PlotlyScatterService, opacity_thresholds : dict[float, int], init_opacity : float, points_by_opacity : dict[float, Iterable[str]]):
+    def __init__(self, scatter_plot_service : PlotlyScatterService, opacity_thresholds : dict[float, int], init_opacity : float, aggregate_last_level : bool = False):
         self._scatter_plot_service = scatter_plot_service
-        self._opacity_thresholds = opacity_thresholds
         self._init_opacity = init_opacity
-        self._points_by_opacity = points_by_opacity
-
-
-    def update_opacity_dict(self, new_points : Iterable[str], opacity : float | None = None):
-        self._expand_opacity_dict(new_points, opacity)
-        self._reduce_opacity()
-    
-
-    def update_opacity_dict_and_plot(self, figure : go.Figure, new_points : Iterable[str], opacity : float | None = None): 
-        self._expand_opacity_dict(new_points, opacity)
-        opacity_change_list = self._reduce_opacity()
-        self._assign_opacity_updates(figure, opacity_change_list)
-    
-
-    def _expand_opacity_dict(self, new_points : Iterable[str], opacity : float | None = None):
-        if opacity is None:
-            opacity = self._init_opacity
-        self._points_by_opacity[opacity].extend(new_points)
-
-
-    def _reduce_opacity(self) -> list[tuple[float, float]]:
-        opacity_change_list = list()
-        for i, (opacity, points) in enumerate(self._points_by_opacity.items()):
-            # if there is no opacity threshold defined or the selected opacity level is the lowerst/final opacity level, continue
-            opacity_threshold = self._opacity_thresholds[opacity]
-            if np.isnan(opacity_threshold) or i >= len(self._points_by_opacity)-1:
-                continue
-            
-            # if there are fewer points in the opacity level than are maximally allowed, continue
-            num_points_to_reduce_opacity = len(points) - opacity_threshold
-            if num_points_to_reduce_opacity < 1:
-                continue
-
-            reduced_opacity = list(self._points_by_opacity.keys())[i+1]
-            for point_index in range(num_points_to_reduce_opacity):
-                point_id = points[point_index]
-                opacity_change_list.append((point_id, reduced_opacity))
-                self._points_by_opacity[reduced_opacity].append(point_id)
-
-            # remove all points of the old opacity value that were assigned a lower opacity value
-            del points[:num_points_to_reduce_opacity]
-        return opacity_change_list
-
-    
-    def _assign_opacity_updates(self, figure : go.Figure, opacity_change_list : list[tuple[float, float]] = []):
-        for point_id, new_opacity in opacity_change_list:
-            scatter_trace, point_scatter_index = self._scatter_plot_service.get_trace_and_point_index_by_point_id(figure, point_id)
-            if scatter_trace is None or point_scatter_index is None:
-                logger.warning(f"could not find point in figure when attempting to reduce opacity. Point:{point_id}")
-                # logger.warning(f"could not find point in figure when attempting to reduce opacity. Point:{point_id}")
-                continue
-            self._scatter_plot_service.update_point_opacity(figure, scatter_trace, point_scatter_index, new_opacity)
+        self._aggregate_last_level = aggregate_last_level
+        self._opacity_levels = np.array(list(opacity_thresholds.keys()), dtype=float)
+
+        # a level without threshold keeps its points, the levels after it are never reached
+        thresholds = np.array(list(opacity_thresholds.values())[:-1], dtype=float)
+        self._level_boundaries = np.cumsum(np.nan_to_num(thresholds, nan=np.inf))
+        finite_boundaries = self._level_boundaries[np.isfinite(self._level_boundaries)]
+        ring_size = int(finite_boundaries[-1]) if len(finite_boundaries) > 0 else 0
+        self._recent_point_ids = np.empty(ring_size, dtype=object)
+
+
+    def get_num_points(self) -> int:
+        return self._n_points
+
+
+    # Returns the opacity of every plotted point, in the order the points were plotted, or of the points at the given positions in this order.
+    def get_opacity_values(self, plot_positions : np.ndarray = None) -> np.ndarray:
+        if plot_positions is None:
+            plot_positions = np.arange(self._n_points)
+        age_ranks = self._n_points - 1 - np.asarray(plot_positions)
+        return self._opacity_levels[self._get_levels(age_ranks)]
+
+
+    # Returns whether each plotted point is in the aggregated last level, in the order the points were plotted.
+    def get_aggregated_mask(self) -> np.ndarray:
+        if not self._aggregate_last_level:
+            return np.zeros(self._n_points, dtype=bool)
+        age_ranks = self._n_points - 1 - np.arange(self._n_points)
+        return self._get_levels(age_ranks) == len(self._opacity_levels) - 1
+
+
+    # Registers new points without altering a figure, e.g. when the figure is about to be recreated.
+    def add_points(self, new_points : Iterable[str]):
+        self._append_to_ring(np.asarray(new_points, dtype=object))
+
+
+    # Registers new points that were plotted with the initial opacity and updates the opacity of all points that changed level.
+    # Returns the points that reached the aggregated last level, these are left as they are in the figure.
+    def add_points_and_update_plot(self, figure : go.Figure, new_points : Iterable[str]) -> np.ndarray:
+        new_points = np.asarray(new_points, dtype=object)
+        n_new_points = len(new_points)
+        if n_new_points == 0:
+            return new_points
+
+        recent_points = self._get_recent_points()
+        points = np.concatenate((recent_points, new_points))
+        age_ranks = len(points) - 1 - np.arange(len(points))
+        new_levels = self._get_levels(age_ranks)
+        # the new points were plotted with the initial opacity, the first level
+        previous_levels = np.zeros(len(points), dtype=int)
+        previous_levels[:len(recent_points)] = self._get_levels(age_ranks[:len(recent_points)] - n_new_points)
+
+        self._append_to_ring(new_points)
+
+        is_changed = new_levels != previous_levels
+        is_aggregated = np.zeros(len(points), dtype=bool)
+        if self._aggregate_last_level:
+            is_aggregated = is_changed & (new_levels == len(self._opacity_levels) - 1)
+            is_changed &= ~is_aggregated
+
+        if is_changed.any():
+            self._scatter_plot_service.update_points_opacity(figure, points[is_changed], self._opacity_levels[new_levels[is_changed]])
+        return points[is_aggregated]
+
+
+    def _get_levels(self, age_ranks : np.ndarray) -> np.ndarray:
+        return np.searchsorted(self._level_boundaries, age_ranks, side='right')
+
+
+    # Returns the ids of the points that may still change level, oldest first.
+    def _get_recent_points(self) -> np.ndarray:
+        ring_size = len(self._recent_point_ids)
+        n_recent_points = min(self._n_points, ring_size)
+        if n_recent_points == 0:
+            return self._recent_point_ids[:0]
+        ring_positions = np.arange(self._n_points - n_recent_points, self._n_points) % ring_size
+        return self._recent_point_ids[ring_positions]
+
+
+    def _append_to_ring(self, new_points : np.ndarray):
+        ring_size = len(self._recent_point_ids)
+        if ring_size > 0:
+            n_kept = min(len(new_points), ring_size)
+            ring_positions = np.arange(self._n_points + len(new_points) - n_kept, self._n_points + len(new_points)) % ring_size
+            self._recent_point_ids[ring_positions] = new_points[len(new_points) - n_kept:]
+        self._n_points += len(new_points)
@@ -0,0 +1,164 @@
+import numpy as np
+import plotly.graph_objects as go
+import matplotlib.colors as mcolors
+from pyparsing import Iterable
+
+from plotting.scatter_plot_settings import ScatterPlotSettings
+from plotting.plotly_plot_service import PlotlyPlotSerivce
+
+# Renders aggregated points as a 2D histogram per label, drawn as a heatmap trace beneath the marker traces.
+# Points are only counted in the bin they fall in, so the size of a heatmap does not depend on the number of points it holds.
+# The histograms cover the normalized plot area with a margin, points outside it are counted in the nearest edge bin.
+# Like the point buffers of the figure index, the heatmaps are only written to the figure when the figure is materialized.
+
+DENSITY_TRACE_ID_PREFIX = 'density'
+DENSITY_EXTENT = (-0.25, 1.25)
+
+
+class PlotlyDensityService(PlotlyPlotSerivce):
+    _n_bins : int = 0
+    _lowest_opacity : float = 1.0
+    _bin_edges : np.ndarray
+    _counts : dict[str, np.ndarray] # keyval: label, flat histogram (row-major, y by x)
+    _dirty_labels : set[str]
+    _points : dict[str, tuple[str, int, float, float]] # keyval: point_id, (label, flat bin index, x_cord, y_cord)
+
+
+    def init_density_traces(self, figure : go.Figure, plot_settings : ScatterPlotSettings):
+        self._n_bins = plot_settings.density_bins
+        self._bin_edges = np.linspace(DENSITY_EXTENT[0], DENSITY_EXTENT[1], self._n_bins + 1)
+        self._counts = {}
+        self._dirty_labels = set()
+        self._points = {}
+
+        bin_centers = (self._bin_edges[:-1] + self._bin_edges[1:]) / 2
+        self._lowest_opacity = min(plot_settings.opacity_set) if plot_settings.opacity_set else plot_settings.initial_opacity
+        for label in plot_settings.labels:
+            red, green, blue, _ = [int(255 * channel) for channel in mcolors.to_rgba(plot_settings.color_map[label])]
+            self._counts[label] = np.zeros(self._n_bins * self._n_bins, dtype=int)
+            figure.add_trace(go.Heatmap(
+                uid=self.get_density_trace_uid(label),
+                name=label,
+                legendgroup=label,
+                showlegend=False,
+                showscale=False,
+                x=bin_centers,
+                y=bin_centers,
+                z=self._get_heatmap_values(label),
+                zmin=0,
+                zmax=self._get_zmax(label),
+                colorscale=[
+                    [0, f'rgba({red}, {green}, {blue}, 0)'],
+                    [1, f'rgba({red}, {green}, {blue}, 1)']
+                ],
+                hovertemplate=f'{label}<br>' + 'points: %{z}<extra></extra>'
+            ))
+
+
+    def get_density_trace_uid(self, label : str) -> str:
+        return f"{DENSITY_TRACE_ID_PREFIX}_{label}"
+
+
+    def is_enabled(self) -> bool:
+        return self._n_bins > 0
+
+
+    def contains_point(self, point_id : str) -> bool:
+        return self.is_enabled() and point_id in self._points
+
+
+    def get_num_points(self) -> int:
+        return len(self._points) if self.is_enabled() else 0
+
+
+    def get_point_coordinates(self, point_id : str) -> tuple[float, float]:
+        if not self.contains_point(point_id):
+            return None, None
+        _, _, x, y = self._points[point_id]
+        return x, y
+
+
+    def add_points(self, x : Iterable[float], y : Iterable[float], point_ids : Iterable[str], labels : Iterable[str]):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        labels = np.asarray(labels, dtype=object)
+        bins = self._get_bins(x, y)
+
+        for label in set(labels):
+            is_matching = labels == label
+            self._counts[label] += np.bincount(bins[is_matching], minlength=len(self._counts[label]))
+            self._dirty_labels.add(label)
+
+        self._points.update({point_id: (label, bin_index, point_x, point_y) for point_id, label, bin_index, point_x, point_y in zip(point_ids, labels, bins.tolist(), x.tolist(), y.tolist())})
+
+
+    # Moves the aggregated points to new coordinates and recounts the histograms. Returns whether each point was found.
+    def set_points_coordinates(self, point_ids : Iterable[str], x : Iterable[float], y : Iterable[float]) -> np.ndarray:
+        is_found = np.zeros(len(point_ids), dtype=bool)
+        if not self.is_enabled():
+            return is_found
+
+        for index, (point_id, point_x, point_y) in enumerate(zip(point_ids, x, y)):
+            if point_id in self._points:
+                label = self._points[point_id][0]
+                self._points[point_id] = (label, None, point_x, point_y)
+                is_found[index] = True
+
+        aggregated_point_ids = list(self._points.keys())
+        aggregated_points = list(self._points.values())
+        self._points = {}
+        for label in self._counts:
+            self._counts[label][:] = 0
+            self._dirty_labels.add(label)
+        self.add_points(
+            [point[2] for point in aggregated_points],
+            [point[3] for point in aggregated_points],
+            aggregated_point_ids,
+            [point[0] for point in aggregated_points]
+        )
+        return is_found
+
+
+    def update_point_label(self, point_id : str, new_label : str):
+        label, bin_index, x, y = self._points[point_id]
+        self._counts[label][bin_index] -= 1
+        self._counts[new_label][bin_index] += 1
+        self._dirty_labels.update((label, new_label))
+        self._points[point_id] = (new_label, bin_index, x, y)
+
+
+    def has_changes(self) -> bool:
+        return self.is_enabled() and len(self._dirty_labels) > 0
+
+
+    # Writes the histograms that changed to their heatmaps. Returns the changes per trace uid in the same form as PlotlyFigureIndex.materialize().
+    def materialize(self, figure : go.Figure) -> dict[str, tuple[set[str], dict[str, np.ndarray]]]:
+        changes = {}
+        if not self.is_enabled():
+            return changes
+
+        for label in self._dirty_labels:
+            trace = self.get_trace_by_id(figure, self.get_density_trace_uid(label))
+            trace.z = self._get_heatmap_values(label)
+            trace.zmax = self._get_zmax(label)
+            changes[trace.uid] = ({'z', 'zmax'}, {})
+        self._dirty_labels.clear()
+        return changes
+
+
+    def _get_bins(self, x : np.ndarray, y : np.ndarray) -> np.ndarray:
+        x_bins = np.clip(np.searchsorted(self._bin_edges, x, side='right') - 1, 0, self._n_bins - 1)
+        y_bins = np.clip(np.searchsorted(self._bin_edges, y, side='right') - 1, 0, self._n_bins - 1)
+        return y_bins * self._n_bins + x_bins
+
+
+    # a bin holding a single point is drawn with the lowest opacity of the markers
+    def _get_zmax(self, label : str) -> float:
+        return float(max(self._counts[label].max(), 1 / self._lowest_opacity))
+
+
+    # empty bins are NaN so they are not drawn
+    def _get_heatmap_values(self, label : str) -> np.ndarray:
+        values = self._counts[label].reshape(self._n_bins, self._n_bins).astype(float)
+        values[values == 0] = np.nan
+        return values
@@ -0,0 +1,153 @@
+import numpy as np
+import plotly.graph_objects as go
+from pyparsing import Iterable
+
+from plotting.trace_buffer import TraceBuffer
+
+# Index of the traces and points of a figure, so the Plotly services can look up a trace by uid and a point by id without scanning the figure.
+# The per-point arrays of each trace with point ids are held in a TraceBuffer, the services alter the buffers and the traces are only written by materialize(), i.e. when a snapshot of the figure is taken.
+# The index is bound to a single figure and rebuilt from its traces when it is used with another figure. The services sharing a figure should share its index.
+
+# per-point properties that are buffered when the trace holds them as an array, besides x, y, and ids
+OPTIONAL_BUFFERED_PATHS = ['text', 'customdata', 'marker.color', 'marker.opacity']
+
+
+class PlotlyFigureIndex():
+    _figure : go.Figure = None
+    _traces_by_uid : dict[str, go.Trace]
+    _buffers_by_uid : dict[str, TraceBuffer]
+    _point_locations : dict[str, tuple[str, int]] # keyval: point_id, (trace uid, position in the trace buffer)
+
+
+    def __init__(self):
+        self._traces_by_uid = {}
+        self._buffers_by_uid = {}
+        self._point_locations = {}
+
+
+    def get_trace(self, figure : go.Figure, uid : str) -> go.Trace:
+        self._bind(figure)
+        trace = self._traces_by_uid.get(uid)
+        if trace is None or trace.uid != uid:
+            self._index_traces()
+            trace = self._traces_by_uid.get(uid)
+        return trace
+
+
+    # Returns the buffer of a trace of the bound figure, the buffer is created when the trace was added to the figure after the index was built.
+    def get_buffer(self, trace : go.Trace) -> TraceBuffer:
+        buffer = self._buffers_by_uid.get(trace.uid)
+        if buffer is None:
+            self._traces_by_uid[trace.uid] = trace
+            buffer = self._create_buffer(trace)
+        return buffer
+
+
+    # Returns the trace containing the point and the position of the point in the trace buffer, or (None, None) if the figure does not contain the point.
+    def get_trace_and_position(self, figure : go.Figure, point_id : str) -> tuple[go.Trace, int]:
+        self._bind(figure)
+        location = self._point_locations.get(point_id)
+        if location is None:
+            return None, None
+        trace_uid, position = location
+        return self._traces_by_uid.get(trace_uid), position
+
+
+    # Returns the position of the point in the buffer of the trace, or None if the trace does not contain the point.
+    def get_position(self, trace : go.Trace, point_id : str) -> int:
+        location = self._point_locations.get(point_id)
+        if location is None or location[0] != trace.uid:
+            return None
+        return location[1]
+
+
+    # Returns the locations of the points, (None, None) for points that are not in the figure.
+    def get_locations(self, figure : go.Figure, point_ids : Iterable[str]) -> list[tuple[str, int]]:
+        self._bind(figure)
+        return [self._point_locations.get(point_id, (None, None)) for point_id in point_ids]
+
+
+    def add_points(self, trace : go.Trace, values : dict[str, Iterable]):
+        positions = self.get_buffer(trace).append(values)
+        for point_id, position in zip(values['ids'], positions):
+            self._point_locations[point_id] = (trace.uid, int(position))
+
+
+    def remove_points(self, trace : go.Trace, point_ids : Iterable[str]):
+        positions = []
+        for point_id in point_ids:
+            position = self.get_position(trace, point_id)
+            if position is None:
+                continue
+            positions.append(position)
+            del self._point_locations[point_id]
+        self.get_buffer(trace).remove(positions)
+
+
+    def clear_trace(self, trace : go.Trace):
+        buffer = self.get_buffer(trace)
+        for point_id in buffer.get_values('ids'):
+            self._point_locations.pop(point_id, None)
+        buffer.clear()
+
+
+    def has_changes(self) -> bool:
+        return any(buffer.is_dirty for buffer in self._buffers_by_uid.values())
+
+
+    # Writes the buffers that changed since the last snapshot to their traces. Buffers with many removed points are compacted first.
+    # Returns the changes per trace uid: the paths that were replaced entirely, and the entries appended to the other paths.
+    def materialize(self, figure : go.Figure) -> dict[str, tuple[set[str], dict[str, np.ndarray]]]:
+        self._bind(figure)
+        changes = {}
+        for uid, buffer in self._buffers_by_uid.items():
+            if not buffer.is_dirty:
+                continue
+            if buffer.needs_compaction():
+                self._compact(uid, buffer)
+
+            trace = self._traces_by_uid[uid]
+            replaced_paths, appended_values = buffer.take_changes()
+            for path in buffer.get_paths():
+                if path in replaced_paths or len(appended_values[path]) > 0:
+                    trace[path] = buffer.get_values(path)
+            changes[uid] = (replaced_paths, appended_values)
+        return changes
+
+
+    def rebuild(self):
+        self._index_traces()
+        self._buffers_by_uid = {}
+        self._point_locations = {}
+        for trace in self._traces_by_uid.values():
+            if trace.ids is not None:
+                self._create_buffer(trace)
+
+
+    def _bind(self, figure : go.Figure):
+        if figure is self._figure:
+            return
+        self._figure = figure
+        self.rebuild()
+
+
+    def _index_traces(self):
+        self._traces_by_uid = {trace.uid: trace for trace in self._figure.data}
+
+
+    def _create_buffer(self, trace : go.Trace) -> TraceBuffer:
+        paths = ['x', 'y', 'ids'] + [path for path in OPTIONAL_BUFFERED_PATHS if isinstance(trace[path], (tuple, list, np.ndarray))]
+        values = {path: trace[path] for path in paths} if trace.ids is not None else None
+        buffer = TraceBuffer(paths, values)
+        self._buffers_by_uid[trace.uid] = buffer
+
+        if values is not None:
+            for position, point_id in enumerate(values['ids']):
+                self._point_locations[point_id] = (trace.uid, position)
+        return buffer
+
+
+    def _compact(self, uid : str, buffer : TraceBuffer):
+        buffer.compact()
+        for position, point_id in enumerate(buffer.get_values('ids')):
+            self._point_locations[point_id] = (uid, position)
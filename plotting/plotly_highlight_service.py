@@ -56,9 +56,8 @@ class PlotlyHighlightService(PlotlyPlotSerivce):
         curr_highlight_trace = self._get_highlight_trace_by_highlight_id(figure, highlight_id)
         new_highlight_trace = self._get_highlight_trace_by_label(figure, new_label)
 
-        highlight_index = curr_highlight_trace.ids.index(highlight_id)
-        point_x = curr_highlight_trace.x[highlight_index]
-        point_y = curr_highlight_trace.y[highlight_index]
+        highlight_index = self._figure_index.get_position(curr_highlight_trace, highlight_id)
+        point_x, point_y = self._get_point_coordinates(curr_highlight_trace, highlight_index)
 
         self._remove_point(curr_highlight_trace, highlight_id)
         self._add_point(new_highlight_trace, highlight_id, point_x, point_y)
@@ -89,12 +88,13 @@ class PlotlyHighlightService(PlotlyPlotSerivce):
 
 
     def _get_highlight_trace_by_highlight_id(self, figure : go.Figure, highlight_id : str) -> go.Scatter:
-        return next(trace for trace in figure.data if trace.ids is not None and highlight_id in trace.ids)
+        highlight_trace, _ = self._figure_index.get_trace_and_position(figure, highlight_id)
+        return highlight_trace
     
 
     def _get_highlight_trace_by_label(self, figure : go.Figure, label : str) -> go.Scatter:
         highlight_trace_uid = self._get_highlight_trace_id(label)
-        return next(trace for trace in figure.data if trace.uid == highlight_trace_uid)
+        return self.get_trace_by_id(figure, highlight_trace_uid)
 
 
     def _get_highlight_trace_id(self, label : str) -> str:
@@ -2,38 +2,92 @@ import numpy as np
 import plotly.graph_objects as go
 from pyparsing import Iterable
 
+from plotting.plotly_figure_index import PlotlyFigureIndex
+
 LEGEND_GROUP_TRACE_UID_PREFIX = "legend_group"
 
 class PlotlyPlotSerivce():
+    _figure_index : PlotlyFigureIndex
+
+
+    # services that alter the same figure should be given the same figure index
+    def __init__(self, figure_index : PlotlyFigureIndex = None) -> None:
+        self._figure_index = figure_index if figure_index is not None else PlotlyFigureIndex()
+
+
+    def get_figure_index(self) -> PlotlyFigureIndex:
+        return self._figure_index
+
+
     def get_trace_by_id(self, figure : go.Figure, uid : str) -> go.Scatter:
-        return next((trace for trace in figure.data if trace.uid==uid), None)
+        return self._figure_index.get_trace(figure, uid)
+
+
+    def get_point_coordinates(self, figure : go.Figure, point_id : str) -> tuple[float, float]:
+        trace, point_index = self._figure_index.get_trace_and_position(figure, point_id)
+        if trace is None:
+            return None, None
+        return self._get_point_coordinates(trace, point_index)
+
+
+    # Moves the points to new coordinates in place, the points stay in their traces. Returns whether each point was found in the figure.
+    def set_points_coordinates(self, figure : go.Figure, point_ids : Iterable[str], x : Iterable[float], y : Iterable[float]) -> np.ndarray:
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        is_found = np.zeros(len(point_ids), dtype=bool)
+        for trace_uid, (point_ids_indices, positions) in self._get_locations_by_trace(figure, point_ids).items():
+            buffer = self._figure_index.get_buffer(self.get_trace_by_id(figure, trace_uid))
+            buffer.set('x', positions, x[point_ids_indices])
+            buffer.set('y', positions, y[point_ids_indices])
+            is_found[point_ids_indices] = True
+        return is_found
+
+
+    # Returns whether materialize() would change the figure.
+    def has_changes(self) -> bool:
+        return self._figure_index.has_changes()
+
+
+    # Writes the buffered points to the traces of the figure. Must be called before the figure is passed on, e.g. to the dashboard.
+    # Returns the changes since the previous call per trace uid, see PlotlyFigureIndex.materialize().
+    def materialize(self, figure : go.Figure) -> dict[str, tuple[set[str], dict[str, np.ndarray]]]:
+        return self._figure_index.materialize(figure)
+
+
+    def _get_point_coordinates(self, trace : go.Trace, point_index : int) -> tuple[float, float]:
+        buffer = self._figure_index.get_buffer(trace)
+        return buffer.get('x', point_index), buffer.get('y', point_index)
+
+
+    # Groups the points by the trace containing them, points that are not in the figure are left out.
+    def _get_locations_by_trace(self, figure : go.Figure, point_ids : Iterable[str]) -> dict[str, tuple[list[int], list[int]]]:
+        locations_by_trace = {} # keyval: trace uid, (indices in point_ids, positions in the trace buffer)
+        for point_ids_index, (trace_uid, point_index) in enumerate(self._figure_index.get_locations(figure, point_ids)):
+            if trace_uid is None:
+                continue
+            point_ids_indices, positions = locations_by_trace.setdefault(trace_uid, ([], []))
+            point_ids_indices.append(point_ids_index)
+            positions.append(point_index)
+        return locations_by_trace
 
 
     def _add_point(self, trace : go.Trace, point_id : str | float, point_x : float, point_y : float, point_text : str = None):
-        trace.x = np.append(trace.x, point_x).tolist()
-        trace.y = np.append(trace.y, point_y).tolist()
-        trace.ids = np.append(trace.ids, point_id).tolist()
-        if point_text is not None:
-            trace.text = np.append(trace.text, point_text).tolist()
+        self._add_points(trace, [point_id], [point_x], [point_y], None if point_text is None else [point_text])
+
+
+    def _add_points(self, trace : go.Trace, point_ids : Iterable[str | float], x : Iterable[float], y : Iterable[float], texts : Iterable[str] = None):
+        values = {'x': x, 'y': y, 'ids': point_ids}
+        if texts is not None:
+            values['text'] = texts
+        self._figure_index.add_points(trace, values)
     
 
     def _remove_point(self, trace : go.Trace, point_id : str | float):
-        point_index = next((index for index, id in enumerate(trace.ids) if id==point_id), None)
-        if point_index is None:
-            return 
-        
-        trace.x = np.delete(trace.x, point_index).tolist()
-        trace.y = np.delete(trace.y, point_index).tolist()
-        trace.ids = np.delete(trace.ids, point_index).tolist()
-        if trace.text is not None and len(trace.text) > 0:
-            trace.text = np.delete(trace.text, point_index).tolist()
+        self._figure_index.remove_points(trace, [point_id])
 
 
     def _clear_trace(self, trace : go.Trace):
-        trace.x = []
-        trace.y = []
-        trace.ids = []
-        trace.text = []
+        self._figure_index.clear_trace(trace)
 
 
     def _format_trace_text(self, texts : Iterable[str]) -> Iterable[str]:
@@ -54,4 +108,4 @@ class PlotlyPlotSerivce():
     
 
     def _is_iterable_none_or_empty(self, iterable : Iterable):
-        return iterable is None or len(iterable) < 1
\ No newline at end of file
+        return iterable is None or len(iterable) < 1    
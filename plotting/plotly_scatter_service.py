@@ -5,8 +5,10 @@ from pyparsing import Iterable
 
 from plotting.scatter_plot_settings import ScatterPlotSettings
 from plotting.plotly_plot_service import PlotlyPlotSerivce
+from plotting.plotly_figure_index import PlotlyFigureIndex
 from plotting.plotly_selection_service import PlotlySelectionService
 from plotting.plotly_highlight_service import PlotlyHighlightService
+from plotting.plotly_density_service import PlotlyDensityService
 from utils.logging import logger
 
 
@@ -15,11 +17,14 @@ SCATTER_TRACE_UID_PREFIX = 'scatter'
 class PlotlyScatterService(PlotlyPlotSerivce):
     _selection_service : PlotlySelectionService
     _highlight_service : PlotlyHighlightService
+    _density_service : PlotlyDensityService
 
 
-    def __init__(self) -> None:
-        self._selection_service = PlotlySelectionService()
-        self._highlight_service = PlotlyHighlightService()
+    def __init__(self, figure_index : PlotlyFigureIndex = None) -> None:
+        super().__init__(figure_index)
+        self._selection_service = PlotlySelectionService(self._figure_index)
+        self._highlight_service = PlotlyHighlightService(self._figure_index)
+        self._density_service = PlotlyDensityService(self._figure_index)
 
 
     def create_figure(self, plot_settings : ScatterPlotSettings, x : Iterable = None, y : Iterable = None, point_ids : Iterable = None, labels : Iterable = None, texts : Iterable[str] = None, opacity_values : Iterable[float] | float = None) -> go.Figure:
@@ -39,19 +44,26 @@ class PlotlyScatterService(PlotlyPlotSerivce):
         figure = go.Figure()
         self._set_layout(figure, plot_settings)
         self._set_legend_groups(figure, label_set, plot_settings.color_map, plot_settings.initial_opacity, x, y)
+        # the density traces are added first so they are drawn beneath the markers
+        if plot_settings.density_bins is not None:
+            self._density_service.init_density_traces(figure, plot_settings)
         self._highlight_service.init_highlight_traces(figure, plot_settings)
         self._selection_service.init_selection_trace(figure, plot_settings)
 
-        # add traces for all label-opacity combindations if opacity values are set
+        self._init_scatter_traces(figure, plot_settings, label_set, opacity_set)
+        
+        if all(var is not None for var in (x, y, point_ids, labels)):
+            self.add_scatter(figure, x, y, point_ids, labels, texts, opacity_values)
+        return figure
+
+
+    # add traces for all label-opacity combindations if opacity values are set
+    def _init_scatter_traces(self, figure : go.Figure, plot_settings : ScatterPlotSettings, label_set : Iterable[str], opacity_set : Iterable[float]):
         if opacity_set is not None:
             for label in label_set:
                 color = plot_settings.color_map[label]
                 for opacity in opacity_set:
                     self.__add_scatter_trace(figure, label, opacity, color)
-        
-        if all(var is not None for var in (x, y, point_ids, labels)):
-            self.add_scatter(figure, x, y, point_ids, labels, texts, opacity_values)
-        return figure
 
 
     def _set_layout(self, figure : go.Figure, plot_settings : ScatterPlotSettings):
@@ -101,9 +113,24 @@ class PlotlyScatterService(PlotlyPlotSerivce):
             ))
     
 
+    def has_changes(self) -> bool:
+        return super().has_changes() or self._density_service.has_changes()
+
+
+    # the density traces are part of the figure created by this service, so their histograms are written along with the point buffers
+    def materialize(self, figure : go.Figure) -> dict[str, tuple[set[str], dict[str, np.ndarray]]]:
+        changes = super().materialize(figure)
+        changes.update(self._density_service.materialize(figure))
+        return changes
+
+
     '''
     Get methods
     '''
+    def get_density_service(self) -> PlotlyDensityService:
+        return self._density_service
+
+
     def get_scatter_trace_uid(self, label : str, opacity : float) -> str:
         return f"{SCATTER_TRACE_UID_PREFIX}_{label}_opacity={opacity}"
     
@@ -117,28 +144,23 @@ class PlotlyScatterService(PlotlyPlotSerivce):
         
     
     def get_trace_and_point_index(self, figure : go.Figure, point_id : str, label : str, opacity : float) -> tuple[go.Scatter, int]:
-        matching_trace = self.get_point_trace(figure, label, opacity)
+        matching_trace = self.get_trace(figure, label, opacity)
         if matching_trace is None:
             return None, None
 
-        point_index = next((index for index, id_entry in enumerate(matching_trace.ids) if id_entry==point_id), None)
+        point_index = self._figure_index.get_position(matching_trace, point_id)
         return matching_trace, point_index
     
 
     def get_trace_by_point_id(self, figure : go.Figure, point_id : str) -> go.Scatter:
-        matching_trace = next((trace for trace in figure.data if trace.ids is not None and point_id in trace.ids), None)
+        matching_trace, _ = self._figure_index.get_trace_and_position(figure, point_id)
         if matching_trace is None: 
             return
         return matching_trace
         
     
     def get_trace_and_point_index_by_point_id(self, figure : go.Figure, point_id : str) -> tuple[go.Scatter, int]:
-        matching_trace = self.get_trace_by_point_id(figure, point_id)
-        if matching_trace is None:
-            return None, None
-
-        point_index = next((index for index, id_entry in enumerate(matching_trace.ids) if id_entry==point_id), None)
-        return matching_trace, point_index
+        return self._figure_index.get_trace_and_position(figure, point_id)
     
 
     def get_label_by_point_id(self, figure : go.Figure, point_id : str) -> str:
@@ -153,29 +175,26 @@ class PlotlyScatterService(PlotlyPlotSerivce):
     '''
     def add_scatter(self, figure : go.Figure, x : Iterable[float], y : Iterable[float], point_ids : Iterable[str], labels : Iterable[str], texts : Iterable[str] = None, opacities : Iterable[float] | float = 1.0):
         if isinstance(opacities, (float, int)):
-            opacities = [opacities]
+            opacities = [opacities]*len(point_ids)
         elif not isinstance(opacities, Iterable):
             raise Exception("opacity should be either of type 'Iterable[int|float]', 'int', or 'float'")
         
         if texts is None or len(texts) == 0:
             texts = [""]*len(point_ids)
 
-        index_array_by_label = {}
-        for label in set(labels):
-            index_array_by_label[label] = [index for index, value in enumerate(labels) if value == label]
-        
-        index_array_by_opacity = {}
-        for opacity in set(opacities):
-            index_array_by_opacity[opacity] = [index for index, value in enumerate(opacities) if value == opacity]
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        point_ids = np.asarray(point_ids, dtype=object)
+        texts = np.asarray(texts, dtype=object)
+        labels = np.asarray(labels, dtype=object)
+        opacities = np.asarray(opacities, dtype=float)
 
         # iterate over every label - opacity pair
         for label, opacity in itertools.product(set(labels), set(opacities)):
-            matching_indeces = list(set(index_array_by_label[label]) & set(index_array_by_opacity[opacity]))
-            matching_x = [x[i] for i in matching_indeces]
-            matching_y = [y[i] for i in matching_indeces]
-            matching_point_ids = [point_ids[i] for i in matching_indeces]
-            matching_texts = [texts[i] for i in matching_indeces]
-            self.add_scatter_points(figure, matching_x, matching_y, matching_point_ids, label, matching_texts, opacity)
+            is_matching = (labels == label) & (opacities == opacity)
+            if not is_matching.any():
+                continue
+            self.add_scatter_points(figure, x[is_matching], y[is_matching], point_ids[is_matching], label, texts[is_matching], opacity)
 
 
     def add_scatter_point(self, figure : go.Figure, x : float, y : float, point_id : str, label : str, text : str = None, opacity : float = 1.0):
@@ -190,13 +209,8 @@ class PlotlyScatterService(PlotlyPlotSerivce):
             color = label_group_trace.marker.color
             target_trace = self.__add_scatter_trace(figure, label, opacity, color)
 
-        target_trace.x = np.append(target_trace.x, x).tolist()
-        target_trace.y = np.append(target_trace.y, y).tolist()
-        target_trace.ids = np.append(target_trace.ids, point_ids).tolist()
-        
         texts = self._format_trace_text(texts)
-        if texts is not None:
-            target_trace.text = np.append(target_trace.text, texts).tolist()
+        self._add_points(target_trace, point_ids, x, y, texts)
 
 
     def __add_scatter_trace(self, figure : go.Figure, label : str, opacity : float, color : str, show_legend : bool = False) -> go.Scatter:
@@ -221,6 +235,22 @@ class PlotlyScatterService(PlotlyPlotSerivce):
         figure.add_trace(trace)
         return self.get_trace_by_id(figure, trace_uid)
 
+    '''
+    Remove methods
+    '''
+    # Removes the points from the scatter traces and returns their coordinates, NaN for points that are not in the figure.
+    def remove_points(self, figure : go.Figure, point_ids : Iterable[str]) -> tuple[np.ndarray, np.ndarray]:
+        point_ids = np.asarray(point_ids, dtype=object)
+        x = np.full(len(point_ids), np.nan)
+        y = np.full(len(point_ids), np.nan)
+
+        for trace_uid, (point_ids_indices, positions) in self._get_locations_by_trace(figure, point_ids).items():
+            trace = self.get_trace_by_id(figure, trace_uid)
+            x[point_ids_indices], y[point_ids_indices] = self._get_point_coordinates(trace, positions)
+            self._figure_index.remove_points(trace, point_ids[point_ids_indices])
+        return x, y
+
+
     '''
     Update methods
     '''
@@ -238,14 +268,34 @@ class PlotlyScatterService(PlotlyPlotSerivce):
         self.update_point(figure, trace, point_index, label, new_opacity)
 
 
+    # moves the points to the traces of their new opacity, one move per source trace and opacity
+    def update_points_opacity(self, figure : go.Figure, point_ids : Iterable[str], new_opacities : Iterable[float]):
+        positions_by_move : dict[tuple[str, float], list[int]] = {}
+        for point_id, new_opacity, (trace_uid, point_index) in zip(point_ids, new_opacities, self._figure_index.get_locations(figure, point_ids)):
+            if trace_uid is None:
+                logger.warning(f"could not find point in figure when attempting to reduce opacity. Point:{point_id}")
+                continue
+            positions_by_move.setdefault((trace_uid, float(new_opacity)), []).append(point_index)
+
+        for (trace_uid, new_opacity), positions in positions_by_move.items():
+            trace = self.get_trace_by_id(figure, trace_uid)
+            buffer = self._figure_index.get_buffer(trace)
+            moved_point_ids = buffer.get('ids', positions)
+            texts = buffer.get('text', positions) if buffer.has_path('text') else None
+            x, y = self._get_point_coordinates(trace, positions)
+
+            self._figure_index.remove_points(trace, moved_point_ids)
+            self.add_scatter_points(figure, x, y, moved_point_ids, trace.name, texts, new_opacity)
+
+
     def update_point(self, figure : go.Figure, trace : go.Scatter | str, point_index, label, opacity):
         if isinstance(trace, str):
             trace = self.get_trace_by_id(figure, trace)
 
-        x = trace.x[point_index]
-        y = trace.y[point_index]
-        point_id = trace.ids[point_index]
-        text = trace.text[point_index]
+        buffer = self._figure_index.get_buffer(trace)
+        x, y = self._get_point_coordinates(trace, point_index)
+        point_id = buffer.get('ids', point_index)
+        text = buffer.get('text', point_index)
 
         self._remove_point(trace, point_id)
         self.add_scatter_point(figure, x, y, point_id, label, text, opacity)
\ No newline at end of file
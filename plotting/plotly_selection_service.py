@@ -1,4 +1,5 @@
 import plotly.graph_objects as go
+from pyparsing import Iterable
 
 from plotting.scatter_plot_settings import ScatterPlotSettings
 from plotting.plotly_plot_service import PlotlyPlotSerivce
@@ -36,7 +37,7 @@ class PlotlySelectionService(PlotlyPlotSerivce):
     
 
     def get_selection_trace(self, figure : go.Figure) -> go.Scatter:
-        return next(trace for trace in figure.data if trace.uid == SELECTION_TRACE_ID)
+        return self.get_trace_by_id(figure, SELECTION_TRACE_ID)
     
 
     def get_point_id_from_selection_id(self, selection_id : str) -> str:
@@ -46,7 +47,7 @@ class PlotlySelectionService(PlotlyPlotSerivce):
     
 
     def select_point(self, figure : go.Figure, point_x : float, point_y : float, point_id : str):
-        selection_trace = next((trace for trace in figure.data if trace.uid==SELECTION_TRACE_ID), None)
+        selection_trace = self.get_trace_by_id(figure, SELECTION_TRACE_ID)
         if selection_trace is None:
             raise Exception("No selection trace was created upon creating the figure.")
         
@@ -54,8 +55,17 @@ class PlotlySelectionService(PlotlyPlotSerivce):
         self._add_point(selection_trace, selection_id, point_x, point_y)
 
 
+    def select_points(self, figure : go.Figure, points_x : Iterable[float], points_y : Iterable[float], point_ids : Iterable[str]):
+        selection_trace = self.get_trace_by_id(figure, SELECTION_TRACE_ID)
+        if selection_trace is None:
+            raise Exception("No selection trace was created upon creating the figure.")
+        
+        selection_ids = [self.get_selection_id(point_id) for point_id in point_ids]
+        self._add_points(selection_trace, selection_ids, points_x, points_y)
+
+
     def deselect_point(self, figure : go.Figure, point_id : str):
-        selection_trace = next((trace for trace in figure.data if trace.uid==SELECTION_TRACE_ID), None)
+        selection_trace = self.get_trace_by_id(figure, SELECTION_TRACE_ID)
         if selection_trace is None:
             raise Exception("No selection trace was created upon creating the figure.")
         
@@ -64,7 +74,7 @@ class PlotlySelectionService(PlotlyPlotSerivce):
 
 
     def deselect_all(self, figure : go.Figure):
-        selection_trace = next((trace for trace in figure.data if trace.uid==SELECTION_TRACE_ID), None)
+        selection_trace = self.get_trace_by_id(figure, SELECTION_TRACE_ID)
         if selection_trace is None:
             raise Exception("No selection trace was created upon creating the figure.")
         self._clear_trace(selection_trace)
\ No newline at end of file
@@ -0,0 +1,134 @@
+import plotly.graph_objects as go
+from pyparsing import Iterable
+
+from plotting.scatter_plot_settings import ScatterPlotSettings
+from plotting.plotly_scatter_service import PlotlyScatterService
+from plotting.plotly_figure_index import PlotlyFigureIndex
+from utils.logging import logger
+
+# Scatter service that renders all projection points in a single WebGL trace.
+# Instead of one trace per label and opacity, the color and opacity of each point are entries of the marker.color and marker.opacity arrays of the trace, and the label of each point is kept in its customdata.
+# Changing the label or opacity of a point is a write to these arrays (in the trace buffer) rather than moving the point to another trace.
+# The legend, selection, and highlight traces are the same as those of the PlotlyScatterService.
+
+WEBGL_SCATTER_TRACE_UID = 'scatter_webgl'
+
+
+class PlotlyWebglScatterService(PlotlyScatterService):
+    _color_map : dict[str, str]
+
+
+    def __init__(self, figure_index : PlotlyFigureIndex = None) -> None:
+        super().__init__(figure_index)
+        self._color_map = {}
+
+
+    def _init_scatter_traces(self, figure : go.Figure, plot_settings : ScatterPlotSettings, label_set : Iterable[str], opacity_set : Iterable[float]):
+        self._color_map = dict(plot_settings.color_map)
+        figure.add_trace(go.Scattergl(
+            uid=WEBGL_SCATTER_TRACE_UID,
+            mode='markers',
+            showlegend=False,
+            marker=dict(
+                color=[],
+                opacity=[]
+            ),
+            x=[],
+            y=[],
+            ids=[],
+            text=[],
+            customdata=[],
+            hovertemplate='%{text}<br>label: %{customdata}<extra></extra>'
+        ))
+
+
+    '''
+    Get methods
+    '''
+    def get_scatter_trace_uid(self, label : str, opacity : float) -> str:
+        return WEBGL_SCATTER_TRACE_UID
+
+
+    def get_label_by_point_id(self, figure : go.Figure, point_id : str) -> str:
+        trace, point_index = self.get_trace_and_point_index_by_point_id(figure, point_id)
+        if trace is None:
+            return None
+        return self._figure_index.get_buffer(trace).get('customdata', point_index)
+
+
+    '''
+    Add scatter methods
+    '''
+    def add_scatter(self, figure : go.Figure, x : Iterable[float], y : Iterable[float], point_ids : Iterable[str], labels : Iterable[str], texts : Iterable[str] = None, opacities : Iterable[float] | float = 1.0):
+        if isinstance(opacities, (float, int)):
+            opacities = [float(opacities)] * len(point_ids)
+        elif not isinstance(opacities, Iterable):
+            raise Exception("opacity should be either of type 'Iterable[int|float]', 'int', or 'float'")
+
+        texts = self._format_trace_text(texts)
+        if texts is None:
+            texts = [""]*len(point_ids)
+
+        trace = self.get_trace_by_id(figure, WEBGL_SCATTER_TRACE_UID)
+        self._figure_index.add_points(trace, {
+            'x': x,
+            'y': y,
+            'ids': point_ids,
+            'text': texts,
+            'customdata': labels,
+            'marker.color': [self._get_label_color(figure, label) for label in labels],
+            'marker.opacity': opacities,
+        })
+
+
+    def add_scatter_points(self, figure : go.Figure, x : Iterable[float], y : Iterable[float], point_ids : Iterable[str], label : str, texts : Iterable[str] = None, opacity : float = 1.0):
+        self.add_scatter(figure, x, y, point_ids, [label]*len(point_ids), texts, opacity)
+
+
+    '''
+    Update methods
+    '''
+    def update_point_label(self, figure : go.Figure, trace : go.Scattergl | str, point_index : int, new_label : str):
+        if isinstance(trace, str):
+            trace = self.get_trace_by_id(figure, trace)
+        opacity = self._figure_index.get_buffer(trace).get('marker.opacity', point_index)
+        self.update_point(figure, trace, point_index, new_label, opacity)
+
+
+    def update_point_opacity(self, figure : go.Figure, trace : go.Scattergl | str, point_index : int, new_opacity : float):
+        if isinstance(trace, str):
+            trace = self.get_trace_by_id(figure, trace)
+        label = self._figure_index.get_buffer(trace).get('customdata', point_index)
+        self.update_point(figure, trace, point_index, label, new_opacity)
+
+
+    # the opacities of all points are written to the opacity array at once
+    def update_points_opacity(self, figure : go.Figure, point_ids : Iterable[str], new_opacities : Iterable[float]):
+        trace = self.get_trace_by_id(figure, WEBGL_SCATTER_TRACE_UID)
+
+        point_indices = []
+        opacities = []
+        for point_id, new_opacity, (_, point_index) in zip(point_ids, new_opacities, self._figure_index.get_locations(figure, point_ids)):
+            if point_index is None:
+                logger.warning(f"could not find point in figure when attempting to reduce opacity. Point:{point_id}")
+                continue
+            point_indices.append(point_index)
+            opacities.append(new_opacity)
+        self._figure_index.get_buffer(trace).set('marker.opacity', point_indices, opacities)
+
+
+    def update_point(self, figure : go.Figure, trace : go.Scattergl | str, point_index, label, opacity):
+        if isinstance(trace, str):
+            trace = self.get_trace_by_id(figure, trace)
+
+        buffer = self._figure_index.get_buffer(trace)
+        buffer.set('marker.color', point_index, self._get_label_color(figure, label))
+        buffer.set('marker.opacity', point_index, float(opacity))
+        buffer.set('customdata', point_index, label)
+
+
+    def _get_label_color(self, figure : go.Figure, label : str) -> str:
+        if label not in self._color_map:
+            label_group_trace = self.get_trace_by_id(figure, self._get_legend_group_trace_uid(label))
+            self._color_map[label] = label_group_trace.marker.color
+        return self._color_map[label]
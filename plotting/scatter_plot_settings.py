@@ -19,6 +19,8 @@ class ScatterPlotSettings:
 
     transition_duration : int
 
+    density_bins : int | None
+
     
     def __init__(self,
         labels : list[str],
@@ -35,7 +37,8 @@ class ScatterPlotSettings:
         yaxis_range : range = None,
         xaxis_step_size : float = 0.2,
         yaxis_step_size : float = 0.2,
-        transition_duration : int = 500
+        transition_duration : int = 500,
+        density_bins : int | None = None
     ):
         self.labels = labels
         self.color_map = color_map
@@ -52,4 +55,5 @@ class ScatterPlotSettings:
         self.xaxis_step_size = xaxis_step_size
         self.yaxis_step_size = yaxis_step_size
         self.transition_duration = transition_duration
+        self.density_bins = density_bins
 
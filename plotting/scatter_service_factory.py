@@ -0,0 +1,15 @@
+from plotting.plotly_scatter_service import PlotlyScatterService
+from plotting.plotly_webgl_scatter_service import PlotlyWebglScatterService
+
+RENDER_MODE_TRACES = "traces"
+RENDER_MODE_WEBGL = "webgl"
+RENDER_MODES = [RENDER_MODE_TRACES, RENDER_MODE_WEBGL]
+
+
+# Creates the scatter service matching the configured render mode.
+def create_scatter_service(render_mode : str) -> PlotlyScatterService:
+    match render_mode:
+        case "traces": return PlotlyScatterService()
+        case "webgl": return PlotlyWebglScatterService()
+        case _:
+            raise Exception(f"Plot Exception: unknown render mode '{render_mode}'. Supported render modes: {RENDER_MODES}")
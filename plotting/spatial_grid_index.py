@@ -0,0 +1,127 @@
+import numpy as np
+from pyparsing import Iterable
+
+# Grid pyramid over the normalized projection points, used to decimate the points within a viewport to a point budget and to find the points within a selected region.
+# Level l divides the extent into 2^l by 2^l cells. The finest level keeps all points per cell, the coarser levels only keep a representative per cell, the most recently added point.
+# A viewport query uses the finest level at which the viewport spans no more cells than the budget, so its cost depends on the budget and not on the number of points.
+# Points are kept in the order they were added, a point is referred to by this position (its row).
+
+GRID_EXTENT = (-0.25, 1.25)
+GRID_MAX_LEVEL = 8
+INITIAL_CAPACITY = 1024
+
+
+class SpatialGridIndex():
+    _x : np.ndarray
+    _y : np.ndarray
+    _point_ids : np.ndarray
+    _texts : np.ndarray
+    _size : int = 0
+    _cell_rows : dict[int, list[int]] # keyval: cell of the finest level, rows of the points in the cell
+    _representatives : list[dict[int, int]] # per level below the finest, keyval: cell, row of the representative point
+
+
+    def __init__(self):
+        self.clear()
+
+
+    def __len__(self) -> int:
+        return self._size
+
+
+    def clear(self):
+        self._x = np.empty(INITIAL_CAPACITY)
+        self._y = np.empty(INITIAL_CAPACITY)
+        self._point_ids = np.empty(INITIAL_CAPACITY, dtype=object)
+        self._texts = np.empty(INITIAL_CAPACITY, dtype=object)
+        self._size = 0
+        self._cell_rows = {}
+        self._representatives = [{} for _ in range(GRID_MAX_LEVEL)]
+
+
+    def add_points(self, x : Iterable[float], y : Iterable[float], point_ids : Iterable[str], texts : Iterable[str]):
+        n_points = len(point_ids)
+        if n_points == 0:
+            return
+        self._reserve(self._size + n_points)
+        rows = np.arange(self._size, self._size + n_points)
+        self._x[rows] = x
+        self._y[rows] = y
+        self._point_ids[rows] = point_ids
+        self._texts[rows] = texts
+        self._size += n_points
+
+        x_cells = self._get_cells(self._x[rows], GRID_MAX_LEVEL)
+        y_cells = self._get_cells(self._y[rows], GRID_MAX_LEVEL)
+        cells = y_cells * 2**GRID_MAX_LEVEL + x_cells
+        order = np.argsort(cells, kind='stable')
+        unique_cells, starts = np.unique(cells[order], return_index=True)
+        for cell, cell_rows in zip(unique_cells.tolist(), np.split(rows[order], starts[1:])):
+            self._cell_rows.setdefault(cell, []).extend(cell_rows.tolist())
+
+        for level in range(GRID_MAX_LEVEL):
+            shift = GRID_MAX_LEVEL - level
+            level_cells = (y_cells >> shift) * 2**level + (x_cells >> shift)
+            # the last occurrence of a cell is the most recently added point in it
+            unique_cells, last_indices = np.unique(level_cells[::-1], return_index=True)
+            self._representatives[level].update(zip(unique_cells.tolist(), rows[::-1][last_indices].tolist()))
+
+
+    # Returns the rows of at most budget points covering the viewport, in the order the points were added.
+    # Cells that partially overlap the viewport are included, so points just outside the viewport may be returned.
+    def query(self, x_range : Iterable[float], y_range : Iterable[float], budget : int) -> np.ndarray:
+        if budget <= 0:
+            return np.empty(0, dtype=int)
+
+        for level in range(GRID_MAX_LEVEL, -1, -1):
+            x_cells, y_cells = self._get_cell_ranges(x_range, y_range, level)
+            if len(x_cells) * len(y_cells) <= budget or level == 0:
+                break
+
+        cells = [y_cell * 2**level + x_cell for y_cell in y_cells for x_cell in x_cells]
+        if level == GRID_MAX_LEVEL:
+            rows = [row for cell in cells for row in self._cell_rows.get(cell, [])]
+        else:
+            representatives = self._representatives[level]
+            rows = [representatives[cell] for cell in cells if cell in representatives]
+
+        # keep the most recent points when the finest cells hold more points than the budget
+        rows = np.sort(np.asarray(rows, dtype=int))
+        return rows[-budget:] if len(rows) > budget else rows
+
+
+    # Returns the rows of all points in the cells of the finest level that overlap the box, which includes all points within the box.
+    def get_rows_in_box(self, x_range : Iterable[float], y_range : Iterable[float]) -> np.ndarray:
+        x_cells, y_cells = self._get_cell_ranges(x_range, y_range, GRID_MAX_LEVEL)
+        rows = [row for y_cell in y_cells for x_cell in x_cells for row in self._cell_rows.get(y_cell * 2**GRID_MAX_LEVEL + x_cell, [])]
+        return np.asarray(rows, dtype=int)
+
+
+    def get_points(self, rows : np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        return self._x[rows], self._y[rows], self._point_ids[rows], self._texts[rows]
+
+
+    # the cells are the same along both axes, points outside the extent are in the nearest edge cell
+    def _get_cells(self, values : np.ndarray, level : int) -> np.ndarray:
+        n_cells = 2**level
+        cell_size = (GRID_EXTENT[1] - GRID_EXTENT[0]) / n_cells
+        return np.clip(np.floor((values - GRID_EXTENT[0]) / cell_size), 0, n_cells - 1).astype(int)
+
+
+    def _get_cell_ranges(self, x_range : Iterable[float], y_range : Iterable[float], level : int) -> tuple[range, range]:
+        x_first, x_last = self._get_cells(np.sort(np.asarray(x_range, dtype=float)), level).tolist()
+        y_first, y_last = self._get_cells(np.sort(np.asarray(y_range, dtype=float)), level).tolist()
+        return range(x_first, x_last + 1), range(y_first, y_last + 1)
+
+
+    def _reserve(self, capacity : int):
+        current_capacity = len(self._x)
+        if capacity <= current_capacity:
+            return
+
+        new_capacity = max(capacity, 2 * current_capacity)
+        for name in ('_x', '_y', '_point_ids', '_texts'):
+            column = getattr(self, name)
+            new_column = np.empty(new_capacity, dtype=column.dtype)
+            new_column[:self._size] = column[:self._size]
+            setattr(self, name, new_column)
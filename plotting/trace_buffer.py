@@ -0,0 +1,147 @@
+import numpy as np
+from pyparsing import Iterable
+
+# Growable NumPy buffer holding the per-point arrays of a trace (x, y, ids, and e.g. text or marker.opacity), keyed by their plotly property path.
+# Points are appended at the end and removed by marking them as removed (a tombstone), so the position of a point in the buffer stays the same until the buffer is compacted.
+# The trace itself is only written when the buffer is materialized, i.e. when a snapshot of the figure is taken.
+# The buffer tracks what changed since the last snapshot: the points appended to the end, and the paths that must be replaced entirely because existing entries were changed or points were removed.
+
+INITIAL_CAPACITY = 64
+FLOAT_COLUMNS = ['x', 'y', 'marker.opacity']
+
+
+class TraceBuffer():
+    is_dirty : bool = False
+    _columns : dict[str, np.ndarray]
+    _is_removed : np.ndarray
+    _size : int = 0
+    _n_removed : int = 0
+    _n_materialized : int = 0 # number of entries at the last snapshot
+    _replaced_paths : set[str]
+
+
+    def __init__(self, paths : Iterable[str], values : dict[str, Iterable] = None):
+        self._columns = {path: self._create_column(path, INITIAL_CAPACITY) for path in paths}
+        self._is_removed = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._replaced_paths = set()
+        if values is not None and len(values['ids']) > 0:
+            self.append(values)
+        self._n_materialized = self._size
+        self.is_dirty = False
+
+
+    def __len__(self) -> int:
+        return self._size - self._n_removed
+
+
+    def get_paths(self) -> list[str]:
+        return list(self._columns.keys())
+
+
+    def has_path(self, path : str) -> bool:
+        return path in self._columns
+
+
+    # Appends the points and returns their positions. Paths of the buffer that are missing from the values are filled with None (or NaN).
+    def append(self, values : dict[str, Iterable]) -> np.ndarray:
+        n_points = len(values['ids'])
+        self._reserve(self._size + n_points)
+        positions = np.arange(self._size, self._size + n_points)
+        for path, column in self._columns.items():
+            column[positions] = values[path] if path in values else None
+        self._is_removed[positions] = False
+        self._size += n_points
+        self.is_dirty = True
+        return positions
+
+
+    def remove(self, positions : Iterable[int]):
+        positions = np.unique(np.asarray(positions, dtype=int))
+        positions = positions[~self._is_removed[positions]]
+        self._is_removed[positions] = True
+        self._n_removed += len(positions)
+        self._replaced_paths.update(self._columns.keys())
+        self.is_dirty = True
+
+
+    def clear(self):
+        self._size = 0
+        self._n_removed = 0
+        self._replaced_paths.update(self._columns.keys())
+        self.is_dirty = True
+
+
+    def is_removed(self, position : int) -> bool:
+        return position >= self._size or self._is_removed[position]
+
+
+    def get(self, path : str, positions : int | Iterable[int]) -> any:
+        return self._columns[path][positions]
+
+
+    def set(self, path : str, positions : int | Iterable[int], values : any):
+        self._columns[path][positions] = values
+        self._replaced_paths.add(path)
+        self.is_dirty = True
+
+
+    # Returns the positions of the points that are not removed, in the order they were added.
+    def get_positions(self) -> np.ndarray:
+        return np.flatnonzero(~self._is_removed[:self._size])
+
+
+    def get_values(self, path : str) -> np.ndarray:
+        if self._n_removed == 0:
+            return self._columns[path][:self._size].copy()
+        return self._columns[path][self.get_positions()]
+
+
+    # Returns the paths to replace entirely and the entries appended to the other paths since the last call, which marks the current state as the last snapshot.
+    # The size is read once, so all paths get the same entries and the marked snapshot holds exactly the returned entries.
+    def take_changes(self) -> tuple[Iterable[str], dict[str, np.ndarray]]:
+        size = self._size
+        replaced_paths = self._replaced_paths
+        appended_values = {path: column[self._n_materialized:size].copy() for path, column in self._columns.items() if path not in replaced_paths}
+        self._replaced_paths = set()
+        self._n_materialized = size
+        self.is_dirty = False
+        return replaced_paths, appended_values
+
+
+    # Compaction is deferred until at least half of the buffer consists of removed points, so its cost is spread over the removals.
+    def needs_compaction(self) -> bool:
+        return self._n_removed > 0 and self._n_removed >= self._size / 2
+
+
+    # Moves the remaining points to the front of the buffer. Returns the previous positions of the points, the new position of a point is its index in the returned array.
+    def compact(self) -> np.ndarray:
+        previous_positions = self.get_positions()
+        n_points = len(previous_positions)
+        for column in self._columns.values():
+            column[:n_points] = column[previous_positions]
+        self._is_removed[:n_points] = False
+        self._size = n_points
+        self._n_removed = 0
+        self._replaced_paths.update(self._columns.keys())
+        return previous_positions
+
+
+    def _reserve(self, capacity : int):
+        current_capacity = len(self._is_removed)
+        if capacity <= current_capacity:
+            return
+
+        new_capacity = max(capacity, 2 * current_capacity)
+        for path, column in self._columns.items():
+            new_column = self._create_column(path, new_capacity)
+            new_column[:self._size] = column[:self._size]
+            self._columns[path] = new_column
+        new_is_removed = np.zeros(new_capacity, dtype=bool)
+        new_is_removed[:self._size] = self._is_removed[:self._size]
+        self._is_removed = new_is_removed
+
+
+    def _create_column(self, path : str, capacity : int) -> np.ndarray:
+        if path in FLOAT_COLUMNS:
+            return np.full(capacity, np.nan)
+        return np.empty(capacity, dtype=object)
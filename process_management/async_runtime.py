@@ -0,0 +1,234 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+import numpy as np
+
+from dashboard.dashboard import Dashboard
+from dashboard.dahsboard_settings import DashboardSettings
+from projector.main_projector import Projector
+from projector.projector_plot_manager import ProjectorPlotManager
+from projector.projector_settings import ProjectorSettings
+from process_management.interval_controllers import create_update_interval_controller, create_poll_interval_controller
+from process_management.processing_utils import *
+from process_management.process_resources import apply_process_resource_settings
+from process_management.process_settings import ProcessResourceSettings
+from process_management.projector_processes import project_new_data_step, submit_training_snapshot_step, collect_training_result_step
+from process_management.training_worker import TrainingWorker
+from utils.data_mocker import get_mock_data_norm_dist
+from utils.logging import logger
+from utils.streaming.stream_watcher_factory import create_stream_watcher
+
+ASYNC_POLL_INTERVAL = 50 * 10**-3 # 50 ms
+
+
+# Single-process alternative to the ProcessManager, intended for low-rate deployments.
+# The stream reader and projector run as asyncio tasks on an event loop in a background thread, the dashboard is served from its own thread.
+# Only the model fitting runs in a separate process (the training worker). Exposes the same process controls as the ProcessManager.
+class AsyncRuntime:
+    _loop : asyncio.AbstractEventLoop
+    _loop_thread : threading.Thread
+    _locks : dict[str, threading.Lock] = {}
+    _flags : dict[str, dict[str, threading.Event]] = {}
+    _managed_objects : dict[str, any] = {}
+    _tasks : dict[str, concurrent.futures.Future] = {}
+    _loop_tasks : dict[str, asyncio.Task] = {}  # only accessed from the event loop
+    _dashboard_thread : threading.Thread = None
+
+    _projector_settings : ProjectorSettings
+    _dashboard_settings : DashboardSettings
+    _process_resource_settings : dict[str, ProcessResourceSettings] = {}
+
+
+    def __init__(self, stream_watcher_kwarg : dict, projector_kwargs : dict, projector_plot_manager_kwargs : dict, dashboard_kwargs : dict, process_resource_settings : dict[str, ProcessResourceSettings] = {}):
+        self._projector_settings = projector_kwargs["settings"]
+        self._dashboard_settings = dashboard_kwargs["settings"]
+        self._process_resource_settings = process_resource_settings
+
+        # all of ONEP, except the training worker, runs in this process
+        apply_process_resource_settings(process_resource_settings.get("manager"))
+
+        self._create_locks()
+        self._create_flags()
+        self._create_managed_objects(stream_watcher_kwarg, projector_kwargs, projector_plot_manager_kwargs)
+        if self._projector_settings.restore_checkpoint_on_launch:
+            self._managed_objects["projector"].restore_checkpoint()
+
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="onep-event-loop", daemon=True)
+        self._loop_thread.start()
+
+
+    def _create_locks(self):
+        self._locks = {
+            LOCK_NAME_MUTATE_PROJECTOR_DATA : threading.Lock(),
+        }
+
+
+    def _create_flags(self):
+        self._flags = dict(
+            projector_projecting = dict(
+                stop = threading.Event(),
+                pause = threading.Event(),
+            ),
+            projector_updating = dict(
+                stop = threading.Event(),
+                pause = threading.Event(),
+            )
+        )
+
+
+    def _create_managed_objects(self, stream_watcher_kwarg : dict, projector_kwargs : dict, projector_plot_manager_kwargs : dict):
+        self._managed_objects["streamWatcher"] = create_stream_watcher(**stream_watcher_kwarg)
+        plot_manager = ProjectorPlotManager(**projector_plot_manager_kwargs)
+        self._managed_objects["projectorPlotManager"] = plot_manager
+
+        projector_kwargs["plot_manager"] = plot_manager
+        projector_kwargs["locks"] = self._locks
+        self._managed_objects["projector"] = Projector(**projector_kwargs)
+
+
+    def start_all_processes(self):
+        for process_name in ["dashboard", "projector_projecting", "projector_updating"]:
+            self.start_process(process_name)
+
+
+    def start_process(self, process_name : str):
+        match process_name:
+            case "dashboard":
+                if self._dashboard_thread is not None and self._dashboard_thread.is_alive():
+                    logger.warning(f"Process '{process_name}' is already running, it is not started again.")
+                    return
+                self._dashboard_thread = threading.Thread(target=self._run_dashboard, name="onep-dashboard", daemon=True)
+                self._dashboard_thread.start()
+            case "projector_projecting":
+                self._start_task(process_name, self._projecting_task)
+            case "projector_updating":
+                self._start_task(process_name, self._updating_task)
+            case _:
+                raise Exception(f"Async runtime exception: unknown process '{process_name}'.")
+
+
+    # Each task gets its own stop event, so clearing the flag for a new task does not resume a previous task that is still stopping.
+    # A task that is running and was not asked to stop is not started again.
+    def _start_task(self, process_name : str, task_function):
+        previous_task = self._tasks.get(process_name)
+        if previous_task is not None and not previous_task.done() and not self._flags[process_name]["stop"].is_set():
+            logger.warning(f"Process '{process_name}' is already running, it is not started again.")
+            return
+
+        flags = dict(stop=threading.Event(), pause=self._flags[process_name]["pause"])
+        self._flags[process_name]["stop"] = flags["stop"]
+        self._tasks[process_name] = asyncio.run_coroutine_threadsafe(self._run_after_previous_task(process_name, task_function, flags), self._loop)
+
+
+    # Waits on the event loop until the previous task of the process has finished, including its cleanup after a cancellation, before running the new one.
+    async def _run_after_previous_task(self, process_name : str, task_function, flags : dict[str, threading.Event]):
+        previous_task = self._loop_tasks.get(process_name)
+        self._loop_tasks[process_name] = asyncio.current_task()
+        if previous_task is not None and not previous_task.done():
+            await asyncio.wait([previous_task])
+        await task_function(flags)
+
+
+    def terminate_process(self, process_name : str):
+        if process_name in self._tasks:
+            self._tasks[process_name].cancel()
+
+
+    def stop_process(self, process_name : str):
+        self._flags.get(process_name)["stop"].set()
+        if process_name == "projector_projecting" and process_name in self._tasks:
+            # waits for the task to close the stream watcher, so the recording is complete when the runtime exits
+            done, _ = concurrent.futures.wait([self._tasks[process_name]], PROCESS_STOP_TIMEOUT)
+            if len(done) == 0:
+                logger.warning(f"Process '{process_name}' did not stop within {PROCESS_STOP_TIMEOUT} s.")
+
+
+    def pause_process(self, process_name : str):
+        self._flags.get(process_name)["pause"].set()
+
+
+    def unpause_process(self, process_name : str):
+        self._flags.get(process_name)["pause"].clear()
+
+
+    def set_flag(self, process_name : str, flag : str):
+        self._flags.get(process_name)[flag].set()
+
+
+    def clear_flag(self, process_name : str, flag : str):
+        self._flags.get(process_name)[flag].clear()
+
+
+    def _run_dashboard(self):
+        projector = self._managed_objects["projector"]
+        plot_manager = self._managed_objects["projectorPlotManager"]
+        dashboard = Dashboard(self._dashboard_settings, projector, plot_manager, self._flags)
+        dashboard.app.run(self._dashboard_settings.host, self._dashboard_settings.port)
+
+
+    async def _projecting_task(self, flags : dict[str, threading.Event]):
+        projector = self._managed_objects["projector"]
+        stream_watcher = self._managed_objects["streamWatcher"]
+        poll_interval_controller = create_poll_interval_controller(self._projector_settings)
+        dt = 1 / self._projector_settings.sampling_frequency
+        try:
+            if self._projector_settings.use_mock_data:
+                reader_function = get_mock_data_norm_dist
+            else:
+                reader_function = self._read_stream
+                # connecting waits for the streams to be found, which would block the event loop
+                await self._loop.run_in_executor(None, stream_watcher.connect_to_streams)
+
+            while not flags["stop"].is_set():
+                while flags["pause"].is_set() and not flags["stop"].is_set():
+                    await asyncio.sleep(ASYNC_POLL_INTERVAL)
+                if flags["stop"].is_set():
+                    break
+                n_data_points = project_new_data_step(projector, reader_function, self._locks)
+                if poll_interval_controller is not None:
+                    poll_interval_controller.record_read(n_data_points)
+                    dt = poll_interval_controller.get_next_interval()
+                await asyncio.sleep(dt)
+        finally:
+            # runs on stop and on cancellation by terminate_process(), the recording ends with the last read block
+            await self._loop.run_in_executor(None, stream_watcher.close)
+
+
+    async def _updating_task(self, flags : dict[str, threading.Event]):
+        projector = self._managed_objects["projector"]
+        interval_controller = create_update_interval_controller(self._projector_settings)
+        training_worker = TrainingWorker(self._projector_settings.training_preemption_policy, self._process_resource_settings.get("training_worker"))
+        training_worker.start()
+
+        dt = 1 / self._projector_settings.model_update_frequency
+        tlast = time.monotonic()
+        try:
+            while not flags["stop"].is_set():
+                while flags["pause"].is_set():
+                    await asyncio.sleep(ASYNC_POLL_INTERVAL)
+
+                now = time.monotonic()
+                if now - tlast > dt:
+                    next_dt = submit_training_snapshot_step(projector, training_worker, interval_controller, self._locks)
+                    if next_dt is not None:
+                        dt = next_dt
+                    tlast = now
+
+                next_dt = collect_training_result_step(projector, training_worker, interval_controller, self._locks)
+                if next_dt is not None:
+                    dt = next_dt
+                await asyncio.sleep(ASYNC_POLL_INTERVAL)
+        finally:
+            training_worker.stop()
+
+
+    def _read_stream(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        data, time_points, labels = self._managed_objects["streamWatcher"].read()
+        # without a manager proxy in between, the read data may be a view on the stream watcher's buffers, which are overwritten by later samples
+        if data is not None:
+            data = np.array(data)
+            time_points = np.array(time_points)
+            labels = np.array(labels) if labels is not None else None
+        return data, time_points, labels
@@ -0,0 +1,138 @@
+import time
+import numpy as np
+
+from projector.projector_settings import ProjectorSettings
+from utils.logging import logger
+
+
+# Chooses the interval between model updates such that fitting stays within a CPU duty-cycle budget.
+# The duty cycle is expressed in CPU seconds per second of wall time, i.e. as a fraction of a single core.
+class AdaptiveUpdateIntervalController():
+    _min_interval_s : float
+    _max_interval_s : float
+    _cpu_duty_cycle : float
+    _smoothing_factor : float
+
+    _wall_time_estimate_s : float | None = None
+    _cpu_time_estimate_s : float | None = None
+
+
+    def __init__(self, min_interval_s : float, max_interval_s : float, cpu_duty_cycle : float, smoothing_factor : float = 0.3):
+        if cpu_duty_cycle is None or cpu_duty_cycle <= 0:
+            raise Exception(f"Update interval exception: the CPU duty cycle must be greater than 0, provided value: {cpu_duty_cycle}")
+        if max_interval_s < min_interval_s:
+            raise Exception(f"Update interval exception: the maximum interval ({max_interval_s}s) is smaller than the minimum interval ({min_interval_s}s).")
+
+        self._min_interval_s = min_interval_s
+        self._max_interval_s = max_interval_s
+        self._cpu_duty_cycle = cpu_duty_cycle
+        self._smoothing_factor = smoothing_factor
+
+
+    def record_fit(self, wall_time_s : float, cpu_time_s : float):
+        if self._cpu_time_estimate_s is None:
+            self._wall_time_estimate_s = wall_time_s
+            self._cpu_time_estimate_s = cpu_time_s
+            return
+
+        # exponential moving average, fit cost grows with the amount of historic data so older measurements are phased out
+        self._wall_time_estimate_s += self._smoothing_factor * (wall_time_s - self._wall_time_estimate_s)
+        self._cpu_time_estimate_s += self._smoothing_factor * (cpu_time_s - self._cpu_time_estimate_s)
+
+
+    # A cancelled fit would have taken longer than it ran, so its run time is a lower bound of the wall time estimate. Its CPU time is not measured.
+    def record_cancelled_fit(self, run_time_s : float):
+        if self._wall_time_estimate_s is None or run_time_s > self._wall_time_estimate_s:
+            self._wall_time_estimate_s = run_time_s
+
+
+    def get_next_interval(self) -> float:
+        if self._wall_time_estimate_s is None:
+            return self._min_interval_s
+
+        # a full update cycle has to last cpu_time / duty_cycle to hold the budget, and may not be shorter than a fit itself
+        interval = self._wall_time_estimate_s
+        if self._cpu_time_estimate_s is not None:
+            interval = max(self._cpu_time_estimate_s / self._cpu_duty_cycle, interval)
+        interval = float(np.clip(interval, self._min_interval_s, self._max_interval_s))
+        logger.debug(f"next model update interval: {interval:.2f}s (fit wall time: {self._wall_time_estimate_s:.2f}s, fit cpu time: {self._cpu_time_estimate_s or 0:.2f}s)")
+        return interval
+
+
+# Chooses the interval between stream reads from the observed arrival rate of data points, such that a read returns about the target batch size.
+# The interval is capped by the target latency, so data points do not wait longer than that at low rates.
+class AdaptivePollIntervalController():
+    _min_interval_s : float
+    _max_interval_s : float
+    _target_batch_size : int
+    _target_latency_s : float | None
+    _smoothing_factor : float
+
+    _arrival_rate_estimate : float | None = None
+    _last_read_time : float | None = None
+
+
+    def __init__(self, min_interval_s : float, max_interval_s : float, target_batch_size : int, target_latency_s : float | None = None, smoothing_factor : float = 0.3):
+        if target_batch_size is None or target_batch_size <= 0:
+            raise Exception(f"Poll interval exception: the target batch size must be greater than 0, provided value: {target_batch_size}")
+        if max_interval_s < min_interval_s:
+            raise Exception(f"Poll interval exception: the maximum interval ({max_interval_s}s) is smaller than the minimum interval ({min_interval_s}s).")
+
+        self._min_interval_s = min_interval_s
+        self._max_interval_s = max_interval_s
+        self._target_batch_size = target_batch_size
+        self._target_latency_s = target_latency_s
+        self._smoothing_factor = smoothing_factor
+
+
+    def record_read(self, n_data_points : int):
+        now = time.monotonic()
+        if self._last_read_time is None:
+            self._last_read_time = now
+            return
+
+        elapsed_s = now - self._last_read_time
+        self._last_read_time = now
+        if elapsed_s <= 0:
+            return
+
+        arrival_rate = n_data_points / elapsed_s
+        if self._arrival_rate_estimate is None:
+            self._arrival_rate_estimate = arrival_rate
+        else:
+            self._arrival_rate_estimate += self._smoothing_factor * (arrival_rate - self._arrival_rate_estimate)
+
+
+    def get_next_interval(self) -> float:
+        if self._arrival_rate_estimate is None:
+            return self._min_interval_s
+
+        # empty reads lower the rate estimate, which stretches the interval up to the maximum
+        if self._arrival_rate_estimate > 0:
+            interval = self._target_batch_size / self._arrival_rate_estimate
+        else:
+            interval = self._max_interval_s
+        if self._target_latency_s is not None:
+            interval = min(interval, self._target_latency_s)
+        return float(np.clip(interval, self._min_interval_s, self._max_interval_s))
+
+
+def create_update_interval_controller(projector_settings : ProjectorSettings) -> AdaptiveUpdateIntervalController | None:
+    if not projector_settings.adaptive_model_update:
+        return None
+    return AdaptiveUpdateIntervalController(
+        1 / projector_settings.model_update_frequency,
+        1 / projector_settings.min_model_update_frequency,
+        projector_settings.training_cpu_duty_cycle
+    )
+
+
+def create_poll_interval_controller(projector_settings : ProjectorSettings) -> AdaptivePollIntervalController | None:
+    if not projector_settings.adaptive_sampling:
+        return None
+    return AdaptivePollIntervalController(
+        1 / projector_settings.sampling_frequency,
+        1 / projector_settings.min_sampling_frequency,
+        projector_settings.target_batch_size,
+        projector_settings.target_read_latency_s
+    )
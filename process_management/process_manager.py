@@ -1,4 +1,7 @@
 import multiprocessing
+import threading
+import time
+import uuid
 from multiprocessing.managers import BaseManager
 
 from projector.main_projector import Projector
@@ -7,8 +10,12 @@ from dashboard.dahsboard_settings import DashboardSettings
 from projector.projector_settings import ProjectorSettings
 from process_management.projector_processes import create_living_process_project, create_living_process_update_projector
 from process_management.dashboard_processes import create_process_dashboard
+from process_management.interval_controllers import create_update_interval_controller, create_poll_interval_controller
+from process_management.process_resources import apply_process_resource_settings
+from process_management.process_settings import ProcessResourceSettings, SupervisorSettings
 from process_management.processing_utils import *
-from utils.streaming.stream_watcher import StreamWatcher
+from utils.logging import logger
+from utils.streaming.stream_watcher_factory import create_stream_watcher
 
 
 class ProcessManager:
@@ -17,17 +24,46 @@ class ProcessManager:
     _flags : dict[str, dict[str, multiprocessing.Event]] = {}
     _managed_objects : dict[str, any] = {}
     _subprocesses : dict[str, multiprocessing.Process] = {}
+    _process_resource_settings : dict[str, ProcessResourceSettings] = {}
+
+    _stream_watcher_kwarg : dict
+    _projector_kwargs : dict
+    _projector_plot_manager_kwargs : dict
+    _dashboard_kwargs : dict
+
+    _session_id : str
+    _supervisor_settings : SupervisorSettings
+    _supervisor_thread : threading.Thread = None
+    _supervisor_lock : threading.Lock
+    _supervised_processes : set[str]
+    _restart_times : dict[str, list[float]]
+
+
+    def __init__(self, stream_watcher_kwarg : dict, projector_kwargs : dict, projector_plot_manager_kwargs : dict, dashboard_kwargs : dict, process_resource_settings : dict[str, ProcessResourceSettings] = {}, supervisor_settings : SupervisorSettings = SupervisorSettings()):
+        self._process_resource_settings = process_resource_settings
+        self._stream_watcher_kwarg = stream_watcher_kwarg
+        self._projector_kwargs = projector_kwargs
+        self._projector_plot_manager_kwargs = projector_plot_manager_kwargs
+        self._dashboard_kwargs = dashboard_kwargs
+        self._supervisor_settings = supervisor_settings
+        self._session_id = str(uuid.uuid4())
+        self._supervisor_lock = threading.Lock()
+        self._supervised_processes = set()
+        self._restart_times = {}
 
-
-    def __init__(self, stream_watcher_kwarg : dict, projector_kwargs : dict, projector_plot_manager_kwargs : dict, dashboard_kwargs : dict):
         self._register_proxy_classes()
-        self._manager = BaseManager()
-        self._manager.start()
+        self._start_manager()
         self._create_locks()
         self._create_flags()
         self._create_managed_objects(stream_watcher_kwarg, projector_kwargs, projector_plot_manager_kwargs)
+        if projector_kwargs["settings"].restore_checkpoint_on_launch and "projector" in self._managed_objects:
+            self._managed_objects["projector"].restore_checkpoint()
         self._create_subprocesses(projector_kwargs["settings"], dashboard_kwargs["settings"])
 
+        if supervisor_settings.enabled:
+            self._supervisor_thread = threading.Thread(target=self._supervise, name="onep-supervisor", daemon=True)
+            self._supervisor_thread.start()
+
 
     def _register_proxy_classes(self):
         BaseManager.register('dict', dict)
@@ -35,12 +71,17 @@ class ProcessManager:
         BaseManager.register('Lock', multiprocessing.Lock)
         BaseManager.register("Projector", Projector)
         BaseManager.register("ProjectorPlotManager", ProjectorPlotManager)
-        BaseManager.register("StreamWatcher", StreamWatcher)
+        BaseManager.register("StreamWatcher", create_stream_watcher)
+
+
+    def _start_manager(self):
+        self._manager = BaseManager()
+        # the managed objects live in the manager's server process, so their calls (e.g. projecting data) are limited by its settings
+        self._manager.start(apply_process_resource_settings, (self._process_resource_settings.get("manager"),))
 
 
     def _create_locks(self):
         self._locks[LOCK_NAME_MUTATE_PROJECTOR_DATA] = self._manager.Lock()
-        self._locks[LOCK_NAME_PLOT_MANAGER] = self._manager.Lock()
 
 
     def _create_flags(self):
@@ -67,45 +108,91 @@ class ProcessManager:
         if projector_kwargs != None and len(projector_kwargs) > 0 and stream_watcher is not None and plot_manager is not None:
             projector_kwargs["plot_manager"] = plot_manager
             projector_kwargs["locks"] = self._locks
+            # a projector recreated after a manager crash keeps the session, so it restores the checkpoints saved by its predecessor
+            projector_kwargs["session_id"] = self._session_id
             projector = self._manager.Projector(**projector_kwargs)
             self._managed_objects["projector"] = projector
 
 
     def _create_subprocesses(self, projector_settings : ProjectorSettings, dashboard_settings : DashboardSettings):
-        if "projector" in self._managed_objects:
-            projector = self._managed_objects["projector"]
-            stream_watcher = self._managed_objects["streamWatcher"]
-            use_mock_data = projector_settings.use_mock_data
-            self._subprocesses["projector_projecting"] = create_living_process_project(projector, stream_watcher, self._flags["projector_projecting"], self._locks, use_mock_data)
-            self._subprocesses["projector_updating"] = create_living_process_update_projector(projector, self._flags["projector_updating"], self._locks)
-
-        if "projector" in self._managed_objects and dashboard_settings is not None:
-            plot_manager = self._managed_objects["projectorPlotManager"]
-            projector = self._managed_objects["projector"]
-            self._subprocesses["dashboard"] = create_process_dashboard(dashboard_settings, projector, plot_manager, self._flags)
+        for process_name in ["projector_projecting", "projector_updating", "dashboard"]:
+            self._create_subprocess(process_name, projector_settings, dashboard_settings)
+
+
+    # multiprocessing.Process objects can only be started once, a process is recreated whenever it is (re)started after it ran
+    def _create_subprocess(self, process_name : str, projector_settings : ProjectorSettings, dashboard_settings : DashboardSettings):
+        if "projector" not in self._managed_objects:
+            return
+        projector = self._managed_objects["projector"]
+
+        match process_name:
+            case "projector_projecting":
+                stream_watcher = self._managed_objects["streamWatcher"]
+                use_mock_data = projector_settings.use_mock_data
+                poll_interval_controller = create_poll_interval_controller(projector_settings)
+                self._subprocesses["projector_projecting"] = create_living_process_project(projector, stream_watcher, self._flags["projector_projecting"], self._locks, use_mock_data, self._process_resource_settings.get("projector_projecting"), poll_interval_controller)
+            case "projector_updating":
+                interval_controller = create_update_interval_controller(projector_settings)
+                self._subprocesses["projector_updating"] = create_living_process_update_projector(
+                    projector,
+                    self._flags["projector_updating"],
+                    self._locks,
+                    projector_settings.training_preemption_policy,
+                    interval_controller,
+                    self._process_resource_settings.get("projector_updating"),
+                    self._process_resource_settings.get("training_worker")
+                )
+            case "dashboard":
+                if dashboard_settings is not None:
+                    plot_manager = self._managed_objects["projectorPlotManager"]
+                    self._subprocesses["dashboard"] = create_process_dashboard(dashboard_settings, projector, plot_manager, self._flags, self._process_resource_settings.get("dashboard"))
 
 
     def _init_new_event(self) -> multiprocessing.Event:
         event = self._manager.Event()
         event.clear()
         return event
-    
+
 
     def start_all_processes(self):
-        for process in self._subprocesses.values():
-            process.start()
-    
+        for process_name in list(self._subprocesses.keys()):
+            self.start_process(process_name)
+
 
     def start_process(self, process_name : str):
-        self._subprocesses[process_name].start()
+        with self._supervisor_lock:
+            if self._subprocesses[process_name].exitcode is not None:
+                self._create_subprocess(process_name, self._projector_kwargs["settings"], self._dashboard_kwargs["settings"])
+            if process_name in self._flags:
+                self._flags[process_name]["stop"].clear()
+            self._subprocesses[process_name].start()
+            self._supervised_processes.add(process_name)
 
 
     def terminate_process(self, process_name : str):
-        self._subprocesses[process_name].terminate()
+        with self._supervisor_lock:
+            self._supervised_processes.discard(process_name)
+            self._subprocesses[process_name].terminate()
+            if process_name == "projector_projecting":
+                self._subprocesses[process_name].join()
+                self._close_stream_watcher()
 
 
     def stop_process(self, process_name : str):
         self._flags.get(process_name)["stop"].set()
+        if process_name == "projector_projecting":
+            # the stream watcher is only closed once the projecting process no longer reads from it, so its recording ends with the last read block
+            process = self._subprocesses[process_name]
+            if process.pid is not None:
+                process.join(PROCESS_STOP_TIMEOUT)
+                if process.is_alive():
+                    logger.warning(f"Process '{process_name}' did not stop within {PROCESS_STOP_TIMEOUT} s, the recording is closed while it may still read.")
+            self._close_stream_watcher()
+
+
+    def _close_stream_watcher(self):
+        if "streamWatcher" in self._managed_objects:
+            self._managed_objects["streamWatcher"].close()
 
 
     def pause_process(self, process_name : str):
@@ -124,4 +211,81 @@ class ProcessManager:
         self._flags.get(process_name)[flag].clear()
 
 
-    
\ No newline at end of file
+    '''
+    Supervision
+    '''
+
+    def _supervise(self):
+        while True:
+            time.sleep(self._supervisor_settings.poll_interval_s)
+            try:
+                with self._supervisor_lock:
+                    if not self._manager._process.is_alive():
+                        self._restart_manager()
+                    else:
+                        for process_name in list(self._supervised_processes):
+                            if self._has_crashed(process_name):
+                                self._restart_process(process_name)
+            except Exception as e:
+                print(f"supervisor exception: {e}")
+                logger.error(f"supervisor exception: {e}")
+
+
+    # A process that exits after its stop flag was set has stopped on request, any other exit is considered a crash.
+    def _has_crashed(self, process_name : str) -> bool:
+        process = self._subprocesses[process_name]
+        if process.is_alive() or process.exitcode is None:
+            return False
+        if process_name in self._flags and self._flags[process_name]["stop"].is_set():
+            self._supervised_processes.discard(process_name)
+            return False
+        return True
+
+
+    def _restart_process(self, process_name : str):
+        exitcode = self._subprocesses[process_name].exitcode
+        if not self._register_restart(process_name):
+            logger.error(f"Process '{process_name}' exited with code {exitcode} and exceeded {self._supervisor_settings.max_restarts} restarts within {self._supervisor_settings.restart_window_s} s, it will not be restarted.")
+            self._supervised_processes.discard(process_name)
+            return
+
+        logger.warning(f"Process '{process_name}' exited with code {exitcode}, restarting.")
+        self._create_subprocess(process_name, self._projector_kwargs["settings"], self._dashboard_kwargs["settings"])
+        self._subprocesses[process_name].start()
+
+
+    # The managed objects, flags, and locks live in the manager process and are lost with it.
+    # All objects are recreated, the projector is restored from its last checkpoint, and all processes that were running are restarted with the new proxies.
+    def _restart_manager(self):
+        if not self._register_restart("manager"):
+            logger.error(f"Manager process exceeded {self._supervisor_settings.max_restarts} restarts within {self._supervisor_settings.restart_window_s} s, it will not be restarted.")
+            self._supervised_processes.clear()
+            return
+
+        logger.warning(f"Manager process exited with code {self._manager._process.exitcode}, restarting all processes.")
+        for process_name in self._supervised_processes:
+            if self._subprocesses[process_name].is_alive():
+                self._subprocesses[process_name].terminate()
+                self._subprocesses[process_name].join()
+
+        self._start_manager()
+        self._create_locks()
+        self._create_flags()
+        self._create_managed_objects(self._stream_watcher_kwarg, self._projector_kwargs, self._projector_plot_manager_kwargs)
+        if "projector" in self._managed_objects:
+            self._managed_objects["projector"].restore_checkpoint(only_own_session=True)
+        self._create_subprocesses(self._projector_kwargs["settings"], self._dashboard_kwargs["settings"])
+        for process_name in self._supervised_processes:
+            self._subprocesses[process_name].start()
+
+
+    # Returns False when the process was restarted too often within the restart window.
+    def _register_restart(self, process_name : str) -> bool:
+        now = time.monotonic()
+        restart_times = [t for t in self._restart_times.get(process_name, []) if now - t < self._supervisor_settings.restart_window_s]
+        if len(restart_times) >= self._supervisor_settings.max_restarts:
+            self._restart_times[process_name] = restart_times
+            return False
+        restart_times.append(now)
+        self._restart_times[process_name] = restart_times
+        return True
@@ -0,0 +1,70 @@
+import os
+import sys
+
+from process_management.process_settings import ProcessResourceSettings
+from utils.logging import logger
+
+THREAD_COUNT_ENVIRONMENT_VARIABLES = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+# Should be called at the very start of a process, before any of the heavy libraries spin up their thread pools.
+def apply_process_resource_settings(settings : ProcessResourceSettings | None):
+    if settings is None:
+        return
+
+    if settings.cpu_affinity is not None and len(settings.cpu_affinity) > 0:
+        _set_cpu_affinity(settings.cpu_affinity)
+
+    num_threads = settings.num_threads
+    if num_threads is None and settings.cpu_affinity is not None and len(settings.cpu_affinity) > 0:
+        num_threads = len(settings.cpu_affinity)
+    if num_threads is not None:
+        _limit_thread_pools(num_threads)
+
+
+def _set_cpu_affinity(cpu_affinity : list[int]):
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_affinity)
+        return
+
+    # os.sched_setaffinity is only available on Linux, fall back to psutil on other platforms
+    try:
+        import psutil
+        psutil.Process().cpu_affinity(cpu_affinity)
+    except ImportError:
+        logger.warning(f"Unable to set the CPU affinity of process {os.getpid()}: not supported on this platform without psutil.")
+
+
+def _limit_thread_pools(num_threads : int):
+    for variable in THREAD_COUNT_ENVIRONMENT_VARIABLES:
+        os.environ[variable] = str(num_threads)
+
+    # libraries that are already imported (e.g. inherited when the process was forked) no longer read the environment variables
+    if "numba" in sys.modules:
+        numba = sys.modules["numba"]
+        numba.set_num_threads(min(num_threads, numba.config.NUMBA_NUM_THREADS))
+    else:
+        # numba refuses a changed NUMBA_NUM_THREADS once its threads are launched, so it is only set before import
+        os.environ["NUMBA_NUM_THREADS"] = str(num_threads)
+
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        torch.set_num_threads(num_threads)
+        try:
+            torch.set_num_interop_threads(num_threads)
+        except RuntimeError:
+            logger.debug("torch inter-op thread pool already started, cannot limit its size.")
+
+    if "tensorflow" in sys.modules:
+        tensorflow = sys.modules["tensorflow"]
+        try:
+            tensorflow.config.threading.set_intra_op_parallelism_threads(num_threads)
+            tensorflow.config.threading.set_inter_op_parallelism_threads(num_threads)
+        except RuntimeError:
+            logger.debug("tensorflow already initialized, cannot limit its thread pool sizes.")
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=num_threads)
+    except ImportError:
+        pass
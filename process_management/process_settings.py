@@ -0,0 +1,13 @@
+# Resource limits applied to a single ONEP process when it starts.
+# Process names: manager, projector_projecting, projector_updating, training_worker, dashboard
+class ProcessResourceSettings():
+    cpu_affinity : list[int] | None = None  # cores the process may run on, None to leave unrestricted
+    num_threads : int | None = None         # size of the numba, OpenMP/BLAS, torch and tensorflow thread pools, defaults to the number of cores in cpu_affinity
+
+
+# Settings of the supervisor thread of the ProcessManager, which restarts crashed processes.
+class SupervisorSettings():
+    enabled : bool = True
+    poll_interval_s : float = 1
+    max_restarts : int = 5          # restarts allowed per process within restart_window_s, after which the process is left down
+    restart_window_s : float = 60
@@ -1,8 +1,12 @@
 import multiprocessing
 
 SLEEPING_DURATION = 1 * 10**-3 # 1 ms
+PROCESS_STOP_TIMEOUT = 10 # s
 LOCK_NAME_MUTATE_PROJECTOR_DATA = "mutate_projector_data"
-LOCK_NAME_PLOT_MANAGER = "plot_manager"
+
+RUNTIME_MODE_MULTIPROCESS = "multiprocess"
+RUNTIME_MODE_ASYNCIO = "asyncio"
+RUNTIME_MODES = [RUNTIME_MODE_MULTIPROCESS, RUNTIME_MODE_ASYNCIO]
 
 def create_subprocess(target, kwargs : dict[str, any] = {}) -> multiprocessing.Process:
     process = multiprocessing.Process(
@@ -1,14 +1,28 @@
 import multiprocessing
+import signal
+import sys
 import time
 
 from process_management.processing_utils import *
 from projector.main_projector import Projector
+from process_management.training_worker import TrainingWorker, PREEMPTION_POLICY_LATEST_WINS
+from process_management.interval_controllers import AdaptiveUpdateIntervalController, AdaptivePollIntervalController
+from process_management.process_resources import apply_process_resource_settings
+from process_management.process_settings import ProcessResourceSettings
 from utils.logging import logger
 from utils.streaming.stream_watcher import StreamWatcher
 from utils.data_mocker import get_mock_data_norm_dist, get_mock_data_arrays
 
 
-def create_living_process_project(projector : Projector, stream_watcher : StreamWatcher, flags : dict[str, multiprocessing.Event], locks : dict[str, multiprocessing.Lock], use_mock_data : bool = False) -> multiprocessing.Process:
+def create_living_process_project(
+        projector : Projector,
+        stream_watcher : StreamWatcher,
+        flags : dict[str, multiprocessing.Event],
+        locks : dict[str, multiprocessing.Lock],
+        use_mock_data : bool = False,
+        resource_settings : ProcessResourceSettings | None = None,
+        poll_interval_controller : AdaptivePollIntervalController | None = None
+        ) -> multiprocessing.Process:
     if use_mock_data:
         reader_function = get_mock_data_norm_dist
         connect_to_stream = False
@@ -17,15 +31,31 @@ def create_living_process_project(projector : Projector, stream_watcher : Stream
         connect_to_stream = True
 
     process_target = _projecting_loop
-    kwargs = dict(projector=projector, stream_watcher=stream_watcher, reader_function=reader_function, flags=flags, locks=locks, connect_to_stream=connect_to_stream)
+    kwargs = dict(projector=projector, stream_watcher=stream_watcher, reader_function=reader_function, flags=flags, locks=locks, connect_to_stream=connect_to_stream, resource_settings=resource_settings, poll_interval_controller=poll_interval_controller)
     subprocess = create_subprocess(process_target, kwargs=kwargs)
 
     return subprocess
 
 
-def create_living_process_update_projector(projector : Projector, flags : dict[str, multiprocessing.Event], locks : dict[str, multiprocessing.Lock]) -> multiprocessing.Process:
+def create_living_process_update_projector(
+        projector : Projector,
+        flags : dict[str, multiprocessing.Event],
+        locks : dict[str, multiprocessing.Lock],
+        preemption_policy : str = PREEMPTION_POLICY_LATEST_WINS,
+        interval_controller : AdaptiveUpdateIntervalController | None = None,
+        resource_settings : ProcessResourceSettings | None = None,
+        training_worker_resource_settings : ProcessResourceSettings | None = None
+        ) -> multiprocessing.Process:
     process_target = _update_projector_loop
-    kwargs = dict(projector=projector, flags=flags, locks=locks)
+    kwargs = dict(
+        projector=projector,
+        flags=flags,
+        locks=locks,
+        preemption_policy=preemption_policy,
+        interval_controller=interval_controller,
+        resource_settings=resource_settings,
+        training_worker_resource_settings=training_worker_resource_settings
+    )
     subprocess = create_subprocess(process_target, kwargs=kwargs)
 
     return subprocess
@@ -37,9 +67,12 @@ def _projecting_loop(
     reader_function,
     flags : dict[str, multiprocessing.Event] = {},
     locks : dict[str, multiprocessing.Lock] = {},
-    connect_to_stream = True
+    connect_to_stream = True,
+    resource_settings : ProcessResourceSettings | None = None,
+    poll_interval_controller : AdaptivePollIntervalController | None = None
     ):
 
+    apply_process_resource_settings(resource_settings)
     freq_hz = projector._getvalue()._settings.sampling_frequency
     dt = 1 / freq_hz
     tlast = time.time_ns()
@@ -50,43 +83,121 @@ def _projecting_loop(
     while not flags["stop"].is_set():
         now = time.time_ns()
         if now - tlast > dt * 10**9:
-            while flags["pause"].is_set():
+            while flags["pause"].is_set() and not flags["stop"].is_set():
                 time.sleep(SLEEPING_DURATION)
-            try:
-                data, time_points, labels = reader_function()
-                projector.project_new_data(data, time_points, labels)
-            except Exception as e:
-                print(f"projecting exception: {e}")
-                logger.error(e)
-                _release_locks(locks)
+            if flags["stop"].is_set():
+                break
+            n_data_points = project_new_data_step(projector, reader_function, locks)
             tlast = now
 
+            if poll_interval_controller is not None:
+                poll_interval_controller.record_read(n_data_points)
+                dt = poll_interval_controller.get_next_interval()
+        time.sleep(SLEEPING_DURATION)
+
 
 def _update_projector_loop(
     projector : Projector,
     flags : dict[multiprocessing.Event] = {},
-    locks : dict[str, multiprocessing.Lock] = {}
+    locks : dict[str, multiprocessing.Lock] = {},
+    preemption_policy : str = PREEMPTION_POLICY_LATEST_WINS,
+    interval_controller : AdaptiveUpdateIntervalController | None = None,
+    resource_settings : ProcessResourceSettings | None = None,
+    training_worker_resource_settings : ProcessResourceSettings | None = None
     ):
 
+    apply_process_resource_settings(resource_settings)
     freq_hz = projector._getvalue()._settings.model_update_frequency
     dt = 1 / freq_hz
     tlast = time.time_ns()
 
-    while not flags["stop"].is_set():
-        now = time.time_ns()
-        if now - tlast > dt * 10**9:
-            while flags["pause"].is_set():
-                time.sleep(SLEEPING_DURATION)
-            try:
-                projector.update_projector()
-            except Exception as e:
-                print(f"projector updating exception: {e}")
-                logger.error(e)
-                _release_locks(locks)
-            tlast = now
+    # model fitting is done by a separate worker process, so that fits made obsolete by newer data can be cancelled
+    training_worker = TrainingWorker(preemption_policy, training_worker_resource_settings)
+    # terminate() sends SIGTERM, which is raised as SystemExit so the training worker is stopped on the way out instead of being orphaned
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    training_worker.start()
+
+    try:
+        while not flags["stop"].is_set():
+            now = time.time_ns()
+            if now - tlast > dt * 10**9:
+                while flags["pause"].is_set():
+                    time.sleep(SLEEPING_DURATION)
+                next_dt = submit_training_snapshot_step(projector, training_worker, interval_controller, locks)
+                if next_dt is not None:
+                    dt = next_dt
+                tlast = now
+
+            next_dt = collect_training_result_step(projector, training_worker, interval_controller, locks)
+            if next_dt is not None:
+                dt = next_dt
+            time.sleep(SLEEPING_DURATION)
+    finally:
+        training_worker.stop()
+
+
+def _exit_on_sigterm(signum, frame):
+    sys.exit(128 + signum)
+
+
+# -------------- loop steps, shared with the asyncio runtime --------------
+
+# Returns the number of data points read.
+def project_new_data_step(projector : Projector, reader_function, locks : dict[str, multiprocessing.Lock] = {}) -> int:
+    try:
+        data, time_points, labels = reader_function()
+        projector.project_new_data(data, time_points, labels)
+        return len(data) if data is not None else 0
+    except Exception as e:
+        print(f"projecting exception: {e}")
+        logger.error(e)
+        _release_locks(locks)
+    return 0
+
+
+# Submits a snapshot of the training data to the training worker. Returns the next update interval when a fit was cancelled and the interval controller picked a new one.
+def submit_training_snapshot_step(projector : Projector, training_worker : TrainingWorker, interval_controller : AdaptiveUpdateIntervalController | None = None, locks : dict[str, multiprocessing.Lock] = {}) -> float | None:
+    try:
+        snapshot = projector.get_training_snapshot()
+        if snapshot is None:
+            return None
+
+        cancelled_fit_run_time_s = training_worker.submit(snapshot)
+        # a fit that keeps being cancelled produces no result, its run time is the only measure of the fit cost
+        if cancelled_fit_run_time_s is not None and interval_controller is not None:
+            interval_controller.record_cancelled_fit(cancelled_fit_run_time_s)
+            return interval_controller.get_next_interval()
+    except Exception as e:
+        print(f"projector updating exception: {e}")
+        logger.error(e)
+        _release_locks(locks)
+    return None
+
+
+# Applies the result of a finished fit. Returns the next update interval when the interval controller picked a new one.
+def collect_training_result_step(projector : Projector, training_worker : TrainingWorker, interval_controller : AdaptiveUpdateIntervalController | None = None, locks : dict[str, multiprocessing.Lock] = {}) -> float | None:
+    try:
+        result = training_worker.poll()
+        if result is None:
+            return None
+
+        if result.error is not None:
+            logger.error(f"fitting training snapshot {result.snapshot_id} failed: {result.error}")
+        else:
+            projector.apply_trained_model(result.model, result.snapshot_id)
+
+        if interval_controller is not None:
+            interval_controller.record_fit(result.wall_time_s, result.cpu_time_s)
+            return interval_controller.get_next_interval()
+    except Exception as e:
+        print(f"projector updating exception: {e}")
+        logger.error(e)
+        _release_locks(locks)
+    return None
 
 
 def _release_locks(locks : dict[str, multiprocessing.Lock]):
     for lock in locks.values():
-        if lock.acquire(block=False):
+        # positional argument, the keyword differs between multiprocessing and threading locks
+        if lock.acquire(False):
             lock.release()
\ No newline at end of file
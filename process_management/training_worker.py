@@ -0,0 +1,168 @@
+import multiprocessing
+import queue
+import time
+
+from process_management.processing_utils import *
+from process_management.process_resources import apply_process_resource_settings
+from process_management.process_settings import ProcessResourceSettings
+from projector.main_projector import fit_projection_model
+from projector.training_snapshot import TrainingSnapshot, TrainingResult
+from utils.logging import logger
+
+# latest-wins: a newly submitted snapshot cancels the fit that is currently running, once that fit has run for its minimum run time. Until then the snapshot is queued as with finish-current.
+# finish-current: the running fit is completed, only the newest of the snapshots submitted in the meantime is fitted afterwards.
+PREEMPTION_POLICY_LATEST_WINS = "latest-wins"
+PREEMPTION_POLICY_FINISH_CURRENT = "finish-current"
+PREEMPTION_POLICIES = [PREEMPTION_POLICY_LATEST_WINS, PREEMPTION_POLICY_FINISH_CURRENT]
+
+# The minimum run time of a fit is the expected fit time times the factor: the wall time of the last completed fit, or the run time of the last cancelled fit when that was longer.
+# As the factor is greater than 1, every cancellation extends the run time granted to the next fit, so fits that take longer than the update interval are not preempted indefinitely.
+MIN_PREEMPTION_RUN_TIME_S = 1.0
+PREEMPTION_RUN_TIME_FACTOR = 1.5
+
+
+class TrainingWorker():
+    _preemption_policy : str
+    _resource_settings : ProcessResourceSettings | None
+    _process : multiprocessing.Process = None
+    _snapshot_queue : multiprocessing.Queue = None
+    _result_queue : multiprocessing.Queue = None
+
+    _running_snapshot_id : int | None = None
+    _running_since : float | None = None
+    _pending_snapshot : TrainingSnapshot | None = None
+
+    _expected_fit_time_s : float | None = None
+    _n_consecutive_preemptions : int = 0
+
+
+    def __init__(self, preemption_policy : str = PREEMPTION_POLICY_LATEST_WINS, resource_settings : ProcessResourceSettings | None = None):
+        if preemption_policy not in PREEMPTION_POLICIES:
+            raise Exception(f"Training worker exception: unknown preemption policy '{preemption_policy}'. Supported policies: {PREEMPTION_POLICIES}")
+        self._preemption_policy = preemption_policy
+        self._resource_settings = resource_settings
+
+
+    def start(self):
+        self._snapshot_queue = multiprocessing.Queue()
+        self._result_queue = multiprocessing.Queue()
+        self._process = create_subprocess(_training_worker_loop, kwargs=dict(snapshot_queue=self._snapshot_queue, result_queue=self._result_queue, resource_settings=self._resource_settings))
+        self._process.start()
+        self._running_snapshot_id = None
+
+
+    def stop(self):
+        if self._process is None:
+            return
+        self._process.terminate()
+        self._process.join()
+        self._process = None
+        self._running_snapshot_id = None
+        self._pending_snapshot = None
+
+
+    def is_busy(self) -> bool:
+        return self._running_snapshot_id is not None
+
+
+    # Returns the run time of the fit that was cancelled in favor of the snapshot, or None when no fit was cancelled.
+    def submit(self, snapshot : TrainingSnapshot) -> float | None:
+        if not self.is_busy():
+            self._dispatch(snapshot)
+            return None
+
+        if self._preemption_policy == PREEMPTION_POLICY_LATEST_WINS and self._get_run_time() >= self._get_min_preemption_run_time():
+            self._n_consecutive_preemptions += 1
+            logger.warning(f"Preempting fit of training snapshot {self._running_snapshot_id} after {self._get_run_time():.2f}s in favor of snapshot {snapshot.snapshot_id}, {self._n_consecutive_preemptions} fit(s) in a row were preempted.")
+            run_time = self.cancel()
+            self._dispatch(snapshot)
+            return run_time
+
+        if self._pending_snapshot is not None:
+            logger.debug(f"Discarding queued training snapshot {self._pending_snapshot.snapshot_id} in favor of snapshot {snapshot.snapshot_id}.")
+        self._pending_snapshot = snapshot
+        return None
+
+
+    # Terminates the running fit, if any. The worker process is replaced so it is ready for the next snapshot. Returns the run time of the cancelled fit, or None when no fit was running.
+    def cancel(self) -> float | None:
+        if not self.is_busy():
+            return None
+        run_time = self._get_run_time()
+        # the cancelled fit would have taken longer than it ran
+        if self._expected_fit_time_s is None or run_time > self._expected_fit_time_s:
+            self._expected_fit_time_s = run_time
+        self.stop()
+        self.start()
+        return run_time
+
+
+    # Returns the result of the running fit once it is finished, otherwise None.
+    def poll(self) -> TrainingResult | None:
+        if not self.is_busy():
+            return None
+
+        try:
+            result : TrainingResult = self._result_queue.get_nowait()
+        except queue.Empty:
+            if not self._process.is_alive():
+                logger.error(f"Training worker died while fitting snapshot {self._running_snapshot_id}, restarting worker.")
+                result = TrainingResult(self._running_snapshot_id, None, error=f"worker exited with code {self._process.exitcode}")
+                pending_snapshot = self._pending_snapshot
+                self.stop()
+                self.start()
+                self._pending_snapshot = pending_snapshot
+            else:
+                return None
+
+        if result.error is None:
+            self._expected_fit_time_s = result.wall_time_s
+        self._n_consecutive_preemptions = 0
+        self._running_snapshot_id = None
+        if self._pending_snapshot is not None:
+            self._dispatch(self._pending_snapshot)
+            self._pending_snapshot = None
+        return result
+
+
+    def _dispatch(self, snapshot : TrainingSnapshot):
+        if self._process is None:
+            self.start()
+        self._running_snapshot_id = snapshot.snapshot_id
+        self._running_since = time.monotonic()
+        self._snapshot_queue.put(snapshot)
+
+
+    def _get_run_time(self) -> float:
+        if self._running_since is None:
+            return 0
+        return time.monotonic() - self._running_since
+
+
+    def _get_min_preemption_run_time(self) -> float:
+        if self._expected_fit_time_s is None:
+            return MIN_PREEMPTION_RUN_TIME_S
+        return max(MIN_PREEMPTION_RUN_TIME_S, PREEMPTION_RUN_TIME_FACTOR * self._expected_fit_time_s)
+
+
+def _training_worker_loop(snapshot_queue : multiprocessing.Queue, result_queue : multiprocessing.Queue, resource_settings : ProcessResourceSettings | None = None):
+    apply_process_resource_settings(resource_settings)
+
+    while True:
+        snapshot : TrainingSnapshot = snapshot_queue.get()
+        if snapshot is None:
+            break
+
+        # process time includes the CPU time of all threads spawned by the fit (e.g. numba, torch)
+        wall_time_start = time.perf_counter()
+        cpu_time_start = time.process_time()
+        try:
+            model = fit_projection_model(snapshot)
+            error = None
+        except Exception as e:
+            logger.error(e)
+            model = None
+            error = str(e)
+        wall_time = time.perf_counter() - wall_time_start
+        cpu_time = time.process_time() - cpu_time_start
+        result_queue.put(TrainingResult(snapshot.snapshot_id, model, error, wall_time, cpu_time))
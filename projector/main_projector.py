@@ -1,5 +1,7 @@
 import copy
 import multiprocessing
+import os
+import pickle
 import uuid
 import pandas as pd
 import numpy as np
@@ -10,6 +12,7 @@ from utils.data_mocker import *
 from utils.dataframe_utils import *
 from projector.projector_settings import ProjectorSettings
 from projector.projector_plot_manager import ProjectorPlotManager
+from projector.training_snapshot import TrainingSnapshot
 from projector.projection_methods.projection_methods_enum import ProjectionMethodEnum
 from projector.projection_methods.projection_method_interface import IProjectionMethod
 from projector.projection_methods.umap_proj_method import UmapProjMethod
@@ -45,7 +48,10 @@ class Projector():
     _projecting_data : bool = False
 
     id : str
+    _session_id : str
     update_count : int = 0
+    _training_snapshot_count : int = 0
+    _last_applied_snapshot_id : int = 0
 
 
     def __init__(
@@ -54,10 +60,13 @@ class Projector():
             plot_manager : ProjectorPlotManager,
             settings : ProjectorSettings = ProjectorSettings(), 
             flags : dict[str, multiprocessing.Event] = {},
-            locks : dict[str, multiprocessing.Lock] = {}
+            locks : dict[str, multiprocessing.Lock] = {},
+            session_id : str = None
             ):
         
         self.id = f"{projection_method.name}_{str(uuid.uuid4())}"
+        # identifies the run of ONEP, a projector recreated after a crash is given the session id of the projector it replaces
+        self._session_id = session_id if session_id is not None else str(uuid.uuid4())
         self._plot_manager = plot_manager
         self._settings = settings
         self._flags = flags
@@ -177,8 +186,25 @@ class Projector():
         start_time = time.time()
         last_time = start_time
 
+        snapshot = self.get_training_snapshot(update_data, labels, time_points)
+        if snapshot is None:
+            return
+
+        model = fit_projection_model(snapshot)
+        self.apply_trained_model(model, snapshot.snapshot_id)
+
+        track_time(start_time, last_time, "updating model")
+
+
+    # Collects the data for the next model iteration. Returns None when there is nothing (new) to train on.
+    # Data selection priority: update_data parameter -> historic data
+    def get_training_snapshot(self, update_data: pd.DataFrame = None, labels : Iterable[int] = None, time_points : Iterable[float] = None) -> TrainingSnapshot | None:
         #get update data if not provided
         if update_data is None:
+            # skip when all data has already been handed out for training, refitting on the same data is wasted effort
+            if self._training_snapshot_count > 0 and len(self._recent_ids) == 0:
+                return None
+
             print("aquiring lock, update_projector")
             logger.debug("Waiting for current projection to finish")
             self.aquire_lock(LOCK_NAME_MUTATE_PROJECTOR_DATA)
@@ -191,7 +217,7 @@ class Projector():
 
             # Only update the projection model when there are a minimum number of data points to train on
             if historic_data.empty or len(historic_data) < self._settings.min_training_samples_to_start_projecting:
-                return
+                return None
         else:
             projections = self._projections
 
@@ -203,32 +229,25 @@ class Projector():
             labels = labels[:projection_count]
             time_points = time_points[:projection_count]
 
+        self._training_snapshot_count += 1
+        return TrainingSnapshot(self._training_snapshot_count, self._projection_model_latest, update_data, labels, time_points, projections)
 
-        contains_labeled_data = labels is not None and np.isnan(labels).any()
-        contains_unlabeled_data = labels is None or any(label != np.NaN for label in labels)
-        is_hybrid_data = contains_labeled_data and contains_unlabeled_data
-
-        print(f"Fitting new model. Using {len(update_data)} samples.")
-        logger.info(f"Fitting new model. Using {len(update_data)} samples.")
-        if is_hybrid_data and SUPPORTS_HYBRID_MODEL:
-            # BUG fit new fails when the data is split in such a way that there is only one labeled data entry
-            labeled_df, unlabeled_df = split_hybrid_data(update_data, labels, time_points)
-            labeled_data, _, labeled_labels, _ = unpack_dataframe(labeled_df)
-            self._projection_model_latest.fit_new(data=labeled_data, labels=labeled_labels, time_points=time_points, past_projections=projections)
-            unlabeled_data, _, _, unlabeled_time_points = unpack_dataframe(unlabeled_df)
-            self._projection_model_latest.fit_update(unlabeled_data, unlabeled_time_points)
-        elif contains_unlabeled_data:
-            self._projection_model_latest.fit_new(data=update_data, labels=None, time_points=time_points, past_projections=projections)
-        else:
-            self._projection_model_latest.fit_new(data=update_data, labels=labels, time_points=time_points, past_projections=projections)
-        print("Completted fitting new model")
-        logger.info("Completted fitting new model")
 
+    # Stores a fitted model as the latest model iteration. Results of snapshots older than the last applied one are discarded.
+    def apply_trained_model(self, model : IProjectionMethod, snapshot_id : int = None):
+        if snapshot_id is not None:
+            if snapshot_id <= self._last_applied_snapshot_id:
+                logger.info(f"Discarding model fitted on outdated training snapshot {snapshot_id}.")
+                return
+            self._last_applied_snapshot_id = snapshot_id
+
+        self._projection_model_latest = model
         if self._projection_model_curr is None:
             self.activate_latest_projector()
         self.update_count += 1
 
-        track_time(start_time, last_time, "updating model")
+        if self._is_checkpointing_enabled():
+            self.save_checkpoint()
 
 
     def activate_latest_projector(self):
@@ -261,6 +280,94 @@ class Projector():
             logger.error(f"Projector Plotting Exception: {str(e)}")
 
 
+    # Persists the data store and model iterations, so a restarted projector can resume projecting without refitting from scratch.
+    # The file is replaced atomically, a crash while writing leaves the previous checkpoint intact.
+    def save_checkpoint(self, checkpoint_path : str = None):
+        if checkpoint_path is None:
+            checkpoint_path = self._settings.checkpoint_path
+
+        self.aquire_lock(LOCK_NAME_MUTATE_PROJECTOR_DATA) # --------------------------------------
+        checkpoint = dict(
+            session_id = self._session_id,
+            saved_at = time.time(),
+            historic_df = self._historic_df,
+            recent_data = list(self._recent_data),
+            recent_ids = list(self._recent_ids),
+            recent_labels = list(self._recent_labels),
+            recent_time_points = list(self._recent_time_points),
+            projections = self._projections,
+            projection_model_curr = self._projection_model_curr,
+            projection_model_latest = self._projection_model_latest,
+            last_time_stamp = self._last_time_stamp,
+            update_count = self.update_count,
+            training_snapshot_count = self._training_snapshot_count,
+            last_applied_snapshot_id = self._last_applied_snapshot_id,
+        )
+        checkpoint_bytes = pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+        self.release_lock(LOCK_NAME_MUTATE_PROJECTOR_DATA) # --------------------------------------
+
+        checkpoint_folder = os.path.dirname(checkpoint_path)
+        if checkpoint_folder != "":
+            os.makedirs(checkpoint_folder, exist_ok=True)
+        temp_path = f"{checkpoint_path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(checkpoint_bytes)
+        os.replace(temp_path, checkpoint_path)
+        logger.debug(f"Saved projector checkpoint of model iteration {self.update_count} to {checkpoint_path}.")
+
+
+    # Restores the state saved by save_checkpoint and redraws the plot. Returns False if there is no checkpoint to restore.
+    # With only_own_session, checkpoints saved by an earlier run of ONEP are ignored, e.g. when recovering from a crash before this run saved a checkpoint.
+    # A checkpoint of an earlier run is saved again under the current session once restored, so a later recovery resumes from it.
+    def restore_checkpoint(self, checkpoint_path : str = None, only_own_session : bool = False) -> bool:
+        if checkpoint_path is None:
+            checkpoint_path = self._settings.checkpoint_path
+        if checkpoint_path is None or checkpoint_path == "" or not os.path.isfile(checkpoint_path):
+            logger.info(f"No projector checkpoint found at {checkpoint_path}.")
+            return False
+
+        with open(checkpoint_path, "rb") as file:
+            checkpoint = pickle.load(file)
+        is_own_session = checkpoint.get("session_id") == self._session_id
+        if only_own_session and not is_own_session:
+            logger.info(f"Ignoring projector checkpoint at {checkpoint_path}, it was saved by an earlier session.")
+            return False
+
+        self.aquire_lock(LOCK_NAME_MUTATE_PROJECTOR_DATA) # --------------------------------------
+        self._historic_df = checkpoint["historic_df"]
+        self._recent_data = checkpoint["recent_data"]
+        self._recent_ids = checkpoint["recent_ids"]
+        self._recent_labels = checkpoint["recent_labels"]
+        self._recent_time_points = checkpoint["recent_time_points"]
+        self._projections = checkpoint["projections"]
+        self._projection_model_curr = checkpoint["projection_model_curr"]
+        self._projection_model_latest = checkpoint["projection_model_latest"]
+        self._last_time_stamp = checkpoint["last_time_stamp"]
+        self.update_count = checkpoint["update_count"]
+        self._training_snapshot_count = checkpoint["training_snapshot_count"]
+        self._last_applied_snapshot_id = checkpoint["last_applied_snapshot_id"]
+        _, _, ids, labels, time_points = self.get_updated_historic_data(clear_recent=False)
+        projections = self._projections
+        self.release_lock(LOCK_NAME_MUTATE_PROJECTOR_DATA) # --------------------------------------
+
+        logger.info(f"Restored projector checkpoint of model iteration {self.update_count} from {checkpoint_path}.")
+        if self._projection_model_curr is not None and len(projections) > 0:
+            # projections are made in the order of the ids, points received before the first model was activated are projected upon activation
+            point_count = min(len(projections), len(ids))
+            try:
+                self._plot_manager.update_plot(projections[:point_count], ids[:point_count], time_points[:point_count], labels[:point_count])
+            except Exception as e:
+                logger.error(f"Projector Plotting Exception: {str(e)}")
+
+        if not is_own_session:
+            self.save_checkpoint(checkpoint_path)
+        return True
+
+
+    def _is_checkpointing_enabled(self) -> bool:
+        return self._settings.checkpoint_path is not None and self._settings.checkpoint_path != ""
+
+
     def get_updated_historic_data(self, clear_recent : bool = True) -> tuple[pd.DataFrame, pd.DataFrame, list[any], list[float]]:
         # Copy and clear recent data to minimize data loss
         recent_data_copy = self._recent_data.copy()
@@ -313,6 +420,35 @@ def split_hybrid_data(data, labels, time_points) -> tuple[pd.DataFrame, pd.DataF
     return labeled_df, unlabeled_df
 
 
+def fit_projection_model(snapshot : TrainingSnapshot) -> IProjectionMethod:
+    projection_model = snapshot.model
+    update_data = snapshot.data
+    labels = snapshot.labels
+    time_points = snapshot.time_points
+    projections = snapshot.projections
+
+    contains_labeled_data = labels is not None and np.isnan(labels).any()
+    contains_unlabeled_data = labels is None or any(label != np.NaN for label in labels)
+    is_hybrid_data = contains_labeled_data and contains_unlabeled_data
+
+    print(f"Fitting new model. Using {len(update_data)} samples.")
+    logger.info(f"Fitting new model. Using {len(update_data)} samples.")
+    if is_hybrid_data and SUPPORTS_HYBRID_MODEL:
+        # BUG fit new fails when the data is split in such a way that there is only one labeled data entry
+        labeled_df, unlabeled_df = split_hybrid_data(update_data, labels, time_points)
+        labeled_data, _, labeled_labels, _ = unpack_dataframe(labeled_df)
+        projection_model.fit_new(data=labeled_data, labels=labeled_labels, time_points=time_points, past_projections=projections)
+        unlabeled_data, _, _, unlabeled_time_points = unpack_dataframe(unlabeled_df)
+        projection_model.fit_update(unlabeled_data, unlabeled_time_points)
+    elif contains_unlabeled_data:
+        projection_model.fit_new(data=update_data, labels=None, time_points=time_points, past_projections=projections)
+    else:
+        projection_model.fit_new(data=update_data, labels=labels, time_points=time_points, past_projections=projections)
+    print("Completted fitting new model")
+    logger.info("Completted fitting new model")
+    return projection_model
+
+
 def get_NaN_list(length) -> list[float]:
     return [np.NaN] * length
 
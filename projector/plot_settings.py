@@ -25,4 +25,12 @@ class PlotSettings():
     yaxis_step_size : float = 0.2
     axis_aspect_ratio : float = None
 
-    transition_duration : int = 500 # in ms
\ No newline at end of file
+    transition_duration : int = 500 # in ms
+
+    render_mode : str = 'traces' # 'traces' or 'webgl'
+
+    density_rendering : bool = False
+    density_bins : int = 100
+
+    level_of_detail : bool = False
+    viewport_point_budget : int = 20000
\ No newline at end of file
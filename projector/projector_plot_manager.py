@@ -1,8 +1,14 @@
+import copy
+import hashlib
 import random
+import threading
+from typing import Callable
+from collections import deque
 import numpy as np
 import plotly.graph_objects as go
 import pandas as pd
 import matplotlib.colors as mcolors
+from matplotlib.path import Path
 
 from pyparsing import Iterable
 
@@ -10,20 +16,29 @@ from utils.logging import logger
 from utils.dataframe_utils import *
 from utils.Iterable_utils import *
 from projector.plot_settings import PlotSettings
+from plotting.plotly_plot_service import PlotlyPlotSerivce
 from plotting.plotly_scatter_service import PlotlyScatterService
 from plotting.plotly_selection_service import PlotlySelectionService
 from plotting.plotly_highlight_service import PlotlyHighlightService
+from plotting.plotly_density_service import PlotlyDensityService
 from plotting.scatter_plot_settings import ScatterPlotSettings
 from plotting.opacity_bookkeeping_service  import OpacityBookkeepingService
+from plotting.scatter_service_factory import create_scatter_service
+from plotting.spatial_grid_index import SpatialGridIndex
 
+PLOT_CHANGE_LOG_SIZE = 100
 
+
+# The public methods are guarded by a lock. In the multiprocess runtime each process calls the plot manager through its own proxy connection, which the manager serves on a separate thread.
 class ProjectorPlotManager():
     name : str
+    _lock : threading.RLock
     _plot_figure : go.Figure
     _settings : PlotSettings
     _scatter_plot_service : PlotlyScatterService
     _selection_plot_service : PlotlySelectionService
     _highlight_plot_service : PlotlyHighlightService
+    _density_plot_service : PlotlyDensityService
     _opacity_bookkeeping_service : OpacityBookkeepingService
 
     _labels_dict : dict[int, str] = {}
@@ -31,8 +46,6 @@ class ProjectorPlotManager():
     _opacity_thresholds : dict[float, int] = {}
     _init_opacity : float = 1.0
 
-    _points_by_opacity : dict[float, Iterable[str]]= {}
-
     _points : dict[str, str] = {} # keyval: point_id, label
     _selected_points : dict[str, tuple[float, float]] = {} # keyval: point_id, (x_cord, y_cord)
     _highlighted_points_ids : list[str] = []
@@ -42,23 +55,43 @@ class ProjectorPlotManager():
     _xaxis_edge_values : Iterable[float] = None
     _yaxis_edge_values : Iterable[float] = None
 
+    # Each snapshot of the figure that changed it gets a new version. The changes of the recent versions are logged, so a client can be sent only the changes since the version it has.
+    # Changes that are not logged (a new figure, added traces, or layout changes) set the full figure version, clients with an older version are sent the whole figure.
+    _version : int = 0
+    _full_figure_version : int = 0
+    _is_full_figure_changed : bool = True
+    _n_traces : int = 0
+    _change_log : deque[tuple[int, dict[str, tuple[set[str], dict[str, np.ndarray]]]]]
+
+    # The spatial index holds the current coordinates of all plotted points, for region selection and level of detail.
+    # With level of detail, each client passes the viewport it is zoomed or panned to. While the plot holds more points than the viewport point budget, the client is sent a separate figure
+    # holding only the points and markers in its viewport, decimated through the spatial index. This figure is created by its own services, as the services of the plot figure are bound to that figure.
+    _spatial_index : SpatialGridIndex
+    _viewport_scatter_plot_service : PlotlyScatterService
+    _viewport_selection_plot_service : PlotlySelectionService
+    _viewport_highlight_plot_service : PlotlyHighlightService
+
 
     def __init__(self, name : str, settings : PlotSettings):
         self.name = name
         self._settings = settings
+        self._lock = threading.RLock()
         self._resolve_label_settings()
         self._resolve_opacity_settings()
 
-        self._scatter_plot_service = PlotlyScatterService()
-        self._selection_plot_service = PlotlySelectionService()
-        self._highlight_plot_service = PlotlyHighlightService()
-        self._opacity_bookkeeping_service = OpacityBookkeepingService(
-            self._scatter_plot_service,
-            self._opacity_thresholds,
-            self._init_opacity,
-            self._points_by_opacity,
-        )
+        self._scatter_plot_service = create_scatter_service(self._settings.render_mode)
+        self._selection_plot_service = PlotlySelectionService(self._scatter_plot_service.get_figure_index())
+        self._highlight_plot_service = PlotlyHighlightService(self._scatter_plot_service.get_figure_index())
+        self._density_plot_service = self._scatter_plot_service.get_density_service()
+        self._opacity_bookkeeping_service = self._create_opacity_bookkeeping_service()
 
+        self._spatial_index = SpatialGridIndex()
+        if self._settings.level_of_detail:
+            self._viewport_scatter_plot_service = create_scatter_service(self._settings.render_mode)
+            self._viewport_selection_plot_service = PlotlySelectionService(self._viewport_scatter_plot_service.get_figure_index())
+            self._viewport_highlight_plot_service = PlotlyHighlightService(self._viewport_scatter_plot_service.get_figure_index())
+
+        self._change_log = deque(maxlen=PLOT_CHANGE_LOG_SIZE)
         scatter_plot_settings = self._resolve_scatter_plot_settings()
         self._plot_figure = self._scatter_plot_service.create_figure(scatter_plot_settings)
 
@@ -79,12 +112,16 @@ class ProjectorPlotManager():
     def _resolve_opacity_settings(self):
         self._opacity_thresholds = {float(opacity): threshold for opacity, threshold in self._settings.opacity_thresholds.items()}
         self._opacity_thresholds[self._settings.min_opacity] = np.NaN
-        for opacity in self._opacity_thresholds.keys():
-            if not isinstance(opacity, float):
-                opacity = float(opacity)
-            self._points_by_opacity[opacity] = []
         self._init_opacity = list(self._opacity_thresholds.keys())[0]
 
+    def _create_opacity_bookkeeping_service(self) -> OpacityBookkeepingService:
+        return OpacityBookkeepingService(
+            self._scatter_plot_service,
+            self._opacity_thresholds,
+            self._init_opacity,
+            self._settings.density_rendering,
+        )
+
     def _resolve_scatter_plot_settings(self) -> ScatterPlotSettings:
         opacity_values = list(self._settings.opacity_thresholds.keys())
         if self._settings.min_opacity not in opacity_values:
@@ -109,13 +146,52 @@ class ProjectorPlotManager():
             self._settings.yaxis_step_size,
 
             self._settings.transition_duration,
+
+            self._settings.density_bins if self._settings.density_rendering else None,
         )
     
     '''
     Get methods
     '''
+    # Returns a copy of the figure, so callers in the same process (the asyncio runtime) can alter it while the figure is being updated.
     def get_plot(self) -> go.Figure:
-        return self._plot_figure
+        with self._lock:
+            self._take_snapshot()
+            return copy.deepcopy(self._plot_figure)
+
+
+    # Returns the version the figure has at the next snapshot, without taking the snapshot. The version only advances when the figure changed, so a client holding this version is up to date.
+    def get_version(self) -> int:
+        with self._lock:
+            if self._has_pending_changes():
+                return self._version + 1
+            return self._version
+
+
+    # Returns the current version, either the patch operations that bring a client at since_version up to date or the whole figure when the changes since that version are not logged,
+    # and the key of the viewport figure the client holds afterwards (None for the plot figure).
+    # Patch operations are tuples of (trace index, property path, 'set' or 'extend', values). A client that is up to date gets no operations, without a snapshot being taken.
+    # The viewport is the (x range, y range) the client is zoomed or panned to, and viewport_figure_key the key returned with the figure the client holds. The viewport figure has no patches,
+    # it is sent whole when its content differs from that of the client's viewport figure, i.e. when the key changed.
+    # The whole figure is returned as a dictionary, a copy that is cheaper to create and to send through the manager proxy than a copy of the figure object.
+    def get_plot_patch(self, since_version : int | None, viewport : tuple[Iterable[float], Iterable[float]] | None = None, viewport_figure_key : str | None = None
+                       ) -> tuple[int, list[tuple[int, str, str, list]] | None, dict | None, str | None]:
+        with self._lock:
+            uses_viewport_figure = self._is_viewport_decimated(viewport)
+            if since_version == self._version and not self._has_pending_changes() and uses_viewport_figure == (viewport_figure_key is not None):
+                return self._version, [], None, viewport_figure_key
+
+            self._take_snapshot()
+            if uses_viewport_figure:
+                return self._get_viewport_plot_patch(viewport, viewport_figure_key)
+
+            # a client switching from a viewport figure to the plot figure is sent the whole figure
+            if viewport_figure_key is None and since_version == self._version:
+                return self._version, [], None, None
+            if (viewport_figure_key is not None or since_version is None or since_version < self._full_figure_version or since_version > self._version
+                    or self._change_log[0][0] > since_version + 1):
+                return self._version, None, self._plot_figure.to_dict(), None
+            return self._version, self._get_patch_operations(since_version), None, None
 
 
     def get_labels(self) -> list[str]:
@@ -129,194 +205,293 @@ class ProjectorPlotManager():
 
 
     def get_trace_id_by_point_id(self, point_id : float) -> str:
-        trace = self._scatter_plot_service.get_trace_by_point_id(self._plot_figure, point_id)
-        return trace.uid
+        with self._lock:
+            trace = self._scatter_plot_service.get_trace_by_point_id(self._plot_figure, point_id)
+            return trace.uid
 
 
     def get_label_by_point_id(self, point_id : str) -> str:
-        if point_id in self._points:
-            return self._points[point_id]
-        logger.warn(f"{point_id} could not be found in the tracked list of points, searching for id in figure. Bad Bookkeeping.")
-        return self._scatter_plot_service.get_label_by_point_id(self._plot_figure, point_id)
+        with self._lock:
+            if point_id in self._points:
+                return self._points[point_id]
+            logger.warn(f"{point_id} could not be found in the tracked list of points, searching for id in figure. Bad Bookkeeping.")
+            return self._scatter_plot_service.get_label_by_point_id(self._plot_figure, point_id)
     
     def get_selected_point_ids(self):
-        return self._selected_points.keys()
+        with self._lock:
+            return list(self._selected_points.keys())
 
     def get_count_selected_points(self) -> int:
-        return len(self._selected_points)
+        with self._lock:
+            return len(self._selected_points)
     
     '''
     Point selection
     '''
     def is_selected_point(self, point_id : str) -> bool:
-        return point_id in self._selected_points
+        with self._lock:
+            return point_id in self._selected_points
 
 
     def select_point(self, point_id : str, x : float = None, y :float = None):
-        point_id = self._ensure_id_is_point_id(point_id)
+        with self._lock:
+            point_id = self._ensure_id_is_point_id(point_id)
 
-        # return when the point is already selected            
-        if point_id in self._selected_points:
-            return
+            # return when the point is already selected            
+            if point_id in self._selected_points:
+                return
         
-        if x is None or y is None:
-            trace, point_index = self._scatter_plot_service.get_trace_and_point_index_by_point_id(point_id)
-            x = trace.x[point_index]
-            y = trace.y[point_index]
-        self._selection_plot_service.select_point(self._plot_figure, x, y, point_id)
-        self._selected_points[point_id] = (x, y)
+            if x is None or y is None:
+                x, y = self._get_point_coordinates(point_id)
+            self._selection_plot_service.select_point(self._plot_figure, x, y, point_id)
+            self._selected_points[point_id] = (x, y)
+
+
+    # Selects all plotted points within the polygon, given as a sequence of (x, y) vertices, in one update of the selection trace.
+    def select_region(self, polygon : Iterable[tuple[float, float]]):
+        with self._lock:
+            polygon = np.asarray(polygon, dtype=float)
+            if len(polygon) < 3:
+                return
+
+            rows = self._spatial_index.get_rows_in_box(
+                [polygon[:, 0].min(), polygon[:, 0].max()],
+                [polygon[:, 1].min(), polygon[:, 1].max()]
+            )
+            x, y, point_ids, _ = self._spatial_index.get_points(rows)
+            is_selected = Path(polygon).contains_points(np.column_stack((x, y)))
+            is_selected &= np.array([point_id not in self._selected_points for point_id in point_ids], dtype=bool)
+            if not is_selected.any():
+                return
+
+            self._selection_plot_service.select_points(self._plot_figure, x[is_selected], y[is_selected], point_ids[is_selected])
+            self._selected_points.update(zip(point_ids[is_selected], zip(x[is_selected].tolist(), y[is_selected].tolist())))
 
 
     def deselect_point(self, point_id : str):
-        point_id = self._ensure_id_is_point_id(point_id)
-        self._selection_plot_service.deselect_point(self._plot_figure, point_id)
-        self._selected_points.pop(point_id, None)
+        with self._lock:
+            point_id = self._ensure_id_is_point_id(point_id)
+            self._selection_plot_service.deselect_point(self._plot_figure, point_id)
+            self._selected_points.pop(point_id, None)
 
 
     def deselect_all(self):
-        self._selection_plot_service.deselect_all(self._plot_figure)
-        self._selected_points.clear()
+        with self._lock:
+            self._selection_plot_service.deselect_all(self._plot_figure)
+            self._selected_points.clear()
 
 
     '''
     Point highlighting
     '''
     def highlight_selected(self):
-        for point_id, point_cords in self._selected_points.items():
-            self.highlight_point(point_id, point_cords[0], point_cords[1])
+        with self._lock:
+            for point_id, point_cords in self._selected_points.items():
+                self.highlight_point(point_id, point_cords[0], point_cords[1])
 
 
     def highlight_point(self, point_id : str, x : float = None, y :float = None):
-        point_id = self._ensure_id_is_point_id(point_id)
+        with self._lock:
+            point_id = self._ensure_id_is_point_id(point_id)
 
-        # return if the point is already highlighted
-        if point_id in self._highlighted_points_ids:
-            return
-
-        if x is None or y is None:
-            trace, point_index = self._scatter_plot_service.get_trace_and_point_index_by_point_id(point_id)
-            if trace is None or point_index is None:
+            # return if the point is already highlighted
+            if point_id in self._highlighted_points_ids:
                 return
-            x = trace.x[point_index]
-            y = trace.y[point_index]
 
-        label = self.get_label_by_point_id(point_id)
-        self._highlight_plot_service.highlight_point(self._plot_figure, x, y, point_id, label)
-        self._highlighted_points_ids.append(point_id)
+            if x is None or y is None:
+                x, y = self._get_point_coordinates(point_id)
+                if x is None or y is None:
+                    return
+
+            label = self.get_label_by_point_id(point_id)
+            self._highlight_plot_service.highlight_point(self._plot_figure, x, y, point_id, label)
+            self._highlighted_points_ids.append(point_id)
 
 
     def dehighlight_selected(self):
-        for point_id, _ in self._selected_points.items():
-            self.dehighlight_point(point_id)
+        with self._lock:
+            for point_id, _ in self._selected_points.items():
+                self.dehighlight_point(point_id)
 
 
     def dehighlight_point(self, point_id : str):
-        point_id = self._ensure_id_is_point_id(point_id)
+        with self._lock:
+            point_id = self._ensure_id_is_point_id(point_id)
         
-        if point_id not in self._highlighted_points_ids:
-            return
+            if point_id not in self._highlighted_points_ids:
+                return
 
-        self._highlight_plot_service.dehighlight_point(self._plot_figure, point_id)
-        self._highlighted_points_ids.remove(point_id)
+            self._highlight_plot_service.dehighlight_point(self._plot_figure, point_id)
+            self._highlighted_points_ids.remove(point_id)
 
 
     def dehighlight_all(self):
-        self._highlight_plot_service.dehighlight_all(self._plot_figure)
-        self._highlighted_points_ids.clear()
+        with self._lock:
+            self._highlight_plot_service.dehighlight_all(self._plot_figure)
+            self._highlighted_points_ids.clear()
 
 
     '''
     Point updating
     '''
     def update_selected_points_label(self, new_label : str):
-        for point_id in list(self._selected_points.keys()):
-            self.update_point_label(point_id, new_label)
+        with self._lock:
+            for point_id in list(self._selected_points.keys()):
+                self.update_point_label(point_id, new_label)
 
 
     def update_point_label(self, point_id : str, new_label : str) -> str:
-        point_id = self._ensure_id_is_point_id(point_id)
+        with self._lock:
+            point_id = self._ensure_id_is_point_id(point_id)
         
-        trace, point_index = self._scatter_plot_service.get_trace_and_point_index_by_point_id(self._plot_figure, point_id)
-        self._scatter_plot_service.update_point_label(self._plot_figure, trace, point_index, new_label)
-        self._points[point_id] = new_label
-
-        if point_id in self._highlighted_points_ids:
-            self._highlight_plot_service.update_highlight_point_label(self._plot_figure, point_id, new_label)
+            if self._density_plot_service.contains_point(point_id):
+                self._density_plot_service.update_point_label(point_id, new_label)
+            else:
+                trace, point_index = self._scatter_plot_service.get_trace_and_point_index_by_point_id(self._plot_figure, point_id)
+                self._scatter_plot_service.update_point_label(self._plot_figure, trace, point_index, new_label)
+            self._points[point_id] = new_label
+
+            if point_id in self._highlighted_points_ids:
+                self._highlight_plot_service.update_highlight_point_label(self._plot_figure, point_id, new_label)
             
 
     '''
-    General public methods
+    Viewport
     '''
-    def refresh_axis_range(self, plot_aspect_ratio : float):
-        x_range = self._settings.xaxis_range
-        y_range = self._settings.yaxis_range
+    def _is_viewport_decimated(self, viewport : tuple[Iterable[float], Iterable[float]] | None) -> bool:
+        return (self._settings.level_of_detail and viewport is not None and viewport[0] is not None and viewport[1] is not None
+            and len(self._spatial_index) > self._settings.viewport_point_budget)
 
-        if x_range is None and y_range is not None and plot_aspect_ratio is not None:
-            y_range_mean = (y_range[0] + y_range[-1]) / 2
-            x_range = scale_and_center_range(y_range, plot_aspect_ratio, y_range_mean)
-            self._settings.xaxis_range = x_range
-            self._plot_figure.update_xaxes(range=x_range)
-        if x_range is not None and y_range is None and plot_aspect_ratio is not None:
-            x_range_mean = (x_range[0] + x_range[-1]) / 2
-            y_range = scale_and_center_range(x_range, plot_aspect_ratio, x_range_mean)
-            self._settings.yaxis_range = y_range
-            self._plot_figure.update_yaxes(range=y_range)
 
+    # Returns the viewport figure of the current version, or no figure when the client already holds a viewport figure with the same content.
+    def _get_viewport_plot_patch(self, viewport : tuple[Iterable[float], Iterable[float]], viewport_figure_key : str | None) -> tuple[int, list | None, dict | None, str]:
+        x_range, y_range = [list(axis_range) for axis_range in viewport]
+        selected_markers, highlighted_markers = self._get_viewport_markers(x_range, y_range)
+        # the markers count towards the budget, so the viewport figure never holds more than budget points and markers
+        rows = self._spatial_index.query(x_range, y_range, max(self._settings.viewport_point_budget - len(selected_markers) - len(highlighted_markers), 0))
+        x, y, point_ids, texts = self._spatial_index.get_points(rows)
+        labels = [self._points[point_id] for point_id in point_ids]
+        opacity_values = self._opacity_bookkeeping_service.get_opacity_values(rows)
 
-    def plot(self, data : pd.DataFrame, point_ids : Iterable[str], time_points : Iterable[float], labels : Iterable[int] | None = None):
-        data = self._resolve_data(data)
-        time_point_texts = [f"time: {str(time_point)}" for time_point in time_points]
-        labels = self._resolve_labels(labels, len(point_ids))
-        self._normalize_data(data)
+        key = self._get_viewport_figure_key(x_range, y_range, x, y, point_ids, labels, opacity_values, selected_markers, highlighted_markers)
+        if key == viewport_figure_key:
+            return self._version, [], None, key
 
-        logger.debug("add scatter")
-        self._scatter_plot_service.add_scatter(
-            self._plot_figure,
-            data[0],
-            data[1],
-            point_ids,
-            labels,
-            time_point_texts
-        )
+        scatter_plot_settings = self._resolve_scatter_plot_settings()
+        scatter_plot_settings.xaxis_range = x_range
+        scatter_plot_settings.yaxis_range = y_range
+        scatter_plot_settings.density_bins = None
+        viewport_figure = self._viewport_scatter_plot_service.create_figure(scatter_plot_settings, x, y, point_ids, labels, texts, opacity_values)
+
+        if len(selected_markers) > 0:
+            self._viewport_selection_plot_service.select_points(
+                viewport_figure,
+                [point_x for _, point_x, _ in selected_markers],
+                [point_y for _, _, point_y in selected_markers],
+                [point_id for point_id, _, _ in selected_markers]
+            )
+        for point_id, point_x, point_y in highlighted_markers:
+            self._viewport_highlight_plot_service.highlight_point(viewport_figure, point_x, point_y, point_id, self._points[point_id])
+
+        self._viewport_scatter_plot_service.materialize(viewport_figure)
+        return self._version, None, viewport_figure.to_dict(), key
+
+
+    # Returns the (point id, x, y) of the selected and the highlighted points within the ranges. At most the viewport point budget of them are returned, the selected points first and the most recent ones of each.
+    def _get_viewport_markers(self, x_range : list[float], y_range : list[float]) -> tuple[list[tuple[str, float, float]], list[tuple[str, float, float]]]:
+        x_min, x_max = min(x_range), max(x_range)
+        y_min, y_max = min(y_range), max(y_range)
+        def is_in_viewport(point_x : float, point_y : float) -> bool:
+            return point_x is not None and point_y is not None and x_min <= point_x <= x_max and y_min <= point_y <= y_max
+
+        selected_markers = [(point_id, point_x, point_y) for point_id, (point_x, point_y) in self._selected_points.items() if is_in_viewport(point_x, point_y)]
+        highlighted_markers = []
+        for point_id in self._highlighted_points_ids:
+            point_x, point_y = self._get_point_coordinates(point_id)
+            if is_in_viewport(point_x, point_y):
+                highlighted_markers.append((point_id, point_x, point_y))
+
+        budget = self._settings.viewport_point_budget
+        selected_markers = selected_markers[-budget:] if budget > 0 else []
+        n_highlighted = max(budget - len(selected_markers), 0)
+        highlighted_markers = highlighted_markers[-n_highlighted:] if n_highlighted > 0 else []
+        return selected_markers, highlighted_markers
+
+
+    # Identifies the content of a viewport figure, so it is only sent again when the points or markers in the viewport changed.
+    def _get_viewport_figure_key(self, x_range : list[float], y_range : list[float], x : np.ndarray, y : np.ndarray, point_ids : np.ndarray, labels : list[str], opacity_values : np.ndarray,
+                                 selected_markers : list[tuple[str, float, float]], highlighted_markers : list[tuple[str, float, float]]) -> str:
+        key_hash = hashlib.blake2b(digest_size=16)
+        key_hash.update(np.asarray(x_range + y_range, dtype=float).tobytes())
+        key_hash.update(np.asarray(x, dtype=float).tobytes())
+        key_hash.update(np.asarray(y, dtype=float).tobytes())
+        key_hash.update(np.asarray(opacity_values, dtype=float).tobytes())
+        key_hash.update("\0".join(map(str, point_ids)).encode())
+        key_hash.update("\0".join(labels).encode())
+        key_hash.update(repr(selected_markers).encode())
+        key_hash.update(repr([(point_id, point_x, point_y, self._points[point_id]) for point_id, point_x, point_y in highlighted_markers]).encode())
+        return key_hash.hexdigest()
 
-        self._points.update({point_id: label for point_id, label in zip(point_ids, labels)})
-        logger.debug("uodating opacity bookkeeping")
-        self._opacity_bookkeeping_service.update_opacity_dict_and_plot(self._plot_figure, point_ids)
 
+    '''
+    General public methods
+    '''
+    def refresh_axis_range(self, plot_aspect_ratio : float):
+        with self._lock:
+            x_range = self._settings.xaxis_range
+            y_range = self._settings.yaxis_range
+
+            if x_range is None and y_range is not None and plot_aspect_ratio is not None:
+                y_range_mean = (y_range[0] + y_range[-1]) / 2
+                x_range = scale_and_center_range(y_range, plot_aspect_ratio, y_range_mean)
+                self._settings.xaxis_range = x_range
+                self._plot_figure.update_xaxes(range=x_range)
+                self._is_full_figure_changed = True
+            if x_range is not None and y_range is None and plot_aspect_ratio is not None:
+                x_range_mean = (x_range[0] + x_range[-1]) / 2
+                y_range = scale_and_center_range(x_range, plot_aspect_ratio, x_range_mean)
+                self._settings.yaxis_range = y_range
+                self._plot_figure.update_yaxes(range=y_range)
+                self._is_full_figure_changed = True
 
-    def update_plot(self, data : pd.DataFrame, point_ids : Iterable[str], time_points : Iterable[float], labels : Iterable[int] | None = None):
-        logger.info("Updating plot..")
 
-        data = self._resolve_data(data)
-        time_point_texts = [f"time: {str(time_point)}" for time_point in time_points]
-        labels = self._resolve_labels(labels, len(point_ids))
+    def plot(self, data : pd.DataFrame, point_ids : Iterable[str], time_points : Iterable[float], labels : Iterable[int] | None = None):
+        with self._lock:
+            data = self._resolve_data(data)
+            time_point_texts = [f"time: {str(time_point)}" for time_point in time_points]
+            labels = self._resolve_labels(labels, len(point_ids))
+            self._normalize_data(data)
+            self._add_points(data[0].to_numpy(), data[1].to_numpy(), point_ids, labels, time_point_texts)
 
-        # check if there are any newly added points
-        num_new_points = len(data) - self._get_num_plotted_points()
-        if num_new_points > 1:
-            new_point_ids = point_ids[:num_new_points] 
-            self._opacity_bookkeeping_service.update_opacity_dict(new_point_ids)
 
-        self._update_axis_ranges(data)
-        scatter_plot_settings = self._resolve_scatter_plot_settings()
-        opacity_values = self._get_opacity_values_chronoligical_order()
-        self._normalize_data(data)
-        new_figure = self._scatter_plot_service.create_figure(
-            scatter_plot_settings,
-            data[0],
-            data[1],
-            point_ids,
-            labels,
-            time_point_texts,
-            opacity_values
-        )
-        
+    # Moves the plotted points to their projections by the new model in place, the points keep their traces and opacity. Points that were not plotted yet are plotted as by plot().
+    # The figure is only recreated when the plotted points differ from the points to update.
+    def update_plot(self, data : pd.DataFrame, point_ids : Iterable[str], time_points : Iterable[float], labels : Iterable[int] | None = None):
+        with self._lock:
+            logger.info("Updating plot..")
+
+            data = self._resolve_data(data)
+            time_point_texts = [f"time: {str(time_point)}" for time_point in time_points]
+            labels = self._resolve_labels(labels, len(point_ids))
+
+            self._update_axis_ranges(data)
+            self._normalize_data(data)
+            x = data[0].to_numpy()
+            y = data[1].to_numpy()
+            point_ids = np.asarray(point_ids, dtype=object)
+            labels = np.asarray(labels, dtype=object)
+            time_point_texts = np.asarray(time_point_texts, dtype=object)
+
+            # points that were not plotted yet are the most recent ones, at the end
+            num_plotted_points = self._opacity_bookkeeping_service.get_num_points()
+            if not self._are_plotted_points(point_ids[:num_plotted_points]):
+                logger.warning("The plotted points differ from the points to update, recreating the figure.")
+                self._recreate_plot(x, y, point_ids, labels, time_point_texts)
+                return
 
-        self._points = {point_id: label for point_id, label in zip(point_ids, labels)}
-        self._update_highlight(new_figure, data, point_ids)
-        self._update_selection(new_figure, data, point_ids)
-        logger.warn(f"assign new figure. {len(new_figure.data)}")
-        self._plot_figure = new_figure
+            self._move_points(x[:num_plotted_points], y[:num_plotted_points], point_ids[:num_plotted_points], labels[:num_plotted_points], time_point_texts[:num_plotted_points])
+            if num_plotted_points < len(point_ids):
+                self._add_points(x[num_plotted_points:], y[num_plotted_points:], point_ids[num_plotted_points:], labels[num_plotted_points:], time_point_texts[num_plotted_points:])
 
 
     '''
@@ -330,57 +505,154 @@ class ProjectorPlotManager():
         return id
 
 
-    def _update_highlight(self, new_figure : go.Figure, data : pd.DataFrame, point_ids : Iterable[str]):
-        for point_id in self._highlighted_points_ids:
-            point_index = point_ids.index(point_id)
-            x = data[0][point_index]
-            y = data[1][point_index]
+    def _add_points(self, x : np.ndarray, y : np.ndarray, point_ids : Iterable[str], labels : Iterable[str], texts : Iterable[str]):
+        logger.debug("add scatter")
+        self._scatter_plot_service.add_scatter(self._plot_figure, x, y, point_ids, labels, texts)
+        self._spatial_index.add_points(x, y, point_ids, texts)
 
-            label = self.get_label_by_point_id(point_id)
-            self._highlight_plot_service.highlight_point(new_figure, x, y, point_id, label)
+        self._points.update({point_id: label for point_id, label in zip(point_ids, labels)})
+        logger.debug("updating opacity bookkeeping")
+        aggregated_point_ids = self._opacity_bookkeeping_service.add_points_and_update_plot(self._plot_figure, point_ids)
+        if len(aggregated_point_ids) > 0:
+            self._aggregate_points(aggregated_point_ids)
 
 
-    def _update_selection(self, new_figure : go.Figure, data : pd.DataFrame, ids : Iterable[int]):
-        for point_id in self._selected_points:
-            point_index = ids.index(point_id)
-            x = data[0][point_index]
-            y = data[1][point_index]
+    # Writes the new coordinates of plotted points to the figure, along with those of their selection and highlight markers, and applies changed labels.
+    def _move_points(self, x : np.ndarray, y : np.ndarray, point_ids : np.ndarray, labels : np.ndarray, texts : np.ndarray):
+        is_moved = self._scatter_plot_service.set_points_coordinates(self._plot_figure, point_ids, x, y)
+        is_moved[~is_moved] = self._density_plot_service.set_points_coordinates(point_ids[~is_moved], x[~is_moved], y[~is_moved])
+        if not is_moved.all():
+            logger.warn(f"{np.count_nonzero(~is_moved)} points could not be found in the figure when moving them. Bad Bookkeeping.")
 
-            self._selection_plot_service.select_point(new_figure, x, y, point_id)
-            self._selected_points[point_id] = (x, y)
+        self._spatial_index.clear()
+        self._spatial_index.add_points(x, y, point_ids, texts)
 
+        for point_id, label in zip(point_ids, labels):
+            if self._points[point_id] != label:
+                self.update_point_label(point_id, label)
 
-    def _expand_opacity_dict(self, ids : Iterable[int], opacity : float | None = None):
-        if opacity is None:
-            opacity = list(self._opacity_thresholds.keys())[0]
-        self._points_by_opacity[opacity].extend(ids)
+        self._selected_points = {point_id: self._get_point_coordinates(point_id) for point_id in self._selected_points}
+        self._move_point_markers(self._selection_plot_service, self._selection_plot_service.get_selection_id, self._selected_points)
+        highlighted_points = {point_id: self._get_point_coordinates(point_id) for point_id in self._highlighted_points_ids}
+        self._move_point_markers(self._highlight_plot_service, self._highlight_plot_service.get_highlight_point_id, highlighted_points)
 
 
-    def _reduce_opacity(self):
-        for i, (opacity, points) in enumerate(self._points_by_opacity.items()):
-            # if there is no opacity threshold defined or the selected opacity level is the lowerst/final opacity level, continue
-            opacity_threshold = self._opacity_thresholds[opacity]
-            if np.isnan(opacity_threshold) or i >= len(self._points_by_opacity)-1:
-                continue
-            
-            # if there are fewer points in the opacity level than are maximally allowed, continue
-            num_points_to_reduce_opacity = len(points) - opacity_threshold
-            if num_points_to_reduce_opacity < 1:
-                continue
+    def _move_point_markers(self, plot_service : PlotlyPlotSerivce, get_marker_id : Callable[[str], str], point_cords : dict[str, tuple[float, float]]):
+        point_cords = {point_id: cords for point_id, cords in point_cords.items() if cords[0] is not None}
+        plot_service.set_points_coordinates(
+            self._plot_figure,
+            [get_marker_id(point_id) for point_id in point_cords],
+            [cords[0] for cords in point_cords.values()],
+            [cords[1] for cords in point_cords.values()]
+        )
 
-            reduced_opacity = list(self._points_by_opacity.keys())[i+1]
-            for point_index in range(num_points_to_reduce_opacity):
-                point_id = points[point_index]
-                scatter_trace, point_scatter_index = self._scatter_plot_service.get_trace_and_point_index_by_point_id(self._plot_figure, point_id)
-                if scatter_trace is None or point_scatter_index is None:
-                    logger.warn(f"could not find point in figure when attempting to reduce opacity. Point:{point_id}")
-                    continue
 
-                self._scatter_plot_service.update_point_opacity(self._plot_figure, scatter_trace, point_scatter_index, reduced_opacity)
-                self._points_by_opacity[reduced_opacity].append(point_id)
+    # Creates a new figure holding the points, with their opacity following from the order of the points. Selected and highlighted points that are no longer plotted are dropped.
+    def _recreate_plot(self, x : np.ndarray, y : np.ndarray, point_ids : np.ndarray, labels : np.ndarray, texts : np.ndarray):
+        self._opacity_bookkeeping_service = self._create_opacity_bookkeeping_service()
+        self._opacity_bookkeeping_service.add_points(point_ids)
+        opacity_values = self._opacity_bookkeeping_service.get_opacity_values()
 
-            # remove all points of the old opacity value that were assigned a lower opacity value
-            del points[:num_points_to_reduce_opacity]
+        # points in the aggregated last opacity level are only added to the density histograms
+        is_aggregated = self._opacity_bookkeeping_service.get_aggregated_mask()
+        new_figure = self._scatter_plot_service.create_figure(
+            self._resolve_scatter_plot_settings(),
+            x[~is_aggregated],
+            y[~is_aggregated],
+            point_ids[~is_aggregated],
+            labels[~is_aggregated],
+            texts[~is_aggregated],
+            opacity_values[~is_aggregated]
+        )
+        if is_aggregated.any():
+            self._density_plot_service.add_points(x[is_aggregated], y[is_aggregated], point_ids[is_aggregated], labels[is_aggregated])
+        self._spatial_index.clear()
+        self._spatial_index.add_points(x, y, point_ids, texts)
+
+        self._points = {point_id: label for point_id, label in zip(point_ids, labels)}
+        logger.warn(f"assign new figure. {len(new_figure.data)}")
+        self._plot_figure = new_figure
+        self._is_full_figure_changed = True
+
+        selected_point_ids = [point_id for point_id in self._selected_points if point_id in self._points]
+        self._selected_points = {}
+        for point_id in selected_point_ids:
+            self.select_point(point_id)
+        highlighted_point_ids = [point_id for point_id in self._highlighted_points_ids if point_id in self._points]
+        self._highlighted_points_ids = []
+        for point_id in highlighted_point_ids:
+            self.highlight_point(point_id)
+
+
+    def _are_plotted_points(self, point_ids : Iterable[str]) -> bool:
+        return len(point_ids) == len(self._points) and all(point_id in self._points for point_id in point_ids)
+
+
+    # Moves points from the scatter traces to the density histograms of their labels.
+    def _aggregate_points(self, point_ids : Iterable[str]):
+        x, y = self._scatter_plot_service.remove_points(self._plot_figure, point_ids)
+        is_plotted = ~np.isnan(x)
+        point_ids = np.asarray(point_ids, dtype=object)[is_plotted]
+        labels = [self._points[point_id] for point_id in point_ids]
+        self._density_plot_service.add_points(x[is_plotted], y[is_plotted], point_ids, labels)
+
+
+    # Points in the density histograms are no longer in the scatter traces, their coordinates are kept by the density service.
+    def _get_point_coordinates(self, point_id : str) -> tuple[float, float]:
+        if self._density_plot_service.contains_point(point_id):
+            return self._density_plot_service.get_point_coordinates(point_id)
+        return self._scatter_plot_service.get_point_coordinates(self._plot_figure, point_id)
+
+
+    # mirrors the conditions under which _take_snapshot() advances the version
+    def _has_pending_changes(self) -> bool:
+        return (self._is_full_figure_changed
+            or len(self._plot_figure.data) != self._n_traces
+            or self._scatter_plot_service.has_changes())
+
+
+    # Writes the buffered changes to the figure and logs them under a new version.
+    def _take_snapshot(self):
+        changes = self._scatter_plot_service.materialize(self._plot_figure)
+        if len(self._plot_figure.data) != self._n_traces:
+            self._n_traces = len(self._plot_figure.data)
+            self._is_full_figure_changed = True
+
+        if self._is_full_figure_changed:
+            self._version += 1
+            self._full_figure_version = self._version
+            self._change_log.clear()
+            self._is_full_figure_changed = False
+        elif len(changes) > 0:
+            self._version += 1
+            self._change_log.append((self._version, changes))
+
+
+    # Combines the logged changes after since_version. A path that was replaced in any of the versions is set to its current values, otherwise the appended entries are concatenated.
+    def _get_patch_operations(self, since_version : int) -> list[tuple[int, str, str, list]]:
+        replaced_paths_by_uid : dict[str, set[str]] = {}
+        appended_values_by_uid : dict[str, dict[str, list[np.ndarray]]] = {}
+        for version, changes in self._change_log:
+            if version <= since_version:
+                continue
+            for uid, (replaced_paths, appended_values) in changes.items():
+                replaced_paths_by_uid.setdefault(uid, set()).update(replaced_paths)
+                for path, values in appended_values.items():
+                    if len(values) > 0:
+                        appended_values_by_uid.setdefault(uid, {}).setdefault(path, []).append(values)
+
+        trace_indices = {trace.uid: index for index, trace in enumerate(self._plot_figure.data)}
+        operations = []
+        for uid, replaced_paths in replaced_paths_by_uid.items():
+            trace = self._plot_figure.data[trace_indices[uid]]
+            for path in replaced_paths:
+                operations.append((trace_indices[uid], path, 'set', np.asarray(trace[path]).tolist()))
+        for uid, appended_values in appended_values_by_uid.items():
+            replaced_paths = replaced_paths_by_uid.get(uid, set())
+            for path, values in appended_values.items():
+                if path not in replaced_paths:
+                    operations.append((trace_indices[uid], path, 'extend', np.concatenate(values).tolist()))
+        return operations
 
 
     def _resolve_data(self, data : Iterable) -> pd.DataFrame:
@@ -430,17 +702,6 @@ class ProjectorPlotManager():
         return random_color
     
 
-    def _get_num_plotted_points(self):
-        return sum([len(points) for points in self._points_by_opacity.values()])
-    
-
-    def _get_opacity_values_chronoligical_order(self):
-        opacity_values = []
-        for opacity, points in reversed(self._points_by_opacity.items()):
-            opacity_values.extend([opacity] * len(points))
-        return opacity_values
-    
-
     def _update_axis_ranges(self, data : pd.DataFrame):
         if data is None or len(data) < 1:
             return
@@ -10,7 +10,17 @@ class ProjectorSettings():
     fit_reducer_when_initiating : bool = False   # obsolete
     stream_buffer_size_s : float = 10
     sampling_frequency : float = 1
+    adaptive_sampling : bool = False
+    min_sampling_frequency : float = 0.5
+    target_batch_size : int = 32
+    target_read_latency_s : float | None = 0.5
     model_update_frequency : float = 1
+    training_preemption_policy : str = "latest-wins"
+    adaptive_model_update : bool = False
+    min_model_update_frequency : float = 0.01
+    training_cpu_duty_cycle : float = 0.5
+    checkpoint_path : str | None = None
+    restore_checkpoint_on_launch : bool = False
 
     hyperparameters : dict[str, any] = {}
     labels_map : dict[str] = {0: 'one', 1: 'two', 2: 'three', 3: 'four'}
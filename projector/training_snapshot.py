@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from projector.projection_methods.projection_method_interface import IProjectionMethod
+
+
+# A self-contained copy of everything needed to fit a new projection model iteration.
+# Snapshots are taken by the Projector and may be fitted in a different process than the one they were taken in.
+class TrainingSnapshot():
+    snapshot_id : int
+    model : IProjectionMethod
+    data : pd.DataFrame
+    labels : list[int]
+    time_points : list[float]
+    projections : np.ndarray[float]
+
+
+    def __init__(self, snapshot_id : int, model : IProjectionMethod, data : pd.DataFrame, labels : list[int], time_points : list[float], projections : np.ndarray[float]):
+        self.snapshot_id = snapshot_id
+        self.model = model
+        self.data = data
+        self.labels = labels
+        self.time_points = time_points
+        self.projections = projections
+
+
+class TrainingResult():
+    snapshot_id : int
+    model : IProjectionMethod | None
+    error : str | None
+    wall_time_s : float
+    cpu_time_s : float
+
+
+    def __init__(self, snapshot_id : int, model : IProjectionMethod | None, error : str | None = None, wall_time_s : float = 0, cpu_time_s : float = 0):
+        self.snapshot_id = snapshot_id
+        self.model = model
+        self.error = error
+        self.wall_time_s = wall_time_s
+        self.cpu_time_s = cpu_time_s
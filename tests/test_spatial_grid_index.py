@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+from plotting.spatial_grid_index import SpatialGridIndex, GRID_EXTENT, GRID_MAX_LEVEL
+
+# The grid index queries are compared to a brute force search over all points on random inputs.
+
+SEEDS = range(20)
+
+
+def _get_cell(value : float, level : int) -> int:
+    n_cells = 2**level
+    cell_size = (GRID_EXTENT[1] - GRID_EXTENT[0]) / n_cells
+    return int(min(max(np.floor((value - GRID_EXTENT[0]) / cell_size), 0), n_cells - 1))
+
+
+def _get_cell_range(axis_range : list[float], level : int) -> range:
+    return range(_get_cell(min(axis_range), level), _get_cell(max(axis_range), level) + 1)
+
+
+def _get_rows_in_box_brute_force(x : np.ndarray, y : np.ndarray, x_range : list[float], y_range : list[float]) -> list[int]:
+    x_cells = _get_cell_range(x_range, GRID_MAX_LEVEL)
+    y_cells = _get_cell_range(y_range, GRID_MAX_LEVEL)
+    return [row for row in range(len(x)) if _get_cell(x[row], GRID_MAX_LEVEL) in x_cells and _get_cell(y[row], GRID_MAX_LEVEL) in y_cells]
+
+
+# all points in the viewport cells at the finest level that fits the budget, or the most recent point of each cell at a coarser level
+def _query_brute_force(x : np.ndarray, y : np.ndarray, x_range : list[float], y_range : list[float], budget : int) -> list[int]:
+    if budget <= 0:
+        return []
+    for level in range(GRID_MAX_LEVEL, -1, -1):
+        x_cells = _get_cell_range(x_range, level)
+        y_cells = _get_cell_range(y_range, level)
+        if len(x_cells) * len(y_cells) <= budget or level == 0:
+            break
+
+    rows_by_cell = {}
+    for row in range(len(x)):
+        cell = (_get_cell(x[row], level), _get_cell(y[row], level))
+        if cell[0] in x_cells and cell[1] in y_cells:
+            rows_by_cell.setdefault(cell, []).append(row)
+
+    if level == GRID_MAX_LEVEL:
+        rows = sorted(row for cell_rows in rows_by_cell.values() for row in cell_rows)
+        return rows[-budget:]
+    return sorted(max(cell_rows) for cell_rows in rows_by_cell.values())
+
+
+def _create_index(rng : np.random.Generator) -> tuple[SpatialGridIndex, np.ndarray, np.ndarray]:
+    index = SpatialGridIndex()
+    x = np.zeros(0)
+    y = np.zeros(0)
+    # added in several blocks, with points outside the extent and clusters sharing cells
+    for _ in range(rng.integers(1, 5)):
+        n_points = int(rng.integers(0, 300))
+        block_x = np.concatenate((rng.uniform(-0.5, 1.5, n_points), rng.normal(0.3, 0.01, n_points // 4)))
+        block_y = np.concatenate((rng.uniform(-0.5, 1.5, n_points), rng.normal(0.6, 0.01, n_points // 4)))
+        first_id = len(x)
+        point_ids = [str(point_id) for point_id in range(first_id, first_id + len(block_x))]
+        index.add_points(block_x, block_y, point_ids, [f"time: {point_id}" for point_id in point_ids])
+        x = np.concatenate((x, block_x))
+        y = np.concatenate((y, block_y))
+    return index, x, y
+
+
+def _create_range(rng : np.random.Generator) -> list[float]:
+    # reversed ranges are passed by plotly for reversed axes
+    return rng.uniform(-0.5, 1.5, 2).tolist()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_get_rows_in_box_equals_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    index, x, y = _create_index(rng)
+
+    for _ in range(10):
+        x_range = _create_range(rng)
+        y_range = _create_range(rng)
+        rows = index.get_rows_in_box(x_range, y_range)
+
+        assert sorted(rows.tolist()) == _get_rows_in_box_brute_force(x, y, x_range, y_range)
+        # includes all points within the box
+        is_in_box = (x >= min(x_range)) & (x <= max(x_range)) & (y >= min(y_range)) & (y <= max(y_range))
+        assert set(np.flatnonzero(is_in_box).tolist()) <= set(rows.tolist())
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_query_equals_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    index, x, y = _create_index(rng)
+
+    for budget in [0, 1, 5, 50, 1000, 100000]:
+        x_range = _create_range(rng)
+        y_range = _create_range(rng)
+        rows = index.query(x_range, y_range, budget)
+
+        assert rows.tolist() == _query_brute_force(x, y, x_range, y_range, budget)
+        assert len(rows) <= budget
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_get_points_returns_the_added_points(seed):
+    rng = np.random.default_rng(seed)
+    index, x, y = _create_index(rng)
+
+    rows = rng.integers(0, len(x), 20) if len(x) > 0 else np.zeros(0, dtype=int)
+    points_x, points_y, point_ids, texts = index.get_points(rows)
+
+    np.testing.assert_array_equal(points_x, x[rows])
+    np.testing.assert_array_equal(points_y, y[rows])
+    assert point_ids.tolist() == [str(row) for row in rows]
+    assert texts.tolist() == [f"time: {row}" for row in rows]
+
+
+def test_query_with_a_negative_budget_returns_no_rows():
+    index = SpatialGridIndex()
+    index.add_points([0.5, 0.5], [0.5, 0.5], ['0', '1'], ['', ''])
+
+    assert len(index.query([0, 1], [0, 1], -1)) == 0
+    assert len(index.query([0, 1], [0, 1], 0)) == 0
+
+
+def test_clear_removes_all_points():
+    index = SpatialGridIndex()
+    index.add_points([0.5], [0.5], ['0'], [''])
+    index.clear()
+
+    assert len(index) == 0
+    assert len(index.query([0, 1], [0, 1], 10)) == 0
+    assert len(index.get_rows_in_box([0, 1], [0, 1])) == 0
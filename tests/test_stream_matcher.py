@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from utils.streaming.stream_settings import StreamSettings
+from utils.streaming.stream_matcher import StreamMatcher
+
+# The vectorized matching schemes are compared to the loops they replaced, or to a plain loop over their definition, on random inputs.
+
+SEEDS = range(20)
+
+
+def _create_stream_matcher(scheme : str) -> StreamMatcher:
+    settings = StreamSettings()
+    settings.label_feature_matching_scheme = scheme
+    return StreamMatcher(settings)
+
+
+def _create_time_points(rng : np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    feature_time_points = np.cumsum(rng.uniform(0.5, 1.5, rng.integers(1, 200)))
+    # from much sparser to denser than the features, so several entries may share the same nearest feature
+    n_auxiliary_entries = rng.integers(1, 2 * len(feature_time_points) + 2)
+    auxiliary_time_points = np.sort(rng.uniform(-5, feature_time_points[-1] + 5, n_auxiliary_entries))
+    return feature_time_points, auxiliary_time_points
+
+
+# the greedy loop of the match-samples time point matching before it was vectorized
+def _match_time_points_match_samples_loop(feature_time_points : np.ndarray, auxiliary_time_points : np.ndarray) -> list[tuple[int, int]]:
+    n_feature_entries = len(feature_time_points)
+    start_index = 0
+    matching_indeces = []
+    for i, auxiliary_time_point in enumerate(auxiliary_time_points):
+        smallest_dist_time = float('inf')
+        smallest_j = start_index
+        for j in range(start_index, n_feature_entries):
+            dist_time = abs(auxiliary_time_point - feature_time_points[j])
+            if dist_time > smallest_dist_time:
+                break
+            smallest_dist_time = dist_time
+            smallest_j = j
+
+        matching_indeces.append((smallest_j, i))
+        start_index = smallest_j + 1
+        if start_index >= n_feature_entries:
+            break
+    return matching_indeces
+
+
+# the loop of the match-samples entry id matching before it was vectorized
+def _match_entry_ids_match_samples_loop(feature_ids : np.ndarray, auxiliary_ids : np.ndarray) -> list[tuple[int, int]]:
+    matching_indeces = []
+    for label_index, sample_id in enumerate(auxiliary_ids):
+        for feature_index, feature_id in enumerate(feature_ids):
+            if feature_id == sample_id:
+                matching_indeces.append((feature_index, label_index))
+    return sorted(matching_indeces, key=lambda indices: indices[0])
+
+
+def _match_until_next_loop(feature_keys : np.ndarray, auxiliary_keys : np.ndarray) -> list[tuple[int, int]]:
+    matching_indeces = []
+    for feature_index, feature_key in enumerate(feature_keys):
+        previous_indices = [index for index, auxiliary_key in enumerate(auxiliary_keys) if auxiliary_key <= feature_key]
+        if len(previous_indices) > 0:
+            matching_indeces.append((feature_index, previous_indices[-1]))
+    return matching_indeces
+
+
+def _match_from_previous_loop(feature_keys : np.ndarray, auxiliary_keys : np.ndarray) -> list[tuple[int, int]]:
+    matching_indeces = []
+    for feature_index, feature_key in enumerate(feature_keys):
+        next_indices = [index for index, auxiliary_key in enumerate(auxiliary_keys) if auxiliary_key >= feature_key]
+        if len(next_indices) > 0:
+            matching_indeces.append((feature_index, next_indices[0]))
+    return matching_indeces
+
+
+def _to_pairs(matching_indeces : np.ndarray | None) -> list[tuple[int, int]]:
+    if matching_indeces is None:
+        return []
+    return [tuple(pair) for pair in np.asarray(matching_indeces).tolist()]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_time_point_match_samples_equals_greedy_loop(seed):
+    rng = np.random.default_rng(seed)
+    feature_time_points, auxiliary_time_points = _create_time_points(rng)
+    features = rng.normal(size=(len(feature_time_points), 3))
+    labels = rng.integers(0, 4, len(auxiliary_time_points))
+
+    matching_indeces, matched_features, matched_time_points, matched_labels = _create_stream_matcher("match-samples").get_shared_features_by_time_points(features, labels, feature_time_points, auxiliary_time_points)
+
+    expected = _match_time_points_match_samples_loop(feature_time_points, auxiliary_time_points)
+    assert _to_pairs(matching_indeces) == expected
+    np.testing.assert_array_equal(matched_features, features[[pair[0] for pair in expected]])
+    np.testing.assert_array_equal(matched_time_points, feature_time_points[[pair[0] for pair in expected]])
+    np.testing.assert_array_equal(matched_labels, labels[[pair[1] for pair in expected]])
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("scheme, matching_loop", [("until-next", _match_until_next_loop), ("from-previous", _match_from_previous_loop)])
+def test_time_point_schemes_equal_loops(seed, scheme, matching_loop):
+    rng = np.random.default_rng(seed)
+    feature_time_points, auxiliary_time_points = _create_time_points(rng)
+    features = rng.normal(size=(len(feature_time_points), 3))
+    labels = rng.integers(0, 4, len(auxiliary_time_points))
+
+    matching_indeces, _, _, _ = _create_stream_matcher(scheme).get_shared_features_by_time_points(features, labels, feature_time_points, auxiliary_time_points)
+
+    assert _to_pairs(matching_indeces) == matching_loop(feature_time_points, auxiliary_time_points)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_entry_id_match_samples_equals_loop(seed):
+    rng = np.random.default_rng(seed)
+    # unordered ids with duplicates in both streams
+    feature_ids = rng.integers(0, 50, rng.integers(1, 100))
+    auxiliary_ids = rng.integers(0, 50, rng.integers(1, 100))
+    features = rng.normal(size=(len(feature_ids), 3))
+    labels = rng.integers(0, 4, len(auxiliary_ids))
+
+    matching_indeces, _, _, matched_labels = _create_stream_matcher("match-samples").get_shared_features_by_id(features, np.arange(len(feature_ids)), labels, feature_ids, auxiliary_ids)
+
+    expected = _match_entry_ids_match_samples_loop(feature_ids, auxiliary_ids)
+    assert sorted(_to_pairs(matching_indeces)) == sorted(expected)
+    # ordered by feature index
+    assert [pair[0] for pair in _to_pairs(matching_indeces)] == [pair[0] for pair in expected]
+    if len(expected) > 0:
+        np.testing.assert_array_equal(np.sort(matched_labels), np.sort(labels[[pair[1] for pair in expected]]))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("scheme, matching_loop", [("until-next", _match_until_next_loop), ("from-previous", _match_from_previous_loop)])
+def test_entry_id_schemes_equal_loops(seed, scheme, matching_loop):
+    rng = np.random.default_rng(seed)
+    feature_ids = np.sort(rng.integers(0, 300, rng.integers(1, 100)))
+    auxiliary_ids = np.sort(rng.integers(0, 300, rng.integers(1, 30)))
+    features = rng.normal(size=(len(feature_ids), 3))
+    labels = rng.integers(0, 4, len(auxiliary_ids))
+
+    matching_indeces, _, _, _ = _create_stream_matcher(scheme).get_shared_features_by_id(features, np.arange(len(feature_ids)), labels, feature_ids, auxiliary_ids)
+
+    assert _to_pairs(matching_indeces) == matching_loop(feature_ids, auxiliary_ids)
+
+
+def test_match_samples_moves_entries_sharing_a_feature_to_the_following_features():
+    feature_time_points = np.array([0.0, 1.0, 2.0, 3.0])
+    auxiliary_time_points = np.array([0.9, 1.0, 1.1, 2.9, 3.0])
+
+    matching_indeces = _create_stream_matcher("match-samples")._match_time_points_match_samples(feature_time_points, auxiliary_time_points)
+
+    # the last entry is left without a feature
+    assert _to_pairs(matching_indeces) == [(1, 0), (2, 1), (3, 2)]
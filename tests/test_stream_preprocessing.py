@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from utils.streaming.stream_preprocessing import create_preprocessing_pipeline
+
+# The preprocessing pipelines are compared to plain loops over the definition of their steps, and to themselves when the stream is split into different reads.
+
+SEEDS = range(10)
+
+
+def _window_loop(features : np.ndarray, window_size : int, hop_size : int) -> np.ndarray:
+    windows = [features[start:start + window_size].reshape(-1) for start in range(0, len(features) - window_size + 1, hop_size)]
+    return np.array(windows).reshape(len(windows), window_size * features.shape[1])
+
+
+def _moving_average_loop(features : np.ndarray, window_size : int) -> np.ndarray:
+    return np.array([features[max(i - window_size + 1, 0):i + 1].mean(axis=0) for i in range(len(features))])
+
+
+def _process_in_reads(step_configs : list[dict], features : np.ndarray, time_points : np.ndarray, read_sizes : list[int]) -> tuple[np.ndarray, np.ndarray]:
+    pipeline = create_preprocessing_pipeline(step_configs)
+    processed_features = []
+    processed_time_points = []
+    for start, end in zip(np.cumsum([0] + read_sizes[:-1]), np.cumsum(read_sizes)):
+        block_features, block_time_points, _ = pipeline.process(features[start:end], time_points[start:end], None)
+        if block_features is not None:
+            processed_features.append(block_features)
+            processed_time_points.append(block_time_points)
+    if len(processed_features) == 0:
+        return np.zeros((0, 0)), np.zeros(0)
+    return np.concatenate(processed_features), np.concatenate(processed_time_points)
+
+
+def _create_read_sizes(rng : np.random.Generator, n_samples : int) -> list[int]:
+    read_sizes = []
+    while sum(read_sizes) < n_samples:
+        read_sizes.append(int(min(rng.integers(1, 20), n_samples - sum(read_sizes))))
+    return read_sizes
+
+
+@pytest.mark.parametrize("window_size, hop_size", [(1, None), (4, None), (4, 2), (3, 5)])
+@pytest.mark.parametrize("in_place_step", ["z-score", "moving-average"])
+def test_windowing_step_followed_by_in_place_step(window_size, hop_size, in_place_step):
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(50, 2))
+    time_points = np.arange(50, dtype=float)
+    step_configs = [{"step": "window", "window-size": window_size, "hop-size": hop_size}, {"step": in_place_step, "window-size": 3}]
+
+    processed_features, processed_time_points = _process_in_reads(step_configs, features, time_points, [len(features)])
+
+    windows = _window_loop(features, window_size, hop_size or window_size)
+    if in_place_step == "z-score":
+        expected = (windows - windows.mean(axis=0)) / windows.std(axis=0, ddof=1)
+    else:
+        expected = _moving_average_loop(windows, 3)
+    np.testing.assert_allclose(processed_features, expected)
+    np.testing.assert_array_equal(processed_time_points, np.arange(window_size - 1, len(features), hop_size or window_size)[:len(windows)])
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("step_configs", [
+    [{"step": "moving-average", "window-size": 5}],
+    [{"step": "window", "window-size": 4, "hop-size": 2}, {"step": "moving-average", "window-size": 3}],
+    [{"step": "moving-average", "window-size": 2}, {"step": "log-band-power", "window-size": 8, "hop-size": 4}, {"step": "moving-average", "window-size": 2}],
+])
+def test_result_does_not_depend_on_the_reads(seed, step_configs):
+    rng = np.random.default_rng(seed)
+    features = rng.normal(size=(100, 3))
+    time_points = np.arange(100, dtype=float)
+
+    expected_features, expected_time_points = _process_in_reads(step_configs, features, time_points, [len(features)])
+    processed_features, processed_time_points = _process_in_reads(step_configs, features, time_points, _create_read_sizes(rng, len(features)))
+
+    np.testing.assert_allclose(processed_features, expected_features)
+    np.testing.assert_array_equal(processed_time_points, expected_time_points)
+
+
+def test_moving_average_equals_loop():
+    features = np.random.default_rng(0).normal(size=(30, 2))
+
+    processed_features, _ = _process_in_reads([{"step": "moving-average", "window-size": 4}], features, np.arange(30, dtype=float), [30])
+
+    np.testing.assert_allclose(processed_features, _moving_average_loop(features, 4))
+
+
+def test_pipeline_does_not_alter_the_read_block():
+    features = np.random.default_rng(0).normal(size=(10, 2))
+    read_block = features.copy()
+
+    _process_in_reads([{"step": "z-score"}], read_block, np.arange(10, dtype=float), [10])
+
+    np.testing.assert_array_equal(read_block, features)
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from plotting.trace_buffer import TraceBuffer
+
+# The trace buffer is compared to a plain list of points on random sequences of operations.
+# A client that applies the changes returned by take_changes() must end up with the values of the buffer, as the dashboard does with the patch operations.
+
+SEEDS = range(20)
+PATHS = ['ids', 'x', 'y', 'text']
+
+
+def _create_points(rng : np.random.Generator, first_id : int, n_points : int) -> dict[str, list]:
+    point_ids = [str(point_id) for point_id in range(first_id, first_id + n_points)]
+    return {
+        'ids': point_ids,
+        'x': rng.normal(size=n_points).tolist(),
+        'y': rng.normal(size=n_points).tolist(),
+        'text': [f"time: {point_id}" for point_id in point_ids],
+    }
+
+
+def _assert_equals_model(buffer : TraceBuffer, points : list[dict[str, any]], is_removed : list[bool]):
+    positions = [position for position, removed in enumerate(is_removed) if not removed]
+    assert len(buffer) == len(positions)
+    np.testing.assert_array_equal(buffer.get_positions(), positions)
+    for path in PATHS:
+        assert buffer.get_values(path).tolist() == [points[position][path] for position in positions]
+
+
+# applies the changes as materializing the trace and patching the client figure does
+def _apply_changes(client : dict[str, list], buffer : TraceBuffer):
+    replaced_paths, appended_values = buffer.take_changes()
+    for path in replaced_paths:
+        client[path] = buffer.get_values(path).tolist()
+    for path, values in appended_values.items():
+        client[path].extend(values.tolist())
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_trace_buffer_equals_list_model(seed):
+    rng = np.random.default_rng(seed)
+    buffer = TraceBuffer(PATHS)
+    points = []
+    is_removed = []
+    client = {path: [] for path in PATHS}
+    n_created = 0
+
+    for _ in range(200):
+        operation = rng.choice(['append', 'remove', 'set', 'clear', 'compact', 'take_changes'], p=[0.35, 0.2, 0.15, 0.02, 0.08, 0.2])
+        match operation:
+            case 'append':
+                n_points = int(rng.integers(0, 100))
+                values = _create_points(rng, n_created, n_points)
+                n_created += n_points
+                positions = buffer.append(values)
+                np.testing.assert_array_equal(positions, np.arange(len(points), len(points) + n_points))
+                points.extend({path: values[path][i] for path in PATHS} for i in range(n_points))
+                is_removed.extend([False] * n_points)
+            case 'remove':
+                if len(points) == 0:
+                    continue
+                # may include points that were removed before
+                positions = rng.integers(0, len(points), int(rng.integers(1, 10)))
+                buffer.remove(positions)
+                for position in positions:
+                    is_removed[position] = True
+            case 'set':
+                if len(points) == 0:
+                    continue
+                positions = np.unique(rng.integers(0, len(points), int(rng.integers(1, 10))))
+                values = rng.normal(size=len(positions))
+                path = rng.choice(['x', 'y'])
+                buffer.set(path, positions, values)
+                for position, value in zip(positions, values.tolist()):
+                    points[position][path] = value
+            case 'clear':
+                buffer.clear()
+                points = []
+                is_removed = []
+            case 'compact':
+                if not buffer.needs_compaction():
+                    continue
+                previous_positions = buffer.compact()
+                np.testing.assert_array_equal(previous_positions, [position for position, removed in enumerate(is_removed) if not removed])
+                points = [points[position] for position in previous_positions]
+                is_removed = [False] * len(points)
+            case 'take_changes':
+                _apply_changes(client, buffer)
+                assert not buffer.is_dirty
+                for path in PATHS:
+                    assert client[path] == buffer.get_values(path).tolist()
+
+        _assert_equals_model(buffer, points, is_removed)
+
+    _apply_changes(client, buffer)
+    for path in PATHS:
+        assert client[path] == buffer.get_values(path).tolist()
+
+
+def test_take_changes_returns_only_appended_entries():
+    rng = np.random.default_rng(0)
+    buffer = TraceBuffer(PATHS, _create_points(rng, 0, 3))
+    assert not buffer.is_dirty
+
+    values = _create_points(rng, 3, 2)
+    buffer.append(values)
+    replaced_paths, appended_values = buffer.take_changes()
+
+    assert len(replaced_paths) == 0
+    assert sorted(appended_values.keys()) == sorted(PATHS)
+    for path in PATHS:
+        assert appended_values[path].tolist() == values[path]
+
+    replaced_paths, appended_values = buffer.take_changes()
+    assert len(replaced_paths) == 0
+    assert all(len(values) == 0 for values in appended_values.values())
+
+
+def test_take_changes_replaces_the_set_path_and_appends_the_others():
+    rng = np.random.default_rng(0)
+    buffer = TraceBuffer(PATHS, _create_points(rng, 0, 3))
+    values = _create_points(rng, 3, 2)
+    buffer.append(values)
+    buffer.set('x', [0], [10.0])
+
+    replaced_paths, appended_values = buffer.take_changes()
+
+    assert replaced_paths == {'x'}
+    assert 'x' not in appended_values
+    assert appended_values['ids'].tolist() == values['ids']
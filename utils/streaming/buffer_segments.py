@@ -0,0 +1,70 @@
+import numpy as np
+
+
+# Read-only view on a range of a ring buffer. A range that wraps around the end of the buffer consists of two segments,
+# any other range of a single one. The segments are views, the buffer content is only copied when rows are gathered.
+class BufferSegments():
+    segments : list[np.ndarray]
+    _segment_starts : np.ndarray
+
+
+    def __init__(self, segments : list[np.ndarray]):
+        # an empty segment is only kept when there is no other, so the dtype and row shape stay known
+        self.segments = [segment for segment in segments if len(segment) > 0] or segments[:1]
+        segment_lengths = [len(segment) for segment in self.segments]
+        self._segment_starts = np.cumsum([0] + segment_lengths)
+
+
+    @classmethod
+    def from_ring_buffer(cls, buffer : np.ndarray, start : int, count : int) -> "BufferSegments":
+        end = start + count
+        if end <= len(buffer):
+            return cls([buffer[start:end]])
+        return cls([buffer[start:], buffer[:end - len(buffer)]])
+
+
+    def __len__(self) -> int:
+        return int(self._segment_starts[-1])
+
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return (len(self),) + self.segments[0].shape[1:]
+
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.segments[0].dtype
+
+
+    # Applies a function to each segment, e.g. selecting a column range. The function should return a view to avoid copies.
+    def map(self, function) -> "BufferSegments":
+        return BufferSegments([function(segment) for segment in self.segments])
+
+
+    # Gathers the rows at the given (increasing or unordered) indices into a single array, optionally written into a preallocated buffer.
+    def take(self, indices : np.ndarray, out : np.ndarray = None) -> np.ndarray:
+        indices = np.asarray(indices, dtype=int)
+        if out is None:
+            out = np.empty((len(indices),) + self.shape[1:], dtype=self.dtype)
+        else:
+            out = out[:len(indices)]
+
+        if len(self.segments) == 1:
+            np.take(self.segments[0], indices, axis=0, out=out)
+            return out
+
+        for segment_index, segment in enumerate(self.segments):
+            segment_start = self._segment_starts[segment_index]
+            in_segment = (indices >= segment_start) & (indices < self._segment_starts[segment_index + 1])
+            out[in_segment] = segment[indices[in_segment] - segment_start]
+        return out
+
+
+    # Returns the rows as a single array. Only copies when the range wraps around or an output buffer is given.
+    def to_array(self, out : np.ndarray = None) -> np.ndarray:
+        if len(self.segments) == 1 and out is None:
+            return self.segments[0]
+        if out is None:
+            return np.concatenate(self.segments, axis=0)
+        return np.concatenate(self.segments, axis=0, out=out[:len(self)])
@@ -0,0 +1,140 @@
+import time
+import numpy as np
+
+from utils.logging import logger
+
+# Estimates the offset of the auxiliary stream clock relative to the feature stream clock, so auxiliary time points can be mapped onto the feature clock before matching.
+# The offset is composed of three parts:
+# - the static auxiliary-stream-drift-ms of the config, used as the initial estimate,
+# - the difference of the LSL time corrections of both inlets, which accounts for streams sent from different machines,
+# - a robust, exponentially weighted linear regression of the remaining offset over the time of matched (feature, auxiliary) time point pairs, which tracks the offset and its drift.
+
+TIME_CORRECTION_TIMEOUT_S = 0.1
+
+
+class ClockOffsetEstimator():
+    _static_offset_s : float
+    _half_life_s : float
+    _outlier_threshold : float
+    _min_residual_scale_s : float
+    _time_correction_interval_s : float
+
+    _time_correction_offset_s : float = 0
+    _last_time_correction : float = None
+
+    # exponentially weighted sums of the regression, x is the feature time relative to _origin_time, y the residual offset
+    _origin_time : float = None
+    _last_update_time : float = None
+    _sum_w : float = 0
+    _sum_x : float = 0
+    _sum_y : float = 0
+    _sum_xx : float = 0
+    _sum_xy : float = 0
+    _residual_scale_s : float = None
+
+
+    def __init__(self, static_offset_ms : float = 0, half_life_s : float = 30, time_correction_interval_s : float = 5, outlier_threshold : float = 4, min_residual_scale_ms : float = 0.5):
+        self._static_offset_s = (static_offset_ms or 0) * 10**-3
+        self._half_life_s = half_life_s
+        self._time_correction_interval_s = time_correction_interval_s
+        self._outlier_threshold = outlier_threshold
+        self._min_residual_scale_s = min_residual_scale_ms * 10**-3
+
+
+    # Returns the estimated offset (auxiliary clock - feature clock) in seconds at the given feature time points.
+    def get_offset(self, feature_time_points : np.ndarray | float) -> np.ndarray | float:
+        return self._static_offset_s + self._time_correction_offset_s + self._predict_residual_offset(feature_time_points)
+
+
+    # Returns the estimated drift of the offset in seconds per second.
+    def get_drift(self) -> float:
+        return self._get_regression()[1]
+
+
+    # Maps auxiliary time points onto the feature clock. The offset is evaluated at the auxiliary time points, the difference is negligible for realistic drifts.
+    def to_feature_clock(self, auxiliary_time_points : np.ndarray) -> np.ndarray:
+        return auxiliary_time_points - self.get_offset(auxiliary_time_points)
+
+
+    # Queries the LSL time correction of both inlets, at most once per time correction interval. Inlets that are None (e.g. when replaying) are skipped.
+    def update_time_correction(self, feature_inlet, auxiliary_inlet):
+        if feature_inlet is None or auxiliary_inlet is None:
+            return
+        now = time.monotonic()
+        if self._last_time_correction is not None and now - self._last_time_correction < self._time_correction_interval_s:
+            return
+        self._last_time_correction = now
+
+        try:
+            # time_correction() returns the offset to add to the remote time stamps to map them onto the local clock
+            feature_correction = feature_inlet.time_correction(timeout=TIME_CORRECTION_TIMEOUT_S)
+            auxiliary_correction = auxiliary_inlet.time_correction(timeout=TIME_CORRECTION_TIMEOUT_S)
+        except Exception as e:
+            logger.debug(f"Clock offset estimation: LSL time correction unavailable, {e}")
+            return
+        self._time_correction_offset_s = feature_correction - auxiliary_correction
+
+
+    # Updates the regression with matched pairs of feature time points and (uncorrected) auxiliary time points.
+    # Pairs that deviate more than the outlier threshold times the typical residual from the current estimate are ignored.
+    def update(self, feature_time_points : np.ndarray, auxiliary_time_points : np.ndarray):
+        feature_time_points = np.asarray(feature_time_points, dtype=float)
+        auxiliary_time_points = np.asarray(auxiliary_time_points, dtype=float)
+        if len(feature_time_points) == 0:
+            return
+
+        if self._origin_time is None:
+            self._origin_time = feature_time_points[0]
+            self._last_update_time = feature_time_points[0]
+
+        offsets = auxiliary_time_points - feature_time_points - self._static_offset_s - self._time_correction_offset_s
+        residuals = offsets - self._predict_residual_offset(feature_time_points)
+        if self._residual_scale_s is None:
+            # no estimate yet, judge the pairs relative to their median
+            residuals = residuals - np.median(residuals)
+            residual_scale = max(1.4826 * np.median(np.abs(residuals)), self._min_residual_scale_s)
+        else:
+            residual_scale = max(self._residual_scale_s, self._min_residual_scale_s)
+
+        is_inlier = np.abs(residuals) <= self._outlier_threshold * residual_scale
+        if not is_inlier.any():
+            return
+        x = feature_time_points[is_inlier] - self._origin_time
+        y = offsets[is_inlier]
+
+        # decay the previous sums to the newest pair, each pair is weighted by its age within the block
+        block_end = max(x.max() + self._origin_time, self._last_update_time)
+        decay = 0.5 ** ((block_end - self._last_update_time) / self._half_life_s)
+        weights = 0.5 ** ((block_end - self._origin_time - x) / self._half_life_s)
+        self._sum_w = self._sum_w * decay + weights.sum()
+        self._sum_x = self._sum_x * decay + (weights * x).sum()
+        self._sum_y = self._sum_y * decay + (weights * y).sum()
+        self._sum_xx = self._sum_xx * decay + (weights * x * x).sum()
+        self._sum_xy = self._sum_xy * decay + (weights * x * y).sum()
+        self._last_update_time = block_end
+
+        inlier_scale = 1.2533 * np.mean(np.abs(residuals[is_inlier]))
+        if self._residual_scale_s is None:
+            self._residual_scale_s = inlier_scale
+        else:
+            self._residual_scale_s = self._residual_scale_s * decay + inlier_scale * (1 - decay)
+
+
+    # Returns the weighted means of x and y, and the slope of the regression. The slope is 0 while the pairs span too short a time to estimate it.
+    def _get_regression(self) -> tuple[float, float, float]:
+        if self._sum_w == 0:
+            return 0, 0, 0
+        mean_x = self._sum_x / self._sum_w
+        mean_y = self._sum_y / self._sum_w
+        variance_x = self._sum_xx / self._sum_w - mean_x ** 2
+        if variance_x <= 1:
+            return mean_x, 0, mean_y
+        slope = (self._sum_xy / self._sum_w - mean_x * mean_y) / variance_x
+        return mean_x, slope, mean_y
+
+
+    def _predict_residual_offset(self, feature_time_points : np.ndarray | float) -> np.ndarray | float:
+        if self._origin_time is None:
+            return 0 * np.asarray(feature_time_points, dtype=float)
+        mean_x, slope, mean_y = self._get_regression()
+        return mean_y + slope * (np.asarray(feature_time_points, dtype=float) - self._origin_time - mean_x)
@@ -0,0 +1,199 @@
+import os
+import time
+import numpy as np
+import pylsl
+from fire import Fire
+
+from configuration_resolver import ConfigurationResolver
+from utils.logging import logger
+from utils.streaming.stream_settings import *
+
+# Publishes synthetic feature and auxiliary LSL streams on localhost, laid out as configured in the [stream-settings] of the config file.
+# Intended to load test the StreamWatcher end to end, e.g.:
+#   python -m utils.streaming.lsl_load_generator --feature_rate=20000 --chunk_size=256 --auxiliary_rate=10 --jitter_ms=0.5
+
+DEFAULT_CONFIG_PATH = os.path.join(os.getcwd(), "configs", "config.toml")
+
+
+class SyntheticStreamGenerator():
+    _settings : StreamSettings
+    _n_classes : int
+    _class_duration_s : float
+    _class_means : np.ndarray
+    _noise_std : float
+    _rng : np.random.Generator
+
+
+    def __init__(self, settings : StreamSettings, n_classes : int = 3, class_duration_s : float = 2, class_separation : float = 3, noise_std : float = 1, seed : int = None):
+        self._settings = settings
+        self._n_classes = n_classes
+        self._class_duration_s = class_duration_s
+        self._noise_std = noise_std
+        self._rng = np.random.default_rng(seed)
+
+        feature_length = settings.feature_stream_layout.sections[settings.feature_section].length
+        self._class_means = self._rng.normal(0, class_separation, size=(n_classes, feature_length))
+
+
+    # the class depends only on the elapsed time, so the feature and auxiliary stream agree on it
+    def get_classes(self, elapsed_times : np.ndarray) -> np.ndarray:
+        return (elapsed_times // self._class_duration_s).astype(int) % self._n_classes
+
+
+    def create_feature_samples(self, sample_ids : np.ndarray, classes : np.ndarray, n_channels : int) -> np.ndarray:
+        layout = self._settings.feature_stream_layout
+        samples = np.zeros((len(sample_ids), n_channels))
+        _set_ids(samples, layout, sample_ids)
+
+        feature_section = layout.sections[self._settings.feature_section]
+        noise = self._rng.normal(0, self._noise_std, size=(len(sample_ids), feature_section.length))
+        samples[:, feature_section.start_index : feature_section.start_index + feature_section.length] = self._class_means[classes] + noise
+
+        if self._settings.watch_labels and not self._settings.labels_from_auxiliary_stream:
+            self._set_labels(samples, layout, classes)
+        return samples
+
+
+    def create_auxiliary_samples(self, sample_ids : np.ndarray, classes : np.ndarray, n_channels : int) -> np.ndarray:
+        layout = self._settings.auxiliary_stream_layout
+        samples = np.zeros((len(sample_ids), n_channels))
+        _set_ids(samples, layout, sample_ids)
+        self._set_labels(samples, layout, classes)
+        return samples
+
+
+    # writes the labels such that the configured label interpretation method resolves them to the given classes
+    def _set_labels(self, samples : np.ndarray, layout : StreamLayout, classes : np.ndarray):
+        label_section = layout.sections[self._settings.label_section]
+        start_index = label_section.start_index
+        match self._settings.label_interpretation_method:
+            case "one-to-one":
+                samples[:, start_index] = classes
+            case "index of highest":
+                scores = self._rng.uniform(0, 0.5, size=(len(classes), label_section.length))
+                scores[np.arange(len(classes)), classes % label_section.length] = 1
+                samples[:, start_index : start_index + label_section.length] = scores
+            case "index of lowest":
+                scores = self._rng.uniform(0.5, 1, size=(len(classes), label_section.length))
+                scores[np.arange(len(classes)), classes % label_section.length] = 0
+                samples[:, start_index : start_index + label_section.length] = scores
+            case _:
+                raise Exception(f"Load generator exception: unknown label interpretation method '{self._settings.label_interpretation_method}'.")
+
+
+# Publishes synthetic feature and auxiliary LSL streams with the stream names and layouts of the config file.
+# The auxiliary stream is only published when the labels are read from the auxiliary stream.
+# - n_channels, n_auxiliary_channels: channel counts, default to the smallest count that fits the stream layout.
+# - chunk_size: number of samples pushed to the feature outlet at once.
+# - n_classes, class_duration_s: the class switches every class_duration_s seconds, class_separation sets the standard deviation of the class means.
+# - drift_ms: constant delay of the auxiliary time stamps, jitter_ms: standard deviation of the jitter added to the time stamps of each pushed chunk.
+#   The jitter shifts a chunk as a whole and the time stamps never precede those of the previous chunk, so they stay monotonic as with a real LSL outlet.
+# - duration_s: stops after the given duration, runs until interrupted if not set.
+def run_load_generator(
+        config_path : str = DEFAULT_CONFIG_PATH,
+        feature_rate : float = 1000,
+        auxiliary_rate : float = 10,
+        chunk_size : int = 32,
+        n_channels : int = None,
+        n_auxiliary_channels : int = None,
+        n_classes : int = 3,
+        class_duration_s : float = 2,
+        class_separation : float = 3,
+        noise_std : float = 1,
+        drift_ms : float = 0,
+        jitter_ms : float = 0,
+        duration_s : float = None,
+        seed : int = None
+        ) -> int:
+    settings = ConfigurationResolver(config_path).get_stream_settings_from_config()
+    generator = SyntheticStreamGenerator(settings, n_classes, class_duration_s, class_separation, noise_std, seed)
+    rng = np.random.default_rng(seed)
+    use_auxiliary_stream = settings.watch_labels and settings.labels_from_auxiliary_stream
+
+    n_channels = n_channels or _get_min_channel_count(settings.feature_stream_layout)
+    feature_outlet = _create_outlet(settings.feature_stream_name, "Features", n_channels, feature_rate)
+    if use_auxiliary_stream:
+        n_auxiliary_channels = n_auxiliary_channels or _get_min_channel_count(settings.auxiliary_stream_layout)
+        auxiliary_outlet = _create_outlet(settings.auxiliary_stream_name, "Auxiliary", n_auxiliary_channels, auxiliary_rate)
+
+    logger.info(f"Publishing '{settings.feature_stream_name}' ({n_channels} channels, {feature_rate} Hz)" + (f" and '{settings.auxiliary_stream_name}' ({n_auxiliary_channels} channels, {auxiliary_rate} Hz)" if use_auxiliary_stream else ""))
+
+    start_time = pylsl.local_clock()
+    n_features_sent = 0
+    n_auxiliary_sent = 0
+    last_feature_time_stamp = -np.inf
+    last_auxiliary_time_stamp = -np.inf
+    try:
+        while duration_s is None or pylsl.local_clock() - start_time < duration_s:
+            elapsed = pylsl.local_clock() - start_time
+
+            n_features_due = int(elapsed * feature_rate) - n_features_sent
+            while n_features_due >= chunk_size:
+                sample_indices = np.arange(n_features_sent, n_features_sent + chunk_size)
+                sample_times = sample_indices / feature_rate
+                samples = generator.create_feature_samples(sample_indices, generator.get_classes(sample_times), n_channels)
+                time_stamps = _get_jittered_time_stamps(start_time + sample_times, jitter_ms, last_feature_time_stamp, rng)
+                last_feature_time_stamp = time_stamps[-1]
+                feature_outlet.push_chunk(samples.tolist(), time_stamps.tolist())
+                n_features_sent += chunk_size
+                n_features_due -= chunk_size
+
+            if use_auxiliary_stream:
+                n_auxiliary_due = int(elapsed * auxiliary_rate) - n_auxiliary_sent
+                if n_auxiliary_due > 0:
+                    sample_indices = np.arange(n_auxiliary_sent, n_auxiliary_sent + n_auxiliary_due)
+                    sample_times = sample_indices / auxiliary_rate
+                    # the id is that of the feature sample generated at the same time, so matching by id and by time agree
+                    feature_ids = (sample_times * feature_rate).astype(int)
+                    samples = generator.create_auxiliary_samples(feature_ids, generator.get_classes(sample_times), n_auxiliary_channels)
+                    time_stamps = _get_jittered_time_stamps(start_time + sample_times + drift_ms * 10**-3, jitter_ms, last_auxiliary_time_stamp, rng)
+                    last_auxiliary_time_stamp = time_stamps[-1]
+                    auxiliary_outlet.push_chunk(samples.tolist(), time_stamps.tolist())
+                    n_auxiliary_sent += n_auxiliary_due
+
+            time.sleep(min(chunk_size / feature_rate, 0.01) / 2)
+    except KeyboardInterrupt:
+        pass
+
+    logger.info(f"Load generator stopped after {n_features_sent} feature samples and {n_auxiliary_sent} auxiliary samples.")
+    return 0
+
+
+def _create_outlet(stream_name : str, stream_type : str, n_channels : int, sampling_rate : float) -> pylsl.StreamOutlet:
+    info = pylsl.StreamInfo(stream_name, stream_type, n_channels, sampling_rate, pylsl.cf_double64, f"onep_load_generator_{stream_name}")
+    return pylsl.StreamOutlet(info)
+
+
+# shifts the chunk by a single jitter offset and clips its time stamps to the last time stamp of the previous chunk, so they never decrease
+def _get_jittered_time_stamps(time_stamps : np.ndarray, jitter_ms : float, last_time_stamp : float, rng : np.random.Generator) -> np.ndarray:
+    jittered_time_stamps = time_stamps + rng.normal(0, jitter_ms * 10**-3)
+    return np.maximum(jittered_time_stamps, last_time_stamp)
+
+
+def _get_min_channel_count(layout : StreamLayout) -> int:
+    channel_count = max(section.start_index + section.length for section in layout.sections.values())
+    id_index = _get_id_index(layout)
+    if isinstance(id_index, int):
+        channel_count = max(channel_count, id_index + 1)
+    elif id_index == "last":
+        # the id takes an additional channel after the sections, when it is first the sections are expected to leave the first channel free
+        channel_count += 1
+    return channel_count
+
+
+def _get_id_index(layout : StreamLayout) -> int | str | None:
+    if isinstance(layout.id_index, str):
+        return str.lower(layout.id_index)
+    return layout.id_index
+
+
+def _set_ids(samples : np.ndarray, layout : StreamLayout, sample_ids : np.ndarray):
+    match _get_id_index(layout):
+        case None | "": return
+        case "first": samples[:, 0] = sample_ids
+        case "last": samples[:, -1] = sample_ids
+        case _: samples[:, layout.id_index] = sample_ids
+
+
+if __name__ == "__main__":
+    Fire(run_load_generator)
@@ -0,0 +1,405 @@
+import copy
+import os
+import shutil
+import time
+import zipfile
+from typing import Iterator
+import numpy as np
+
+from utils.logging import logger
+from utils.streaming.stream_settings import *
+from utils.streaming.stream_watcher import StreamWatcher
+from utils.streaming.stream_recorder import *
+
+REPLAY_TIME_STAMP_COLUMN = "time_stamps"
+REPLAY_DATA_KEY = "data"
+REPLAY_CACHE_SUFFIX = ".replay_cache"
+
+
+# Replays recorded sessions through the same interface as the live StreamWatcher, reading from ReplayBuffers instead of LSL streams.
+class ReplayStreamWatcher(StreamWatcher):
+    _replay_clock : "ReplayClock"
+
+
+    def __init__(self, settings : StreamSettings):
+        if settings.replay_path is None or settings.replay_path == "":
+            raise Exception("Replay exception: the replay source is selected, but no replay path is specified.")
+        self._replay_clock = ReplayClock(settings.replay_speed)
+        if is_stream_recording(settings.replay_path):
+            settings = _get_recording_replay_settings(settings)
+        super().__init__(settings)
+
+
+    def _create_stream_watcher(self, stream_name : str, buffer_size_s : float, is_auxiliary : bool = False) -> "ReplayBuffer":
+        replay_path = self._settings.replay_path
+        if is_auxiliary and self._settings.replay_auxiliary_path is not None and self._settings.replay_auxiliary_path != "":
+            replay_path = self._settings.replay_auxiliary_path
+        chunk_size = self._settings.replay_chunk_size
+        chunk_iterator_factory = lambda: iter_replay_chunks(replay_path, stream_name, chunk_size)
+
+        # only .xdf files hold more than one stream, any other recording at the replay path holds the features
+        if is_auxiliary and replay_path == self._settings.replay_path and os.path.splitext(replay_path)[1].lower() != ".xdf":
+            logger.warning(f"Replay warning: no replay-auxiliary-path is set and {replay_path} holds a single stream, the auxiliary stream '{stream_name}' is left empty, so no labels are matched.")
+            chunk_iterator_factory = lambda: iter(())
+
+        # the feature stream drives the replay clock when replaying unthrottled, the auxiliary stream follows it
+        return ReplayBuffer(
+            chunk_iterator_factory,
+            self._replay_clock,
+            buffer_size_s,
+            chunk_size,
+            drives_clock=not is_auxiliary
+        )
+
+
+    def _get_stream_time(self) -> float:
+        return self._replay_clock.get_time()
+
+
+# Replay time shared by the replay buffers of all streams, so the original offsets between the streams are preserved.
+# A speed of 0 replays unthrottled, in that case the time is advanced by the stream driving the clock.
+class ReplayClock():
+    speed : float
+    _origin_time_stamp : float = None
+    _start_time : float = None
+    _replay_time : float = -np.inf
+
+
+    def __init__(self, speed : float = 1):
+        if speed < 0:
+            raise Exception(f"Replay exception: the replay speed cannot be negative, got {speed}.")
+        self.speed = speed
+
+
+    def register_origin(self, first_time_stamp : float):
+        if self._start_time is None:
+            self._start_time = time.monotonic()
+        if self._origin_time_stamp is None or first_time_stamp < self._origin_time_stamp:
+            self._origin_time_stamp = first_time_stamp
+            self._replay_time = max(self._replay_time, first_time_stamp)
+
+
+    def is_unthrottled(self) -> bool:
+        return self.speed == 0
+
+
+    def get_time(self) -> float:
+        if self._origin_time_stamp is None:
+            return -np.inf
+        if self.is_unthrottled():
+            return self._replay_time
+        return self._origin_time_stamp + (time.monotonic() - self._start_time) * self.speed
+
+
+    def advance_to(self, time_stamp : float):
+        self._replay_time = max(self._replay_time, time_stamp)
+
+
+# Recordings of the StreamRecorder hold the already interpreted (and preprocessed) blocks returned by StreamWatcher.read().
+# They are replayed as a feature stream with the columns [id, label, features], with a matching layout replacing the configured one and without preprocessing.
+def _get_recording_replay_settings(settings : StreamSettings) -> StreamSettings:
+    first_chunk_name = min(file_name for file_name in os.listdir(settings.replay_path) if file_name.startswith(RECORDING_CHUNK_PREFIX) and file_name.endswith(".npz"))
+    with np.load(os.path.join(settings.replay_path, first_chunk_name)) as chunk:
+        has_ids = RECORDING_IDS_KEY in chunk
+        has_labels = RECORDING_LABELS_KEY in chunk
+        n_features = chunk[RECORDING_FEATURES_KEY].shape[1]
+
+    layout = StreamLayout()
+    layout.id_index = 0 if has_ids else None
+    layout.sections = {}
+    start_index = int(has_ids)
+    if has_labels:
+        layout.sections[RECORDING_LABELS_KEY] = _create_stream_section(RECORDING_LABELS_KEY, start_index, 1)
+        start_index += 1
+    layout.sections[RECORDING_FEATURES_KEY] = _create_stream_section(RECORDING_FEATURES_KEY, start_index, n_features)
+
+    replay_settings = copy.copy(settings)
+    replay_settings.feature_stream_layout = layout
+    replay_settings.feature_section = RECORDING_FEATURES_KEY
+    replay_settings.label_section = RECORDING_LABELS_KEY
+    replay_settings.watch_labels = has_labels
+    replay_settings.labels_from_auxiliary_stream = False
+    replay_settings.label_interpretation_method = "one-to-one"
+    replay_settings.preprocessing_steps = []
+    replay_settings.replay_auxiliary_path = None
+    replay_settings.additional_feature_stream_names = []
+    logger.info(f"Replaying the recorded session {settings.replay_path}, the configured stream layout and preprocessing are not applied.")
+    return replay_settings
+
+
+def _create_stream_section(name : str, start_index : int, length : int) -> StreamSection:
+    section = StreamSection()
+    section.name = name
+    section.start_index = start_index
+    section.length = length
+    return section
+
+
+# Ring buffer filled from a recording as the replay clock progresses.
+# Mimics the attributes of the dareplane-utils stream watcher used by the StreamWatcher (buffer, buffer_t, n_new, curr_i, update).
+class ReplayBuffer():
+    buffer : np.ndarray = np.array([])
+    buffer_t : np.ndarray = np.array([])
+    n_new : int = 0
+    curr_i : int = 0
+    inlet = None
+
+    _chunk_iterator_factory : callable
+    _chunks : Iterator[tuple[np.ndarray, np.ndarray]] = None
+    _clock : ReplayClock
+    _buffer_size_s : float
+    _chunk_size : int
+    _drives_clock : bool
+    _write_i : int = 0
+    _pending_data : np.ndarray = None
+    _pending_time_stamps : np.ndarray = None
+    _is_exhausted : bool = False
+
+
+    def __init__(self, chunk_iterator_factory : callable, clock : ReplayClock, buffer_size_s : float, chunk_size : int = 1024, drives_clock : bool = True):
+        self._chunk_iterator_factory = chunk_iterator_factory
+        self._clock = clock
+        self._buffer_size_s = buffer_size_s
+        self._chunk_size = chunk_size
+        self._drives_clock = drives_clock
+
+
+    def connect_to_stream(self):
+        self._chunks = self._chunk_iterator_factory()
+        self._is_exhausted = False
+        self._load_next_chunk()
+        if self._pending_data is None:
+            if not self._drives_clock:
+                # the buffer of a stream following the clock stays empty, reads of it return no samples
+                return
+            raise Exception("Replay exception: the recording contains no samples.")
+
+        self._init_buffer(self._pending_data, self._pending_time_stamps)
+        self._clock.register_origin(self._pending_time_stamps[0])
+
+
+    # sizes the buffer like the dareplane-utils stream watcher, based on the sampling rate of the first chunk
+    def _init_buffer(self, data : np.ndarray, time_stamps : np.ndarray):
+        buffer_size = self._chunk_size * 2
+        if len(time_stamps) > 1 and time_stamps[-1] > time_stamps[0]:
+            sampling_rate = (len(time_stamps) - 1) / (time_stamps[-1] - time_stamps[0])
+            buffer_size = max(buffer_size, int(sampling_rate * self._buffer_size_s))
+
+        self.buffer = np.zeros((buffer_size,) + data.shape[1:], dtype=data.dtype)
+        self.buffer_t = np.zeros(buffer_size)
+        self.n_new = 0
+        self.curr_i = 0
+        self._write_i = 0
+
+
+    def update(self):
+        if self._pending_data is None:
+            return
+
+        if self._drives_clock and self._clock.is_unthrottled():
+            self._clock.advance_to(self._pending_time_stamps[min(self._chunk_size, len(self._pending_time_stamps)) - 1])
+
+        replay_time = self._clock.get_time()
+        while self._pending_data is not None and self._pending_time_stamps[0] <= replay_time:
+            n_due = np.searchsorted(self._pending_time_stamps, replay_time, side='right')
+            self._write(self._pending_data[:n_due], self._pending_time_stamps[:n_due])
+            self._pending_data = self._pending_data[n_due:]
+            self._pending_time_stamps = self._pending_time_stamps[n_due:]
+            if len(self._pending_data) == 0:
+                self._load_next_chunk()
+
+
+    def _load_next_chunk(self):
+        self._pending_data = None
+        self._pending_time_stamps = None
+        for data, time_stamps in self._chunks:
+            if len(data) > 0:
+                self._pending_data = data
+                self._pending_time_stamps = np.asarray(time_stamps, dtype=float)
+                return
+
+        if not self._is_exhausted:
+            self._is_exhausted = True
+            logger.info("Replay finished, all samples of the recording have been replayed.")
+            if self._drives_clock:
+                self._clock.advance_to(np.inf)
+
+
+    def _write(self, data : np.ndarray, time_stamps : np.ndarray):
+        buffer_size = len(self.buffer)
+        if len(data) > buffer_size:
+            data = data[-buffer_size:]
+            time_stamps = time_stamps[-buffer_size:]
+
+        n_samples = len(data)
+        n_first = min(n_samples, buffer_size - self._write_i)
+        self.buffer[self._write_i:self._write_i + n_first] = data[:n_first]
+        self.buffer_t[self._write_i:self._write_i + n_first] = time_stamps[:n_first]
+        self.buffer[:n_samples - n_first] = data[n_first:]
+        self.buffer_t[:n_samples - n_first] = time_stamps[n_first:]
+        self._write_i = (self._write_i + n_samples) % buffer_size
+
+        self.n_new += n_samples
+        if self.n_new > buffer_size:
+            # unread samples were overwritten, skip the read position ahead to the oldest sample still in the buffer
+            logger.warning(f"Replay buffer overflow, dropped {self.n_new - buffer_size} unread samples.")
+            self.curr_i = self._write_i
+            self.n_new = buffer_size
+
+
+# -------------- Recording Readers --------------
+# Each reader yields (data, time stamps) chunks of at most chunk_size samples.
+# Only folders with .npy files are memory-mapped. Single .npz and .xdf recordings are converted to such a folder, a cache next to the recording, the first time they are replayed.
+# The .csv and .parquet readers read the file chunk by chunk, and the .npz chunk files of a folder (e.g. a recorded session) are loaded one at a time.
+# So no format holds more than a chunk file in memory while replaying, except for .xdf recordings, which pyxdf loads as a whole when creating the cache.
+
+def iter_replay_chunks(replay_path : str, stream_name : str, chunk_size : int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    if os.path.isdir(replay_path):
+        if os.path.isfile(os.path.join(replay_path, f"{REPLAY_DATA_KEY}.npy")):
+            yield from _iter_npy_chunks(replay_path, chunk_size)
+            return
+
+        # a folder of chunk files is read one file at a time, in the order of the file names
+        for file_name in sorted(os.listdir(replay_path)):
+            if file_name.endswith(".npz"):
+                yield from _iter_npz_chunks(os.path.join(replay_path, file_name), chunk_size)
+        return
+
+    extension = os.path.splitext(replay_path)[1].lower()
+    match extension:
+        case ".npz": yield from _iter_npz_file_chunks(replay_path, chunk_size)
+        case ".xdf": yield from _iter_xdf_chunks(replay_path, stream_name, chunk_size)
+        case ".csv": yield from _iter_csv_chunks(replay_path, chunk_size)
+        case ".parquet": yield from _iter_parquet_chunks(replay_path, chunk_size)
+        case _:
+            raise Exception(f"Replay exception: unsupported recording format '{extension}'. Supported formats: .npz, .xdf, .csv, .parquet, a folder of .npz files, or a folder with data.npy and time_stamps.npy files.")
+
+
+# a single .npz recording with data and time stamps arrays is replayed from its .npy cache, other .npz files are recorded chunks of limited size
+def _iter_npz_file_chunks(file_path : str, chunk_size : int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    with zipfile.ZipFile(file_path) as recording:
+        has_data = f"{REPLAY_DATA_KEY}.npy" in recording.namelist()
+    if not has_data:
+        yield from _iter_npz_chunks(file_path, chunk_size)
+        return
+
+    cache_path = f"{file_path}{REPLAY_CACHE_SUFFIX}"
+    if not _is_replay_cache_valid(cache_path, file_path):
+        try:
+            _create_replay_cache_from_npz(file_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not create the replay cache {cache_path} ({e}), the recording is loaded into memory.")
+            yield from _iter_npz_chunks(file_path, chunk_size)
+            return
+    yield from _iter_npy_chunks(cache_path, chunk_size)
+
+
+def _iter_npz_chunks(file_path : str, chunk_size : int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    with np.load(file_path) as recording:
+        if RECORDING_FEATURES_KEY in recording:
+            data = _stack_recorded_columns(recording)
+        else:
+            data = recording[REPLAY_DATA_KEY]
+        time_stamps = recording[REPLAY_TIME_STAMP_COLUMN]
+    yield from _iter_array_chunks(data, time_stamps, chunk_size)
+
+
+# the .npy files are memory-mapped, only the chunks that are replayed are read from disk
+def _iter_npy_chunks(folder_path : str, chunk_size : int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    data = np.load(os.path.join(folder_path, f"{REPLAY_DATA_KEY}.npy"), mmap_mode='r')
+    time_stamps = np.load(os.path.join(folder_path, f"{REPLAY_TIME_STAMP_COLUMN}.npy"), mmap_mode='r')
+    yield from _iter_array_chunks(data, time_stamps, chunk_size)
+
+
+def _iter_xdf_chunks(file_path : str, stream_name : str, chunk_size : int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    try:
+        import pyxdf
+    except ImportError:
+        raise Exception("Replay exception: replaying .xdf recordings requires the pyxdf package.")
+
+    cache_path = f"{file_path}.{stream_name}{REPLAY_CACHE_SUFFIX}"
+    if _is_replay_cache_valid(cache_path, file_path):
+        yield from _iter_npy_chunks(cache_path, chunk_size)
+        return
+
+    streams, _ = pyxdf.load_xdf(file_path, select_streams=[{"name": stream_name}])
+    if len(streams) == 0:
+        raise Exception(f"Replay exception: the recording {file_path} contains no stream named '{stream_name}'.")
+    stream = streams[0]
+    data = np.asarray(stream["time_series"])
+    time_stamps = np.asarray(stream["time_stamps"], dtype=float)
+    try:
+        _write_replay_cache(cache_path, {REPLAY_DATA_KEY: lambda path: np.save(path, data), REPLAY_TIME_STAMP_COLUMN: lambda path: np.save(path, time_stamps)})
+    except OSError as e:
+        logger.warning(f"Could not create the replay cache {cache_path} ({e}), the recording is replayed from memory.")
+        yield from _iter_array_chunks(data, time_stamps, chunk_size)
+        return
+
+    del streams, stream, data, time_stamps
+    yield from _iter_npy_chunks(cache_path, chunk_size)
+
+
+def _iter_csv_chunks(file_path : str, chunk_size : int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    import pandas as pd
+    for chunk_df in pd.read_csv(file_path, chunksize=chunk_size):
+        yield _split_table_chunk(chunk_df)
+
+
+def _iter_parquet_chunks(file_path : str, chunk_size : int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception("Replay exception: replaying .parquet recordings requires the pyarrow package.")
+
+    for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size):
+        yield _split_table_chunk(batch.to_pandas())
+
+
+# tables hold one column with the time stamps, all other columns are the channels of the stream, in the order of the stream layout
+def _split_table_chunk(chunk_df) -> tuple[np.ndarray, np.ndarray]:
+    if REPLAY_TIME_STAMP_COLUMN not in chunk_df.columns:
+        raise Exception(f"Replay exception: the recording has no '{REPLAY_TIME_STAMP_COLUMN}' column.")
+    time_stamps = chunk_df[REPLAY_TIME_STAMP_COLUMN].to_numpy(dtype=float)
+    data = chunk_df.drop(columns=[REPLAY_TIME_STAMP_COLUMN]).to_numpy()
+    return data, time_stamps
+
+
+# column order of the layout created by _get_recording_replay_settings()
+def _stack_recorded_columns(recording) -> np.ndarray:
+    columns = [recording[key] for key in [RECORDING_IDS_KEY, RECORDING_LABELS_KEY] if key in recording]
+    features = recording[RECORDING_FEATURES_KEY]
+    return np.column_stack(columns + [features.reshape(len(features), -1)]).astype(float)
+
+
+# A cache is valid when it holds both .npy files and is not older than the recording.
+def _is_replay_cache_valid(cache_path : str, recording_path : str) -> bool:
+    cache_file_paths = [os.path.join(cache_path, f"{key}.npy") for key in [REPLAY_DATA_KEY, REPLAY_TIME_STAMP_COLUMN]]
+    if not all(os.path.isfile(cache_file_path) for cache_file_path in cache_file_paths):
+        return False
+    return min(os.path.getmtime(cache_file_path) for cache_file_path in cache_file_paths) >= os.path.getmtime(recording_path)
+
+
+# The .npy members of the .npz file are copied to the cache without loading them, the stored bytes of a .npy member are the same as those of a .npy file.
+def _create_replay_cache_from_npz(file_path : str, cache_path : str):
+    with zipfile.ZipFile(file_path) as recording:
+        _write_replay_cache(cache_path, {key: lambda path, key=key: _copy_npz_member(recording, f"{key}.npy", path) for key in [REPLAY_DATA_KEY, REPLAY_TIME_STAMP_COLUMN]})
+
+
+def _copy_npz_member(recording : zipfile.ZipFile, member_name : str, destination_path : str):
+    with recording.open(member_name) as member, open(destination_path, "wb") as destination:
+        shutil.copyfileobj(member, destination)
+
+
+# Writes the cache files through the given writers, each is passed the path to write to. The files are renamed once written, so an interrupted write leaves no valid cache.
+def _write_replay_cache(cache_path : str, writers : dict[str, callable]):
+    os.makedirs(cache_path, exist_ok=True)
+    logger.info(f"Creating the replay cache {cache_path}.")
+    for key, write in writers.items():
+        temp_path = os.path.join(cache_path, f"{key}.tmp.npy")
+        write(temp_path)
+        os.replace(temp_path, os.path.join(cache_path, f"{key}.npy"))
+
+
+def _iter_array_chunks(data : np.ndarray, time_stamps : np.ndarray, chunk_size : int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size], time_stamps[start:start + chunk_size]
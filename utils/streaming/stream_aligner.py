@@ -0,0 +1,51 @@
+import numpy as np
+
+from utils.streaming.buffer_segments import BufferSegments
+
+# Aligns additional feature streams to the primary feature stream and concatenates their features.
+# Each primary sample is combined with the latest sample of every additional stream at or before its time point (sample and hold).
+# Primary samples for which an additional stream has no sample within the tolerance are dropped.
+# The alignment is done per stream with np.searchsorted, there is no Python work per sample.
+
+
+class StreamAligner():
+    _tolerance_s : float
+
+
+    def __init__(self, tolerance_ms : float):
+        self._tolerance_s = tolerance_ms * 10**-3
+
+
+    # Returns the number of primary samples that can be aligned now. Later primary samples may still be paired with additional samples that have not arrived yet.
+    def get_n_alignable(self, primary_time_points : np.ndarray, additional_time_points : list[np.ndarray]) -> int:
+        newest_time_point = min(time_points[-1] for time_points in additional_time_points)
+        return int(np.searchsorted(primary_time_points, newest_time_point, side='right'))
+
+
+    # Returns the indices of the aligned primary samples and their concatenated features, primary features first.
+    def align(self, primary_features : BufferSegments, primary_time_points : np.ndarray, additional_features : list[BufferSegments], additional_time_points : list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        held_indices = []
+        is_aligned = np.ones(len(primary_time_points), dtype=bool)
+        for time_points in additional_time_points:
+            indices = np.searchsorted(time_points, primary_time_points, side='right') - 1
+            is_aligned &= indices >= 0
+            indices = np.maximum(indices, 0)
+            is_aligned &= primary_time_points - time_points[indices] <= self._tolerance_s
+            held_indices.append(indices)
+
+        rows = np.flatnonzero(is_aligned)
+        widths = [primary_features.shape[1]] + [features.shape[1] for features in additional_features]
+        column_starts = np.cumsum([0] + widths)
+        dtype = np.result_type(primary_features.dtype, *[features.dtype for features in additional_features])
+        aligned_features = np.empty((len(rows), column_starts[-1]), dtype=dtype)
+
+        primary_features.take(rows, out=aligned_features[:, column_starts[0]:column_starts[1]])
+        for stream_index, (features, indices) in enumerate(zip(additional_features, held_indices)):
+            features.take(indices[rows], out=aligned_features[:, column_starts[stream_index + 1]:column_starts[stream_index + 2]])
+        return rows, aligned_features
+
+
+    # Returns the number of entries of an additional stream that are no longer needed once the primary samples up to the given time point are read.
+    # The latest entry at or before the time point is kept, it is held for the next primary samples.
+    def get_n_consumed(self, additional_time_points : np.ndarray, last_read_time_point : float) -> int:
+        return max(int(np.searchsorted(additional_time_points, last_read_time_point, side='right')) - 1, 0)
@@ -2,11 +2,14 @@ import numpy as np
 from enum import Enum
 
 from utils.streaming.stream_settings import *
+from utils.streaming.buffer_segments import BufferSegments
+from utils.streaming.stream_preprocessing import PreprocessingPipeline, create_preprocessing_pipeline
 
 class StreamInterpreterTypeEnum(Enum):
     Features = 1
     Auxiliary = 2
     Other = 3
+    AdditionalFeatures = 4    # feature stream concatenated to the main feature stream, its labels are not read
 
 class StreamInterpreter():
     _stream_settings : StreamSettings
@@ -20,6 +23,12 @@ class StreamInterpreter():
     _label_section : StreamSection
     _contains_sample_index = False
 
+    # slicing plan, resolved once from the layout
+    _feature_slice : slice = None
+    _label_slice : slice = None
+    _label_function = None
+    _preprocessing_pipeline : PreprocessingPipeline
+
 
     def __init__(self, stream_settings : StreamSettings, stream_layout : StreamLayout, interpreter_type : StreamInterpreterTypeEnum):
         self._stream_settings = stream_settings
@@ -43,48 +52,70 @@ class StreamInterpreter():
         elif not stream_settings.labels_from_auxiliary_stream and interpreter_type is StreamInterpreterTypeEnum.Features:
             self._interpret_labels = True
 
-        if self._interpreter_type is StreamInterpreterTypeEnum.Features:
+        if self._interpreter_type in [StreamInterpreterTypeEnum.Features, StreamInterpreterTypeEnum.AdditionalFeatures]:
             self._feature_section = self._stream_layout.sections[self._stream_settings.feature_section]
+            self._feature_slice = _get_section_slice(self._feature_section)
+
+        if self._interpreter_type is StreamInterpreterTypeEnum.Features:
+            self._preprocessing_pipeline = create_preprocessing_pipeline(stream_settings.preprocessing_steps)
+        else:
+            self._preprocessing_pipeline = PreprocessingPipeline()
 
         if self._interpret_labels:
             self._label_interpretation_method = stream_settings.label_interpretation_method
             self._label_section = self._stream_layout.sections[self._stream_settings.label_section]
+            self._label_slice = _get_section_slice(self._label_section)
+            self._label_function = self._resolve_label_function()
+
+
+    def _resolve_label_function(self):
+        interpretation_method = self._stream_settings.label_interpretation_method
+        match interpretation_method:
+            case "one-to-one":
+                if self._label_section.length > 1:
+                    raise Exception(f"stream interpretation exception: 'one-to-one' mapping not possible, stream label section has more than one entry.")
+                return select_one_to_one
+            case "index of highest":
+                return select_index_of_highest
+            case "index of lowest":
+                return select_index_of_lowest
+            case _:
+                raise Exception(f"stream interpretation exception: unknown interpretation method. Section: {self._stream_settings.label_section}, provided method: {interpretation_method}")
+
 
-    def interpret(self, stream_content : np.ndarray) -> tuple[enumerate[int], enumerate[any], enumerate[int|str]]:
+    # The features are returned as segments (views) of the stream content, ids and labels are returned as arrays.
+    def interpret(self, stream_content : BufferSegments | np.ndarray) -> tuple[enumerate[int], BufferSegments, enumerate[int|str]]:
         if stream_content is None or len(stream_content) == 0:
             return None, None, None
+        if not isinstance(stream_content, BufferSegments):
+            stream_content = BufferSegments([stream_content])
         
         ids = None
         if self._contains_sample_index:
-            ids = stream_content[:, self._id_index]
+            id_index = self._id_index
+            ids = stream_content.map(lambda segment: segment[:, id_index]).to_array()
 
         features = None
-        if self._interpreter_type is StreamInterpreterTypeEnum.Features:
-            start_index = self._feature_section.start_index
-            features = stream_content[:, start_index : start_index + self._feature_section.length]
+        if self._feature_slice is not None:
+            feature_slice = self._feature_slice
+            features = stream_content.map(lambda segment: segment[:, feature_slice])
 
         labels = None
         if self._interpret_labels:
-            start_index = self._label_section.start_index
-            label_data = stream_content[:, start_index : start_index + self._label_section.length]
-            labels = self._interpret_label_data(label_data)
+            label_slice = self._label_slice
+            label_data = stream_content.map(lambda segment: segment[:, label_slice]).to_array()
+            labels = self._label_function(label_data)
 
         return ids, features, labels
         
 
-    def _interpret_label_data(self, label_data : enumerate) -> enumerate:
-        interpretation_method = self._stream_settings.label_interpretation_method
-        match interpretation_method:
-            case "one-to-one":
-                labels = select_one_to_one(label_data)
-            case "index of highest":
-                labels = select_index_of_highest(label_data)
-            case "index of lowest":
-                labels = select_index_of_lowest(label_data)
-            case _:
-                raise Exception(f"stream interpretation exception: unknown interpretation method. Section: {self._stream_settings.label_section}, provided method: {interpretation_method}")
-        
-        return labels
+    # Applies the configured preprocessing steps to a block of read (and matched) features. Windowing steps may return fewer rows, or None until a window is complete.
+    def preprocess(self, features : np.ndarray, time_points : np.ndarray, labels : enumerate | None) -> tuple[np.ndarray, np.ndarray, enumerate | None]:
+        return self._preprocessing_pipeline.process(features, time_points, labels)
+
+
+def _get_section_slice(section : StreamSection) -> slice:
+    return slice(section.start_index, section.start_index + section.length)
 
 
 # -------------- Interpretation Functions --------------
@@ -92,9 +123,7 @@ class StreamInterpreter():
 def select_one_to_one(stream_content_section : np.ndarray):
     if stream_content_section.shape[1] > 1:
         raise Exception(f"stream interpretation exception: 'one-to-one' mapping not possible, stream label section has more than one entry.")
-    content = stream_content_section
-    # reshape np.ndarray to a list
-    return [item for sublist in content for item in sublist]
+    return stream_content_section.ravel()
 
 # NOTE: in the case of two or more columns having the highest value, the first column is selected
 def select_index_of_highest(stream_content_section : np.ndarray):
@@ -1,9 +1,12 @@
 import numpy as np
 from utils.streaming.stream_settings import *
+from utils.streaming.buffer_segments import BufferSegments
+from utils.streaming.clock_offset_estimator import ClockOffsetEstimator
 
 class StreamMatcher():
     _label_matching_scheme : str
-    _auxiliary_stream_drift : float = 0
+    _clock_offset_estimator : ClockOffsetEstimator
+    _estimate_clock_offset : bool = False
 
     _last_matched_label = None
     _last_matched_label_id = None
@@ -11,170 +14,207 @@ class StreamMatcher():
 
     def __init__(self, stream_settings : StreamSettings):
         self._label_matching_scheme = stream_settings.label_feature_matching_scheme
-        self._auxiliary_stream_drift = stream_settings.auxiliary_stream_drift_ms
+        self._estimate_clock_offset = stream_settings.estimate_clock_offset
+        # without estimation the estimator only applies the static drift of the config
+        self._clock_offset_estimator = ClockOffsetEstimator(
+            stream_settings.auxiliary_stream_drift_ms,
+            stream_settings.clock_offset_half_life_s,
+            stream_settings.time_correction_interval_s
+        )
+
+
+    # Returns the current estimate of the auxiliary clock offset in seconds at the given feature time point, and its drift in seconds per second.
+    def get_clock_offset(self, feature_time_point : float) -> tuple[float, float]:
+        return float(self._clock_offset_estimator.get_offset(feature_time_point)), float(self._clock_offset_estimator.get_drift())
+
+
+    # Refreshes the LSL time correction of the streams, the inlets are None for sources other than LSL.
+    def update_time_correction(self, feature_inlet, auxiliary_inlet):
+        if self._estimate_clock_offset:
+            self._clock_offset_estimator.update_time_correction(feature_inlet, auxiliary_inlet)
 
 # -------------------------------- entry id matching --------------------------------
-    def get_shared_features_by_id(self, features : np.ndarray, time_points : enumerate, labels : enumerate, feature_ids : enumerate, auxiliary_ids : enumerate) -> tuple[list[int], np.ndarray, float, float|int]:
-        feature_ids = feature_ids.astype(int)
-        auxiliary_ids = auxiliary_ids.astype(int)
-        
+    # Returns the matched index pairs in the same (n, 2) layout as get_shared_features_by_time_points.
+    # The until-next and from-previous schemes expect the entry ids of each stream to be increasing.
+    # The auxiliary time points are optional, when given the matched pairs are used to estimate the clock offset between the streams.
+    def get_shared_features_by_id(self, features : BufferSegments | np.ndarray, time_points : enumerate, labels : enumerate, feature_ids : enumerate, auxiliary_ids : enumerate, auxiliary_time_points : enumerate = None) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        feature_ids = np.asarray(feature_ids).astype(int)
+        auxiliary_ids = np.asarray(auxiliary_ids).astype(int)
+        labels = np.asarray(labels)
+
+        n_carried_over = 0
+        if self._label_matching_scheme in ["until-next", "from-previous"] and self._last_matched_label is not None:
+            labels = np.concatenate(([self._last_matched_label], labels))
+            auxiliary_ids = np.concatenate(([self._last_matched_label_id], auxiliary_ids))
+            n_carried_over = 1
+
         match self._label_matching_scheme:
             case "match-samples": matching_indeces = self._match_entry_ids_match_samples(feature_ids, auxiliary_ids)
-            case "until-next": 
-                if self._last_matched_label is not None:
-                    labels = np.concatenate(([self._last_matched_label], labels))
-                    auxiliary_ids = np.concatenate(([self._last_matched_label_id], auxiliary_ids))
-                matching_indeces = self._match_entry_ids_until_next(feature_ids, auxiliary_ids)
-            case "from-previous": 
-                if self._last_matched_label is not None:
-                    labels = [self._last_matched_label] + labels
-                    auxiliary_ids = [self._last_matched_label_id] + auxiliary_ids
-                matching_indeces = self._match_entry_ids_from_previous(feature_ids, auxiliary_ids)
-
-        matched_features = [features[i[0]] for i in matching_indeces]
-        matched_time_points = [time_points[i[0]] for i in matching_indeces]
-        matched_labels = [labels[i[1]] for i in matching_indeces]
+            case "until-next": matching_indeces = self._match_entry_ids_until_next(feature_ids, auxiliary_ids)
+            case "from-previous": matching_indeces = self._match_entry_ids_from_previous(feature_ids, auxiliary_ids)
+            case _:
+                raise Exception(f"Stream matching exception: unknown matching scheme '{self._label_matching_scheme}'.")
 
-        if matching_indeces is None or len(matching_indeces) == 0:
+        if len(matching_indeces) == 0:
             return None, None, None, None
 
-        self._last_matched_label = matched_labels[-1]
-        self._last_matched_label_id = auxiliary_ids[matching_indeces[-1][1]]
-        return matching_indeces, matched_features, matched_time_points, matched_labels
-    
-
-    # matches the auxiliary entry ids to the feature entry ids with the same value
-    def _match_entry_ids_match_samples(self, feature_ids : enumerate, auxiliary_ids : enumerate) -> list[int, int]:
-        matching_indeces = []
-
-        for label_index, sample_id in enumerate(auxiliary_ids):
-            matching_feature_indices = [feature_index for feature_index, feature_id in enumerate(feature_ids) if feature_id == sample_id]
-            for feature_index in matching_feature_indices:
-                matching_indeces.append((feature_index, label_index))
+        feature_indices = matching_indeces[:, 0]
+        auxiliary_indices = matching_indeces[:, 1]
+        matched_features = _gather_rows(features, feature_indices)
+        matched_time_points = np.asarray(time_points)[feature_indices]
+        matched_labels = labels[auxiliary_indices]
 
-        # sort by the order of feature indices, otherwise the feature data order gets mixed up
-        matching_indeces = sorted(matching_indeces, key=lambda feature_index: feature_index[0])
-        return matching_indeces
+        self._last_matched_label = matched_labels[-1]
+        self._last_matched_label_id = auxiliary_ids[auxiliary_indices[-1]]
 
+        if self._estimate_clock_offset and auxiliary_time_points is not None:
+            # entries with the same id were sent at the same time, so each such pair measures the offset independently of the time stamps
+            is_same_id = feature_ids[feature_indices] == auxiliary_ids[auxiliary_indices]
+            is_same_id &= auxiliary_indices >= n_carried_over
+            self._clock_offset_estimator.update(matched_time_points[is_same_id], np.asarray(auxiliary_time_points, dtype=float)[auxiliary_indices[is_same_id] - n_carried_over])
 
-    # matches the auxiliary entry ids to all feature entry ids of equal or greater value until the next auxiliary entry id
-    def _match_entry_ids_until_next(self, feature_ids : enumerate, auxiliary_ids : enumerate) -> list[int, int]:
-        matching_indeces = []
+        matching_indeces[:, 1] -= n_carried_over
+        return matching_indeces, matched_features, matched_time_points, matched_labels
+    
 
-        label_sample_index = 0
-        last_aux_index = len(auxiliary_ids) 
+    # matches the auxiliary entry ids to the feature entry ids with the same value (sort-merge join, ordered by feature index)
+    def _match_entry_ids_match_samples(self, feature_ids : np.ndarray, auxiliary_ids : np.ndarray) -> np.ndarray:
+        if len(feature_ids) == 0 or len(auxiliary_ids) == 0:
+            return np.empty((0, 2), dtype=int)
 
-        for feature_sample_index, feature_sample_id in enumerate(feature_ids):
-            if label_sample_index >= last_aux_index:
-                # when on the final auxiliary sample match id, assign all remaining features to that one
-                for remaining_feature_sample_index in range(feature_sample_index, len(feature_ids)):
-                    matching_indeces.append((remaining_feature_sample_index, label_sample_index))
-                    break
+        auxiliary_order = np.argsort(auxiliary_ids, kind='stable')
+        sorted_auxiliary_ids = auxiliary_ids[auxiliary_order]
+        first_match = np.searchsorted(sorted_auxiliary_ids, feature_ids, side='left')
+        match_counts = np.searchsorted(sorted_auxiliary_ids, feature_ids, side='right') - first_match
 
-            if label_sample_index == 0 and feature_sample_id < auxiliary_ids[0]:
-                continue
+        # a feature is paired with every auxiliary entry sharing its id
+        feature_indices = np.repeat(np.arange(len(feature_ids)), match_counts)
+        match_starts = np.repeat(first_match, match_counts)
+        group_offsets = np.arange(len(feature_indices)) - np.repeat(np.cumsum(match_counts) - match_counts, match_counts)
+        auxiliary_indices = auxiliary_order[match_starts + group_offsets]
 
-            if feature_sample_id >= auxiliary_ids[label_sample_index+1]:
-                label_sample_index += 1
-                if label_sample_index >= len(auxiliary_ids):
-                    break
+        return np.column_stack((feature_indices, auxiliary_indices))
 
-            matching_indeces.append((feature_sample_index, label_sample_index))
 
-        return matching_indeces
+    # matches the auxiliary entry ids to all feature entry ids of equal or greater value until the next auxiliary entry id
+    def _match_entry_ids_until_next(self, feature_ids : np.ndarray, auxiliary_ids : np.ndarray) -> np.ndarray:
+        return _match_until_next(feature_ids, auxiliary_ids)
         
     
     # matches the auxiliary entry id to all feature entry ids of less or equal value starting from the first feature entry id greater than the last auxiliary entry id
-    def _match_entry_ids_from_previous(self, feature_ids : enumerate, auxiliary_ids : enumerate) -> list[int, int]:
-        raise NotImplementedError(f"Stream matching error: matching features and labels by entry id using the scheme 'from_previous' is currently not supported.")
+    def _match_entry_ids_from_previous(self, feature_ids : np.ndarray, auxiliary_ids : np.ndarray) -> np.ndarray:
+        return _match_from_previous(feature_ids, auxiliary_ids)
     
     
 # -------------------------------- time point matching --------------------------------
-    def get_shared_features_by_time_points(self, features : np.ndarray, labels : enumerate, feature_time_points : enumerate, auxiliary_time_points : enumerate) -> tuple[list[int], np.ndarray, float, float|int]:
-        auxiliary_time_points = [auxiliary_time_point - self._auxiliary_stream_drift for auxiliary_time_point in auxiliary_time_points]
+    # Returns the matched index pairs as an (n, 2) array of (feature index, auxiliary index) rows, ordered by feature index.
+    # Auxiliary indices refer to the passed auxiliary entries, the label carried over from the previous read has index -1.
+    def get_shared_features_by_time_points(self, features : BufferSegments | np.ndarray, labels : enumerate, feature_time_points : enumerate, auxiliary_time_points : enumerate) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        feature_time_points = np.asarray(feature_time_points, dtype=float)
+        raw_auxiliary_time_points = np.asarray(auxiliary_time_points, dtype=float)
+        auxiliary_time_points = self._clock_offset_estimator.to_feature_clock(raw_auxiliary_time_points)
+        labels = np.asarray(labels)
+
+        n_carried_over = 0
+        if self._label_matching_scheme in ["until-next", "from-previous"] and self._last_matched_label is not None:
+            labels = np.concatenate(([self._last_matched_label], labels))
+            auxiliary_time_points = np.concatenate(([self._last_matched_label_timestamp], auxiliary_time_points))
+            n_carried_over = 1
+
         match self._label_matching_scheme:
             case "match-samples": 
                 matching_indeces = self._match_time_points_match_samples(feature_time_points, auxiliary_time_points)
             case "until-next": 
-                if self._last_matched_label is not None:
-                    labels = np.concatenate(([self._last_matched_label], labels))
-                    auxiliary_time_points = np.concatenate(([self._last_matched_label_timestamp], auxiliary_time_points))
                 matching_indeces = self._match_time_points_until_next(feature_time_points, auxiliary_time_points)
             case "from-previous": 
-                if self._last_matched_label is not None:
-                    labels = np.concatenate(([self._last_matched_label], labels))
-                    auxiliary_time_points = np.concatenate(([self._last_matched_label_timestamp], auxiliary_time_points))
-                matching_indeces = self._match_entry_ids_from_previous(feature_time_points, auxiliary_time_points)
-
-        matched_features = [features[i[0]] for i in matching_indeces]
-        matched_time_points = [feature_time_points[i[0]] for i in matching_indeces]
-        matched_labels = [labels[i[1]] for i in matching_indeces]
+                matching_indeces = self._match_time_points_from_previous(feature_time_points, auxiliary_time_points)
+            case _:
+                raise Exception(f"Stream matching exception: unknown matching scheme '{self._label_matching_scheme}'.")
 
-        if matching_indeces is None or len(matching_indeces) == 0:
+        if len(matching_indeces) == 0:
             return None, None, None, None
-        
+
+        feature_indices = matching_indeces[:, 0]
+        auxiliary_indices = matching_indeces[:, 1]
+        matched_features = _gather_rows(features, feature_indices)
+        matched_time_points = feature_time_points[feature_indices]
+        matched_labels = labels[auxiliary_indices]
+
         self._last_matched_label = matched_labels[-1]
-        self._last_matched_label_timestamp = auxiliary_time_points[matching_indeces[-1][1]]
+        self._last_matched_label_timestamp = auxiliary_time_points[auxiliary_indices[-1]]
+
+        matching_indeces[:, 1] -= n_carried_over
+        if self._estimate_clock_offset and self._label_matching_scheme == "match-samples":
+            # nearest sample pairs scatter around the true offset, the pairs of the other schemes and the entries moved past their nearest feature are biased by the spacing of the entries
+            is_nearest = feature_indices == _get_nearest_indices(feature_time_points, auxiliary_time_points[auxiliary_indices])
+            self._clock_offset_estimator.update(matched_time_points[is_nearest], raw_auxiliary_time_points[matching_indeces[is_nearest, 1]])
         return matching_indeces, matched_features, matched_time_points, matched_labels
     
 
-    def _match_time_points_match_samples(self, feature_time_points : enumerate, auxiliary_time_points : enumerate) -> list[int, int]:
+    # matches each auxiliary time point to the nearest feature time point that was not matched to an earlier auxiliary entry, each feature is matched to at most one auxiliary entry
+    # When several auxiliary entries share the same nearest feature, the later ones are matched to the features following it. Auxiliary entries left without a feature are not matched.
+    def _match_time_points_match_samples(self, feature_time_points : np.ndarray, auxiliary_time_points : np.ndarray) -> np.ndarray:
         n_feature_entries = len(feature_time_points)
+        if n_feature_entries == 0 or len(auxiliary_time_points) == 0:
+            return np.empty((0, 2), dtype=int)
 
-        start_index = 0
-        matching_indeces = []
-        for i, auxiliary_time_point in enumerate(auxiliary_time_points):
-            adjusted_auxiliary_time_point = auxiliary_time_point - self._auxiliary_stream_drift
-            smallest_dist_time = float('inf')
-            smallest_j = start_index
-
-            for j in range(start_index, n_feature_entries):
-                dist_time = abs(adjusted_auxiliary_time_point - feature_time_points[j])
-                if dist_time > smallest_dist_time:
-                    break
-                smallest_dist_time = dist_time
-                smallest_j = j
-            
-            matching_indeces.append((smallest_j, i))
-            start_index = smallest_j + 1
-            if start_index >= n_feature_entries:
-                break
-        
-        return matching_indeces
+        feature_indices = _get_nearest_indices(feature_time_points, auxiliary_time_points)
+        # an entry is matched to its nearest feature or the feature after the one of the previous entry, whichever comes later: i + cummax(nearest - i)
+        auxiliary_indices = np.arange(len(auxiliary_time_points))
+        feature_indices = auxiliary_indices + np.maximum.accumulate(feature_indices - auxiliary_indices)
+        is_matched = feature_indices < n_feature_entries
+
+        return np.column_stack((feature_indices[is_matched], auxiliary_indices[is_matched]))
     
     
-    def _match_time_points_until_next(self, feature_time_points : enumerate, auxiliary_time_points : enumerate) -> list[int, int]:
-        matching_indeces = []
+    # matches each feature to the last auxiliary entry at or before its time point, features before the first auxiliary entry are not matched
+    def _match_time_points_until_next(self, feature_time_points : np.ndarray, auxiliary_time_points : np.ndarray) -> np.ndarray:
+        return _match_until_next(feature_time_points, auxiliary_time_points)
 
-        label_sample_index = 0
-        last_aux_index = len(auxiliary_time_points) 
 
-        for feature_sample_index, feature_time_point in enumerate(feature_time_points):
-            if label_sample_index >= last_aux_index:
-                # when on the final auxiliary time stamp, assign all remaining features to that one
-                for remaining_feature_sample_index in range(feature_sample_index, len(feature_time_points)):
-                    matching_indeces.append((remaining_feature_sample_index, label_sample_index))
-                    break
+    # matches each feature to the first auxiliary entry at or after its time point, features after the last auxiliary entry are left for a later read
+    def _match_time_points_from_previous(self, feature_time_points : np.ndarray, auxiliary_time_points : np.ndarray) -> np.ndarray:
+        return _match_from_previous(feature_time_points, auxiliary_time_points)
 
-            if label_sample_index == 0 and feature_time_point < auxiliary_time_points[0]:
-                continue
+    
 
-            if feature_time_point >= auxiliary_time_points[label_sample_index+1]:
-                label_sample_index += 1
-                if label_sample_index >= len(auxiliary_time_points):
-                    break
+# -------------------------------- util functions --------------------------------
+# Shared by the entry id and time point matching. Both key arrays must be sorted in increasing order.
+# Returns (n, 2) arrays of (feature index, auxiliary index) rows.
 
-            matching_indeces.append((feature_sample_index, label_sample_index))
+def _gather_rows(data : BufferSegments | np.ndarray, indices : np.ndarray) -> np.ndarray:
+    if isinstance(data, BufferSegments):
+        return data.take(indices)
+    return np.asarray(data)[indices]
 
-        return matching_indeces
 
+# Returns the index of the nearest feature key for each auxiliary key, the later one on a tie.
+def _get_nearest_indices(feature_keys : np.ndarray, auxiliary_keys : np.ndarray) -> np.ndarray:
+    right_indices = np.clip(np.searchsorted(feature_keys, auxiliary_keys, side='left'), 0, len(feature_keys) - 1)
+    left_indices = np.clip(right_indices - 1, 0, len(feature_keys) - 1)
+    right_dist = np.abs(feature_keys[right_indices] - auxiliary_keys)
+    left_dist = np.abs(feature_keys[left_indices] - auxiliary_keys)
+    return np.where(left_dist < right_dist, left_indices, right_indices)
 
-    def _match_time_points_from_previous(self, feature_time_points : enumerate, auxiliary_time_points : enumerate) -> list[int, int]:
-        raise NotImplementedError(f"Stream matching error: matching features and labels by time point using the scheme 'from_previous' is currently not supported.")
 
-    
+def _match_until_next(feature_keys : np.ndarray, auxiliary_keys : np.ndarray) -> np.ndarray:
+    if len(feature_keys) == 0 or len(auxiliary_keys) == 0:
+        return np.empty((0, 2), dtype=int)
+
+    auxiliary_indices = np.searchsorted(auxiliary_keys, feature_keys, side='right') - 1
+    feature_indices = np.flatnonzero(auxiliary_indices >= 0)
+    return np.column_stack((feature_indices, auxiliary_indices[feature_indices]))
+
+
+def _match_from_previous(feature_keys : np.ndarray, auxiliary_keys : np.ndarray) -> np.ndarray:
+    if len(feature_keys) == 0 or len(auxiliary_keys) == 0:
+        return np.empty((0, 2), dtype=int)
+
+    auxiliary_indices = np.searchsorted(auxiliary_keys, feature_keys, side='left')
+    feature_indices = np.flatnonzero(auxiliary_indices < len(auxiliary_keys))
+    return np.column_stack((feature_indices, auxiliary_indices[feature_indices]))
+
 
-# -------------------------------- util functions --------------------------------
 def invert_dict(original_dict):
     inverted_dict = {}
     for key, value_list in original_dict.items():
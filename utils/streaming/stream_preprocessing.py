@@ -0,0 +1,197 @@
+import abc
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Vectorized preprocessing steps applied to each block of features read from the stream, before the block is passed to the projector.
+# Steps keep the state needed to continue on the next block (e.g. the samples of an incomplete window), so the result does not depend on how the stream is split into reads.
+# Each step takes and returns (features, time points, labels). Windowing steps return one row per complete window, with the time point and label of its last sample.
+
+
+class IPreprocessingStep(metaclass=abc.ABCMeta):
+    # Processes a block of features. The step may overwrite the given features array, the pipeline passes it a copy of the read block.
+    @abc.abstractmethod
+    def process(self, features : np.ndarray, time_points : np.ndarray, labels : np.ndarray | None) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        pass
+
+
+# causal moving average over the last window_size samples of each channel
+class MovingAverageStep(IPreprocessingStep):
+    _window_size : int
+    _history : np.ndarray = None
+
+
+    def __init__(self, window_size : int):
+        self._window_size = window_size
+
+
+    def process(self, features : np.ndarray, time_points : np.ndarray, labels : np.ndarray | None) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        if self._history is None:
+            self._history = np.zeros((0, features.shape[1]))
+
+        n_history = len(self._history)
+        extended = np.concatenate((self._history, features), axis=0)
+        cumulative = np.cumsum(extended, axis=0)
+        cumulative = np.concatenate((np.zeros((1, features.shape[1])), cumulative), axis=0)
+
+        ends = np.arange(n_history + 1, len(extended) + 1)
+        starts = np.maximum(ends - self._window_size, 0)
+        features[:] = (cumulative[ends] - cumulative[starts]) / (ends - starts)[:, None]
+
+        self._history = extended[-(self._window_size - 1):] if self._window_size > 1 else extended[:0]
+        return features, time_points, labels
+
+
+# standardizes each channel with its running mean and variance over all samples seen so far
+class ZScoreStep(IPreprocessingStep):
+    _count : int = 0
+    _mean : np.ndarray = None
+    _m2 : np.ndarray = None
+    _epsilon : float = 1e-12
+
+
+    def process(self, features : np.ndarray, time_points : np.ndarray, labels : np.ndarray | None) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        if self._mean is None:
+            self._mean = np.zeros(features.shape[1])
+            self._m2 = np.zeros(features.shape[1])
+
+        # batched Welford update (Chan et al.)
+        n_block = len(features)
+        block_mean = features.mean(axis=0)
+        block_m2 = ((features - block_mean) ** 2).sum(axis=0)
+        n_total = self._count + n_block
+        delta = block_mean - self._mean
+        self._mean = self._mean + delta * n_block / n_total
+        self._m2 = self._m2 + block_m2 + delta ** 2 * self._count * n_block / n_total
+        self._count = n_total
+
+        std = np.sqrt(self._m2 / max(self._count - 1, 1))
+        features -= self._mean
+        features /= np.maximum(std, self._epsilon)
+        return features, time_points, labels
+
+
+# base of the steps that group the samples into (overlapping) windows
+class _WindowingStep(IPreprocessingStep):
+    _window_size : int
+    _hop_size : int
+    _pending_features : np.ndarray = None
+    _pending_time_points : np.ndarray = None
+    _pending_labels : np.ndarray = None
+
+
+    def __init__(self, window_size : int, hop_size : int = None):
+        self._window_size = window_size
+        self._hop_size = hop_size or window_size
+
+
+    def process(self, features : np.ndarray, time_points : np.ndarray, labels : np.ndarray | None) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        if self._pending_features is not None:
+            features = np.concatenate((self._pending_features, features), axis=0)
+            time_points = np.concatenate((self._pending_time_points, time_points))
+            if labels is not None:
+                labels = np.concatenate((self._pending_labels, labels))
+
+        n_windows = 0 if len(features) < self._window_size else (len(features) - self._window_size) // self._hop_size + 1
+        n_consumed = n_windows * self._hop_size
+        self._pending_features = features[n_consumed:]
+        self._pending_time_points = time_points[n_consumed:]
+        self._pending_labels = labels[n_consumed:] if labels is not None else None
+
+        if n_windows == 0:
+            return features[:0], time_points[:0], labels[:0] if labels is not None else None
+
+        # shape: (windows, channels, window size)
+        windows = sliding_window_view(features, self._window_size, axis=0)[::self._hop_size][:n_windows]
+        window_ends = np.arange(n_windows) * self._hop_size + self._window_size - 1
+        window_labels = labels[window_ends] if labels is not None else None
+        # the reduced windows may still be a view on the read-only sliding window view, the following steps work in place
+        window_features = self._reduce_windows(windows)
+        if not window_features.flags.writeable:
+            window_features = window_features.copy()
+        return window_features, time_points[window_ends], window_labels
+
+
+    # Reduces the windows of shape (windows, channels, window size) to a feature vector per window.
+    @abc.abstractmethod
+    def _reduce_windows(self, windows : np.ndarray) -> np.ndarray:
+        pass
+
+
+# concatenates the samples of each window into a single feature vector
+class WindowStep(_WindowingStep):
+    def _reduce_windows(self, windows : np.ndarray) -> np.ndarray:
+        return windows.transpose(0, 2, 1).reshape(len(windows), -1)
+
+
+# logarithm of the power of each channel per window, optionally per frequency band (one feature per channel and band)
+class LogBandPowerStep(_WindowingStep):
+    _bands : list[tuple[float, float]] | None
+    _sampling_rate : float | None
+    _epsilon : float = 1e-12
+
+
+    def __init__(self, window_size : int, hop_size : int = None, bands : list[tuple[float, float]] = None, sampling_rate : float = None):
+        super().__init__(window_size, hop_size)
+        if bands is not None and sampling_rate is None:
+            raise Exception("Stream preprocessing exception: the sampling rate is required to compute the power of frequency bands.")
+        self._bands = bands
+        self._sampling_rate = sampling_rate
+
+
+    def _reduce_windows(self, windows : np.ndarray) -> np.ndarray:
+        if self._bands is None:
+            return np.log(np.mean(windows ** 2, axis=2) + self._epsilon)
+
+        spectrum = np.abs(np.fft.rfft(windows, axis=2)) ** 2 / self._window_size
+        frequencies = np.fft.rfftfreq(self._window_size, d=1 / self._sampling_rate)
+        band_powers = [spectrum[:, :, (frequencies >= low) & (frequencies < high)].sum(axis=2) for low, high in self._bands]
+        return np.log(np.concatenate(band_powers, axis=1) + self._epsilon)
+
+
+class PreprocessingPipeline():
+    _steps : list[IPreprocessingStep]
+
+
+    def __init__(self, steps : list[IPreprocessingStep] = []):
+        self._steps = steps
+
+
+    def is_empty(self) -> bool:
+        return len(self._steps) == 0
+
+
+    def process(self, features : np.ndarray, time_points : np.ndarray, labels : enumerate | None) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        if self.is_empty() or features is None or len(features) == 0:
+            return features, time_points, labels
+
+        # the read block may still be a view on the stream buffer, so it is copied once here and the steps then overwrite the copy in place
+        features = np.array(features, dtype=float)
+        time_points = np.asarray(time_points)
+        labels = np.asarray(labels) if labels is not None else None
+        for step in self._steps:
+            features, time_points, labels = step.process(features, time_points, labels)
+            if len(features) == 0:
+                return None, None, None
+        return features, time_points, labels
+
+
+# Creates the pipeline from the step configurations of the [[stream-settings.preprocessing]] config entries.
+def create_preprocessing_pipeline(step_configs : list[dict[str, any]]) -> PreprocessingPipeline:
+    steps = []
+    for step_config in step_configs or []:
+        step_name = step_config.get("step")
+        match step_name:
+            case "moving-average":
+                steps.append(MovingAverageStep(step_config.get("window-size")))
+            case "z-score":
+                steps.append(ZScoreStep())
+            case "window":
+                steps.append(WindowStep(step_config.get("window-size"), step_config.get("hop-size")))
+            case "log-band-power":
+                bands = step_config.get("bands")
+                if bands is not None:
+                    bands = [tuple(band) for band in bands]
+                steps.append(LogBandPowerStep(step_config.get("window-size"), step_config.get("hop-size"), bands, step_config.get("sampling-rate")))
+            case _:
+                raise Exception(f"Stream preprocessing exception: unknown preprocessing step '{step_name}'.")
+    return PreprocessingPipeline(steps)
@@ -0,0 +1,117 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+from utils.logging import logger
+
+# Records the blocks returned by StreamWatcher.read() as a folder of numbered .npz chunk files, one folder per session.
+# Each chunk holds the arrays below, ids and labels are left out when the stream has none. Chunks are only ever added, and each is written to a temporary file first, so a chunk file is either complete or absent.
+# The blocks are written by a background thread. The reading thread only copies the block and puts it in a bounded queue, when the queue is full the block is dropped rather than waiting for the disk.
+
+RECORDING_FEATURES_KEY = "features"
+RECORDING_TIME_STAMPS_KEY = "time_stamps"
+RECORDING_IDS_KEY = "ids"
+RECORDING_LABELS_KEY = "labels"
+RECORDING_CHUNK_PREFIX = "chunk_"
+
+
+class StreamRecorder():
+    session_path : str
+    _queue : queue.Queue
+    _chunk_size : int
+    _flush_interval_s : float
+    _writer_thread : threading.Thread
+
+    _n_chunks_written : int = 0
+    _n_blocks_dropped : int = 0
+    _pending_blocks : list[dict[str, np.ndarray]]
+    _n_pending_rows : int = 0
+    _last_flush_time : float
+
+
+    def __init__(self, recording_path : str, queue_size : int = 64, chunk_size : int = 4096, flush_interval_s : float = 5):
+        self.session_path = os.path.join(recording_path, datetime.now().strftime("session_%Y%m%d_%H%M%S"))
+        os.makedirs(self.session_path, exist_ok=True)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._chunk_size = chunk_size
+        self._flush_interval_s = flush_interval_s
+        self._pending_blocks = []
+        self._last_flush_time = time.monotonic()
+
+        self._writer_thread = threading.Thread(target=self._write_loop, name="onep-stream-recorder", daemon=True)
+        self._writer_thread.start()
+        logger.info(f"Recording the stream to {self.session_path}")
+
+
+    # Queues a block for writing without blocking. The arrays are copied, as the block may be a view on the stream buffer.
+    def record(self, features : np.ndarray, time_stamps : np.ndarray, ids : np.ndarray | None = None, labels : np.ndarray | None = None):
+        if features is None or len(features) == 0:
+            return
+
+        block = {
+            RECORDING_FEATURES_KEY: np.array(features),
+            RECORDING_TIME_STAMPS_KEY: np.array(time_stamps, dtype=float),
+        }
+        if ids is not None:
+            block[RECORDING_IDS_KEY] = np.array(ids)
+        if labels is not None:
+            block[RECORDING_LABELS_KEY] = np.array(labels)
+
+        try:
+            self._queue.put_nowait(block)
+        except queue.Full:
+            self._n_blocks_dropped += 1
+            if self._n_blocks_dropped == 1 or self._n_blocks_dropped % 100 == 0:
+                logger.warning(f"Stream recorder queue is full, {self._n_blocks_dropped} blocks have been dropped so far.")
+
+
+    # Writes all queued blocks and stops the writer thread.
+    def close(self):
+        self._queue.put(None)
+        self._writer_thread.join()
+
+
+    def _write_loop(self):
+        while True:
+            try:
+                block = self._queue.get(timeout=self._flush_interval_s)
+            except queue.Empty:
+                block = {}
+
+            if block is None:
+                self._flush()
+                return
+            if len(block) > 0:
+                self._pending_blocks.append(block)
+                self._n_pending_rows += len(block[RECORDING_FEATURES_KEY])
+
+            if self._n_pending_rows >= self._chunk_size or time.monotonic() - self._last_flush_time >= self._flush_interval_s:
+                self._flush()
+
+
+    def _flush(self):
+        self._last_flush_time = time.monotonic()
+        if len(self._pending_blocks) == 0:
+            return
+
+        chunk = {key: np.concatenate([block[key] for block in self._pending_blocks if key in block]) for key in self._pending_blocks[0].keys()}
+        self._pending_blocks = []
+        self._n_pending_rows = 0
+
+        chunk_path = os.path.join(self.session_path, f"{RECORDING_CHUNK_PREFIX}{self._n_chunks_written:06d}.npz")
+        tmp_path = chunk_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                np.savez(file, **chunk)
+            os.replace(tmp_path, chunk_path)
+            self._n_chunks_written += 1
+        except Exception as e:
+            logger.error(f"Stream recorder exception: failed to write {chunk_path}, {e}")
+
+
+# Returns whether the path is a session folder written by the StreamRecorder.
+def is_stream_recording(path : str) -> bool:
+    return os.path.isdir(path) and any(file_name.startswith(RECORDING_CHUNK_PREFIX) and file_name.endswith(".npz") for file_name in os.listdir(path))
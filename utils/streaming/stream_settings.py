@@ -8,6 +8,7 @@ class StreamLayout:
     sections : dict[str, StreamSection] = {}
 
 class StreamSettings:
+    source : str = "lsl"   # lsl or replay
     feature_stream_name : str
     auxiliary_stream_name : str
     stream_buffer_size_s : float = 1
@@ -23,6 +24,26 @@ class StreamSettings:
     label_feature_matching_scheme = "match-samples"
 
     auxiliary_stream_drift_ms : float = 0
+    estimate_clock_offset : bool = False
+    clock_offset_half_life_s : float = 30
+    time_correction_interval_s : float = 5
+
+    preprocessing_steps : list[dict[str, any]] = []   # step configurations, see utils/streaming/stream_preprocessing.py
+
+    replay_path : str = None
+    replay_auxiliary_path : str = None
+    replay_speed : float = 1        # 0 replays unthrottled
+    replay_chunk_size : int = 1024
+
+    recording_path : str = None     # recording is disabled when not set
+    recording_queue_size : int = 64
+    recording_chunk_size : int = 4096
+    recording_flush_interval_s : float = 5
 
     feature_stream_layout : StreamLayout
-    auxiliary_stream_layout : StreamLayout
\ No newline at end of file
+    auxiliary_stream_layout : StreamLayout
+
+    # feature streams after the first, their features are concatenated to those of the first feature stream
+    additional_feature_stream_names : list[str] = []
+    additional_feature_stream_layouts : dict[str, StreamLayout] = {}    # defaults to the feature stream layout
+    feature_alignment_tolerance_ms : float = 10
\ No newline at end of file
@@ -1,9 +1,13 @@
 from dareplane_utils.stream_watcher.lsl_stream_watcher import StreamWatcher as DpStreamWatcher
 import numpy as np
+import pylsl
 
 from utils.streaming.stream_settings import *
 from utils.streaming.stream_interpreter import StreamInterpreter, StreamInterpreterTypeEnum
 from utils.streaming.stream_matcher import StreamMatcher
+from utils.streaming.buffer_segments import BufferSegments
+from utils.streaming.stream_recorder import StreamRecorder
+from utils.streaming.stream_aligner import StreamAligner
 
 class StreamWatcher():
     _settings : StreamSettings
@@ -14,6 +18,12 @@ class StreamWatcher():
     _feature_stream_interpreter : StreamInterpreter
     auxiliary_stream_watcher : DpStreamWatcher
     _auxiliary_stream_interpreter : StreamInterpreter
+    _recorder : StreamRecorder = None
+
+    # feature streams concatenated to the primary feature stream, aligned by the stream aligner
+    additional_feature_stream_watchers : list[DpStreamWatcher] = []
+    _additional_feature_stream_interpreters : list[StreamInterpreter] = []
+    _stream_aligner : StreamAligner = None
 
 
     def __init__(self, settings : StreamSettings):
@@ -22,18 +32,32 @@ class StreamWatcher():
         self._validate_stream_settings(settings)
 
         buffer_size_s = settings.stream_buffer_size_s
-        self.feature_stream_watcher = DpStreamWatcher(settings.feature_stream_name, buffer_size_s)
+        self.feature_stream_watcher = self._create_stream_watcher(settings.feature_stream_name, buffer_size_s)
         self._feature_stream_interpreter = StreamInterpreter(settings, settings.feature_stream_layout, StreamInterpreterTypeEnum.Features)
 
+        if len(settings.additional_feature_stream_names) > 0:
+            self._stream_aligner = StreamAligner(settings.feature_alignment_tolerance_ms)
+            self.additional_feature_stream_watchers = []
+            self._additional_feature_stream_interpreters = []
+            for stream_name in settings.additional_feature_stream_names:
+                stream_layout = settings.additional_feature_stream_layouts.get(stream_name, settings.feature_stream_layout)
+                self.additional_feature_stream_watchers.append(self._create_stream_watcher(stream_name, buffer_size_s))
+                self._additional_feature_stream_interpreters.append(StreamInterpreter(settings, stream_layout, StreamInterpreterTypeEnum.AdditionalFeatures))
+
         if self._get_labels_from_auxiliary_stream:
             if settings.auxiliary_stream_name is None or settings.auxiliary_stream_name == "":
                 raise Exception(f"Stream Exception: ")
             
             self._steam_matcher = StreamMatcher(settings)
-            self.auxiliary_stream_watcher = DpStreamWatcher(settings.auxiliary_stream_name, buffer_size_s)
+            self.auxiliary_stream_watcher = self._create_stream_watcher(settings.auxiliary_stream_name, buffer_size_s, is_auxiliary=True)
             self._auxiliary_stream_interpreter = StreamInterpreter(settings, settings.auxiliary_stream_layout, StreamInterpreterTypeEnum.Auxiliary)
 
 
+    # Creates the watcher of a single stream. Overridden by stream sources other than LSL, which provide the same buffer attributes.
+    def _create_stream_watcher(self, stream_name : str, buffer_size_s : float, is_auxiliary : bool = False) -> DpStreamWatcher:
+        return DpStreamWatcher(stream_name, buffer_size_s)
+
+
     def _validate_stream_settings(self, settings : StreamSettings):
         if settings.feature_stream_name is None or settings.feature_stream_name == "":
             raise Exception("Stream Exception: the feature stream name is empty.")
@@ -61,6 +85,8 @@ class StreamWatcher():
     def connect_to_streams(self):
         try:
             self.feature_stream_watcher.connect_to_stream()
+            for stream_watcher in self.additional_feature_stream_watchers:
+                stream_watcher.connect_to_stream()
             if self._get_labels_from_auxiliary_stream:
                 self.auxiliary_stream_watcher.connect_to_stream()
 
@@ -68,16 +94,46 @@ class StreamWatcher():
         except Exception as e:
             self.feature_stream_watcher.inlet.value_type
 
+        # a recording session is opened per connection, so a projecting process restarted after close() records to a new session folder
+        if self._recorder is None and self._settings.recording_path is not None and self._settings.recording_path != "":
+            self._recorder = StreamRecorder(self._settings.recording_path, self._settings.recording_queue_size, self._settings.recording_chunk_size, self._settings.recording_flush_interval_s)
+
+
+    # Writes the blocks still queued for recording and stops the recorder. Called once the stream is no longer read.
+    def close(self):
+        if self._recorder is not None:
+            recorder = self._recorder
+            self._recorder = None
+            recorder.close()
+
 
     def read(self) -> tuple[np.ndarray, enumerate[float], enumerate[float]]:
         feature_data, feature_time_points = self._read_stream_buffer(self.feature_stream_watcher)
         if feature_data is None or len(feature_data) == 0:
             return None, None, None
         feature_data_ids, features, labels = self._feature_stream_interpreter.interpret(feature_data)
+
+        # feature_rows holds the indices of the read feature entries that are kept after the alignment, None when all are kept
+        read_feature_time_points = feature_time_points
+        n_features_available = len(feature_time_points)
+        feature_rows = None
+        additional_time_points = []
+        if self._stream_aligner is not None:
+            n_features_available, feature_rows, features, additional_time_points = self._align_feature_streams(features, feature_time_points)
+            if n_features_available == 0:
+                return None, None, None
+            feature_time_points = feature_time_points[feature_rows]
+            feature_data_ids = feature_data_ids[feature_rows] if feature_data_ids is not None else None
+            labels = np.asarray(labels)[feature_rows] if labels is not None else None
+            if len(feature_rows) == 0:
+                self._update_feature_buffer_trackers(n_features_available, read_feature_time_points, additional_time_points)
+                return None, None, None
     
         if not self._get_labels_from_auxiliary_stream:
-            self._update_buffer_trackers(self.feature_stream_watcher, n_entries_read=len(features))
-            return features, feature_time_points, labels
+            self._update_feature_buffer_trackers(n_features_available, read_feature_time_points, additional_time_points)
+            if feature_rows is None:
+                features = features.to_array()
+            return self._preprocess_and_record(features, feature_time_points, feature_data_ids, labels)
 
         auxiliary_data, auxiliary_time_points = self._read_stream_buffer(self.auxiliary_stream_watcher)
         if auxiliary_data is None or len(auxiliary_data) == 0:
@@ -87,9 +143,11 @@ class StreamWatcher():
         n_features_pre_matching = len(features)
         n_labels_pre_matching = len(labels)
 
+        self._steam_matcher.update_time_correction(self.feature_stream_watcher.inlet, self.auxiliary_stream_watcher.inlet)
+
         # match entries by id if possible, otherwise match entries by lsl time poitns
         if self._settings.match_by_entry_id:
-            matched_indeces, features, time_points, labels =  self._steam_matcher.get_shared_features_by_id(features, feature_time_points, labels, feature_data_ids, auxilaiary_data_ids)
+            matched_indeces, features, time_points, labels =  self._steam_matcher.get_shared_features_by_id(features, feature_time_points, labels, feature_data_ids, auxilaiary_data_ids, auxiliary_time_points)
         else:
             matched_indeces, features, time_points, labels =  self._steam_matcher.get_shared_features_by_time_points(features, labels, feature_time_points, auxiliary_time_points)
 
@@ -101,19 +159,92 @@ class StreamWatcher():
             n_features_read = 0
             n_labels_read = 0
         elif len(features) == n_features_pre_matching and len(labels) == n_labels_pre_matching:
-            n_features_read = n_features_pre_matching
+            n_features_read = n_features_available
             n_labels_read = n_labels_pre_matching
         else:
             # do not just use the number of shared entries to update the stream watchers, this will break when there's an entry that is present in one stream but not the other
-            n_features_read = max(matched_indeces, key=lambda x: x[0])[0] + 1
-            n_labels_read = max(matched_indeces, key=lambda x: x[1])[1] + 1
+            n_features_read = matched_indeces[:, 0].max() + 1
+            if feature_rows is not None:
+                n_features_read = feature_rows[n_features_read - 1] + 1
+            n_labels_read = matched_indeces[:, 1].max() + 1
 
-        self._update_buffer_trackers(self.feature_stream_watcher, n_features_read)
+        self._update_feature_buffer_trackers(n_features_read, read_feature_time_points, additional_time_points)
         self._update_buffer_trackers(self.auxiliary_stream_watcher, n_labels_read)
         
+        matched_feature_ids = feature_data_ids[matched_indeces[:, 0]] if feature_data_ids is not None else None
+        # preprocessing is done after matching, as the matching is on the raw samples
+        return self._preprocess_and_record(features, time_points, matched_feature_ids, labels)
+
+
+    def _preprocess_and_record(self, features : np.ndarray, time_points : np.ndarray, ids : np.ndarray | None, labels : enumerate | None) -> tuple[np.ndarray, enumerate[float], enumerate[float]]:
+        input_time_points = time_points
+        features, time_points, labels = self._feature_stream_interpreter.preprocess(features, time_points, labels)
+        if self._recorder is not None and features is not None:
+            if ids is not None and len(ids) != len(features):
+                # preprocessing keeps the time point of the sample each output row ends with, the id is taken from the same sample
+                ids = ids[np.searchsorted(input_time_points, time_points)]
+            self._recorder.record(features, time_points, ids, labels)
         return features, time_points, labels
     
 
+    # Returns the lag per stream name in seconds, i.e. the time since the newest sample in the stream buffer was sent, including samples that have not been read yet.
+    # The time stamps are compared to the local clock as sent, streams from other machines also include the offset between the clocks.
+    def get_stream_lags(self) -> dict[str, float]:
+        stream_watchers = {self._settings.feature_stream_name: self.feature_stream_watcher}
+        stream_watchers.update(zip(self._settings.additional_feature_stream_names, self.additional_feature_stream_watchers))
+        if self._get_labels_from_auxiliary_stream:
+            stream_watchers[self._settings.auxiliary_stream_name] = self.auxiliary_stream_watcher
+
+        now = self._get_stream_time()
+        stream_lags = {}
+        for stream_name, stream_watcher in stream_watchers.items():
+            if len(stream_watcher.buffer_t) == 0:
+                continue
+            newest_i = (stream_watcher.curr_i + stream_watcher.n_new - 1) % len(stream_watcher.buffer_t)
+            stream_lags[stream_name] = float(now - stream_watcher.buffer_t[newest_i])
+        return stream_lags
+
+
+    # Current time on the clock of the stream time stamps. Overridden by stream sources other than LSL.
+    def _get_stream_time(self) -> float:
+        return pylsl.local_clock()
+
+
+    # Returns the estimated offset of the auxiliary stream clock to the feature stream clock in seconds, and its drift in seconds per second.
+    def get_clock_offset(self) -> tuple[float, float] | None:
+        if not self._get_labels_from_auxiliary_stream:
+            return None
+        return self._steam_matcher.get_clock_offset(self.feature_stream_watcher.buffer_t[self.feature_stream_watcher.curr_i - 1])
+
+
+    # Reads the additional feature streams and aligns them to the read primary feature entries.
+    # Returns the number of primary entries that could be aligned, the indices of the aligned entries, their concatenated features, and the read time points of the additional streams.
+    def _align_feature_streams(self, features : BufferSegments, feature_time_points : np.ndarray) -> tuple[int, np.ndarray, np.ndarray, list[np.ndarray]]:
+        additional_features = []
+        additional_time_points = []
+        for stream_watcher, stream_interpreter in zip(self.additional_feature_stream_watchers, self._additional_feature_stream_interpreters):
+            stream_data, time_points = self._read_stream_buffer(stream_watcher)
+            if stream_data is None or len(stream_data) == 0:
+                return 0, None, None, None
+            additional_features.append(stream_interpreter.interpret(stream_data)[1])
+            additional_time_points.append(time_points)
+
+        n_alignable = self._stream_aligner.get_n_alignable(feature_time_points, additional_time_points)
+        if n_alignable == 0:
+            return 0, None, None, None
+        feature_rows, aligned_features = self._stream_aligner.align(features, feature_time_points[:n_alignable], additional_features, additional_time_points)
+        return n_alignable, feature_rows, aligned_features, additional_time_points
+
+
+    # Marks the first n entries of the feature stream as read. The additional feature streams are read up to the latest entry at or before the last read feature entry, which is kept to be held for the next feature entries.
+    def _update_feature_buffer_trackers(self, n_entries_read : int, feature_time_points : np.ndarray, additional_time_points : list[np.ndarray]):
+        self._update_buffer_trackers(self.feature_stream_watcher, n_entries_read)
+        if n_entries_read == 0:
+            return
+        for stream_watcher, time_points in zip(self.additional_feature_stream_watchers, additional_time_points):
+            self._update_buffer_trackers(stream_watcher, self._stream_aligner.get_n_consumed(time_points, feature_time_points[n_entries_read - 1]))
+
+
     def _update_buffer_trackers(self, stream_watcher : DpStreamWatcher, n_entries_read : int):
         n_new = stream_watcher.n_new
         curr_i = stream_watcher.curr_i
@@ -121,32 +252,22 @@ class StreamWatcher():
         updated_n_new = n_new - n_entries_read
         if updated_n_new < 0:
             updated_n_new = 0
-        updated_curr_i = (curr_i + n_entries_read) % self._buffer_size
+        updated_curr_i = (curr_i + n_entries_read) % len(stream_watcher.buffer)
 
         stream_watcher.n_new = updated_n_new
         stream_watcher.curr_i = updated_curr_i
 
 
-    def _read_stream_buffer(self, stream_watcher : DpStreamWatcher) -> tuple[np.ndarray, float]:
+    # Returns the unread entries as segments of the ring buffer, the data is not copied. The time points are returned as a single array.
+    def _read_stream_buffer(self, stream_watcher : DpStreamWatcher) -> tuple[BufferSegments, np.ndarray]:
         stream_watcher.update()
 
-        buffer = stream_watcher.buffer
-        buffer_t = stream_watcher.buffer_t
-
         start_read = stream_watcher.curr_i
         n_to_read = stream_watcher.n_new
-        end_read = start_read + n_to_read
 
         if n_to_read == 0:
             return None, None
 
-        if end_read < self._buffer_size:
-            data = buffer[start_read:end_read]
-            time_points = buffer_t[start_read:end_read]
-        else:
-            data = [buffer[start_read:], buffer[:(end_read % self._buffer_size)]]
-            time_points = [buffer_t[start_read:], buffer_t[:(end_read % self._buffer_size)]]
-            data = np.concatenate((data[0], data[1]), axis=0)
-            time_points = np.concatenate((time_points[0], time_points[1]), axis=0)
-
+        data = BufferSegments.from_ring_buffer(stream_watcher.buffer, start_read, n_to_read)
+        time_points = BufferSegments.from_ring_buffer(stream_watcher.buffer_t, start_read, n_to_read).to_array()
         return data, time_points
@@ -0,0 +1,16 @@
+from utils.streaming.stream_settings import *
+from utils.streaming.stream_watcher import StreamWatcher
+from utils.streaming.replay_stream_watcher import ReplayStreamWatcher
+
+STREAM_SOURCE_LSL = "lsl"
+STREAM_SOURCE_REPLAY = "replay"
+STREAM_SOURCES = [STREAM_SOURCE_LSL, STREAM_SOURCE_REPLAY]
+
+
+# Creates the stream watcher matching the configured stream source. Registered as the StreamWatcher proxy class by the process manager.
+def create_stream_watcher(settings : StreamSettings) -> StreamWatcher:
+    match settings.source:
+        case "lsl": return StreamWatcher(settings)
+        case "replay": return ReplayStreamWatcher(settings)
+        case _:
+            raise Exception(f"Stream Exception: unknown stream source '{settings.source}'. Supported sources: {STREAM_SOURCES}")